@@ -0,0 +1,183 @@
+"""
+Approximate nearest-neighbour search (IVF) in numpy.
+
+An inverted-file index partitions normalized vectors with a spherical k-means
+coarse quantizer. A query scores the centroids, visits only the nprobe closest
+lists and runs an exact dot product against those candidates, so cost grows
+with nprobe / nlist of the corpus instead of the whole corpus.
+
+Recall/latency knobs:
+- nlist: number of lists (default ~4 * sqrt(n))
+- nprobe: lists visited per query (higher = better recall, slower)
+"""
+
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ASSIGN_BLOCK_ROWS = 8192
+
+
+def default_nlist(count):
+    return int(max(1, min(count // 8 or 1, round(4 * math.sqrt(max(count, 1))))))
+
+
+def assign_to_centroids(vectors, centroids, block_rows=ASSIGN_BLOCK_ROWS):
+    """Nearest centroid (max dot product) for every row, computed in row blocks."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors, k, iterations=15, sample_size=None, seed=42):
+    """
+    Spherical k-means (Lloyd iterations on the unit sphere) over a random sample.
+
+    Returns a (k, d) float32 array of unit-length centroids.
+    """
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    k = max(1, min(k, count))
+    sample_size = min(count, sample_size or max(64 * k, 4096))
+    sample_rows = np.sort(rng.choice(count, size=sample_size, replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(len(sample), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=k)
+
+        # Re-seed empty clusters with random sample points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        new_centroids = sums / np.maximum(norms, 1e-12)
+        shift = float(np.max(1.0 - np.sum(new_centroids * centroids, axis=1)))
+        centroids = new_centroids.astype(np.float32)
+        if shift < 1e-5:
+            break
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over an external matrix of normalized vectors.
+
+    The index only stores centroids and one list assignment per row; the
+    vectors themselves stay in the caller's matrix (e.g. a memory map), so
+    rows can be added, moved or dropped with add/move/truncate.
+    """
+
+    def __init__(self, centroids, assignments, nprobe=8):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.assignments = np.asarray(assignments, dtype=np.int32)
+        self.nprobe = nprobe
+        self._order = None
+        self._offsets = None
+
+    @classmethod
+    def build(cls, vectors, nlist=None, nprobe=8, iterations=15, seed=42):
+        nlist = nlist or default_nlist(len(vectors))
+        centroids = train_centroids(vectors, nlist, iterations=iterations, seed=seed)
+        assignments = assign_to_centroids(vectors, centroids)
+        logger.info(f"Built IVF index: {len(vectors)} vectors, {len(centroids)} lists")
+        return cls(centroids, assignments, nprobe=nprobe)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def add(self, rows, vectors):
+        """Assign (new or overwritten) rows to their nearest list."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        needed = int(rows.max()) + 1
+        if needed > len(self.assignments):
+            grown = np.zeros(needed, dtype=np.int32)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        self.assignments[rows] = assign_to_centroids(vectors, self.centroids)
+        self._order = None
+
+    def move(self, source, target):
+        """Mirror a row move in the vector matrix (used by swap-with-last deletes)."""
+        self.assignments[target] = self.assignments[source]
+        self._order = None
+
+    def truncate(self, count):
+        self.assignments = self.assignments[:count]
+        self._order = None
+
+    def search(self, vectors, queries, top_k, nprobe=None, mask=None):
+        """
+        Approximate top-k for each query row.
+
+        vectors is the full matrix the index was built over; mask (optional)
+        is a boolean array of rows allowed in the results. Returns a list of
+        (rows, scores) array pairs, best first.
+        """
+        self._ensure_lists()
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = max(1, min(nprobe or self.nprobe, self.nlist))
+
+        centroid_scores = queries @ self.centroids.T
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.tile(np.arange(self.nlist), (len(queries), 1))
+
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate([
+                self._order[self._offsets[l]:self._offsets[l + 1]] for l in lists
+            ])
+            if mask is not None:
+                candidates = candidates[mask[candidates]]
+            if len(candidates) == 0:
+                results.append((np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)))
+                continue
+
+            scores = np.asarray(vectors[candidates], dtype=np.float32) @ query
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            results.append((candidates[best], scores[best]))
+        return results
+
+    def save(self, path):
+        np.savez(path, centroids=self.centroids, assignments=self.assignments, nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['assignments'], nprobe=int(data['nprobe']))
+
+    def info(self):
+        self._ensure_lists()
+        sizes = np.diff(self._offsets)
+        return {
+            'type': 'ivf',
+            'nlist': self.nlist,
+            'nprobe': self.nprobe,
+            'vectors': int(len(self.assignments)),
+            'largest_list': int(sizes.max()) if len(sizes) else 0,
+            'empty_lists': int(np.sum(sizes == 0))
+        }
+
+    def _ensure_lists(self):
+        # Inverted lists are rebuilt lazily after add/move/truncate (one argsort)
+        if self._order is not None:
+            return
+        self._order = np.argsort(self.assignments, kind='stable').astype(np.int64)
+        counts = np.bincount(self.assignments, minlength=self.nlist)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
@@ -4,13 +4,40 @@ This is a complete Flask server that receives text chunks and returns embeddings
 with support for batch processing, similarity search, and model management.
 """
 
-from flask import Flask, request, jsonify
+import time
+
+# Reference point for the startup timings reported by /health/ready
+_import_started = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 import os
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from functools import lru_cache
+import json
 import logging
+import threading
+import uuid
+import copy
+import hashlib
+import re
+
+from batch_planner import BatchPlanner, current_rss_mb
+from batch_scheduler import MicroBatchScheduler
+from chroma_writer import ChromaWriteError, ChromaWriter, chunk_metadatas, iso_now
+from clustering import candidate_ks, choose_k, spherical_kmeans
+from dedup import NEAR_DUPLICATE_THRESHOLD, ChunkDeduplicator, FingerprintRegistry, chunks_fingerprint, find_duplicates
+from embedding_cache import EmbeddingCache
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry
+from job_queue import JobQueue, JobWorkerPool
+from lexical_index import reciprocal_rank_fusion
+from migration import MigrationJob, MigrationRunningError, read_status
+from model_registry import ModelNotAllowedError, ModelRegistry
+from pdf_ingest import CHUNK_OVERLAP, CHUNK_SIZE, ChunkStream, PdfIngestError, extract_pages, open_pdf
+import request_timing
+from token_chunker import IncrementalTokenChunker, TokenChunker
+from topk import normalize_rows, top_k_search
+from vector_store import CollectionError, VectorStore
+from wire_format import WireFormatError, decode_array, embeddings_response, negotiate, pack_array, read_request_data
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,19 +49,569 @@ CORS(app)  # Enable CORS for cross-origin requests
 # Load the embedding model (you can use different models)
 # Popular options: 'all-MiniLM-L6-v2', 'all-mpnet-base-v2', 'multi-qa-MiniLM-L6-cos-v1'
 MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
-model = None
+# Inference backend: 'torch' (SentenceTransformer), 'onnx' or 'onnx-int8' (onnxruntime on CPU)
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch').lower()
+EMBEDDING_BACKENDS = ('torch', 'onnx', 'onnx-int8')
+
+if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+    raise ValueError(f"Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}'. Use one of: {', '.join(EMBEDDING_BACKENDS)}")
+
+AVAILABLE_MODELS = [
+    {
+        'name': 'all-MiniLM-L6-v2',
+        'dimensions': 384,
+        'description': 'Fast and good quality (default)'
+    },
+    {
+        'name': 'all-mpnet-base-v2',
+        'dimensions': 768,
+        'description': 'Better quality, slower'
+    },
+    {
+        'name': 'multi-qa-MiniLM-L6-cos-v1',
+        'dimensions': 384,
+        'description': 'Optimized for Q&A tasks'
+    },
+    {
+        'name': 'paraphrase-multilingual-MiniLM-L12-v2',
+        'dimensions': 384,
+        'description': 'Multilingual support'
+    }
+]
+
+
+def _load_model(name):
+    """Load one model with the configured backend (called by the registry)."""
+    logger.info(f"Loading model: {name} (backend: {EMBEDDING_BACKEND})")
+    if EMBEDDING_BACKEND == 'torch':
+        # Imported here: torch and transformers take seconds to import, and
+        # /health/live must answer before they are loaded.
+        from sentence_transformers import SentenceTransformer
+        loaded = SentenceTransformer(name)
+    else:
+        from onnx_backend import OnnxSentenceEncoder
+        loaded = OnnxSentenceEncoder(
+            name,
+            quantize=EMBEDDING_BACKEND == 'onnx-int8',
+            num_threads=int(os.getenv('ONNX_NUM_THREADS')) if os.getenv('ONNX_NUM_THREADS') else None
+        )
+    logger.info(f"Model loaded successfully. Embedding dimension: {loaded.get_sentence_embedding_dimension()}")
+    return loaded
+
+
+# Models are loaded by name on first request; least recently used ones are
+# unloaded when their weights exceed MODEL_MEMORY_BUDGET_MB.
+model_registry = ModelRegistry(
+    _load_model,
+    default_model=MODEL_NAME,
+    allowed_models=[m.strip() for m in os.getenv('EMBEDDING_MODELS', '').split(',') if m.strip()]
+        or [entry['name'] for entry in AVAILABLE_MODELS],
+    memory_budget_mb=float(os.getenv('MODEL_MEMORY_BUDGET_MB', 2048)) or None
+)
+
 
-def get_model():
+def get_model(name=None):
     """Lazy load the model to improve startup time"""
-    global model
-    if model is None:
-        logger.info(f"Loading model: {MODEL_NAME}")
-        model = SentenceTransformer(MODEL_NAME)
-        logger.info(f"Model loaded successfully. Embedding dimension: {model.get_sentence_embedding_dimension()}")
-    return model
+    return model_registry.get(name)
+
+
+def cache_model_id(name):
+    """Cache entries are keyed per backend: quantized vectors differ slightly from fp32 ones."""
+    return name if EMBEDDING_BACKEND == 'torch' else f'{name}@{EMBEDDING_BACKEND}'
+
+
+# How the default model is loaded at startup:
+#   background - on a thread; /health/live answers at once, /health/ready after warm-up (default)
+#   eager      - during import, before the server accepts connections (gunicorn preload sets this)
+#   lazy       - on the first request that needs it; ready immediately
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', 'background').lower()
+WARMUP_TEXTS = ['Warm-up sentence for the embedding model.', 'A second, somewhat longer warm-up sentence so the batch has padding.']
+
+_startup = {
+    'state': 'loading',
+    'error': None,
+    'load_seconds': None,
+    'warmup_seconds': None,
+    'ready_after_seconds': None
+}
+
+
+def warm_up():
+    """
+    Load the default model and run one encode through the batch planner, so
+    the first real request does not pay for lazy initialisation (thread pools,
+    kernel selection, tokenizer caches). Bypasses the scheduler and the cache.
+    """
+    try:
+        started = time.perf_counter()
+        get_model()
+        loaded_at = time.perf_counter()
+        planner, _ = get_pipeline(model_registry.default_model)
+        with model_registry.use() as loaded:
+            planner.encode(loaded, WARMUP_TEXTS)
+        finished = time.perf_counter()
+        _startup.update({
+            'load_seconds': round(loaded_at - started, 3),
+            'warmup_seconds': round(finished - loaded_at, 3),
+            'ready_after_seconds': round(finished - _import_started, 3),
+            'state': 'ready'
+        })
+        logger.info(f"Ready {_startup['ready_after_seconds']}s after import (model load {_startup['load_seconds']}s, warm-up {_startup['warmup_seconds']}s)")
+    except Exception as e:
+        logger.error(f"Error loading model at startup: {str(e)}")
+        _startup.update({'state': 'failed', 'error': str(e)})
+
+
+def is_ready():
+    return _startup['state'] == 'ready'
+
+# Content-addressed embedding cache (set EMBEDDING_CACHE_SIZE=0 to disable the memory tier)
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv('EMBEDDING_CACHE_SIZE', 50000)),
+    disk_path=os.getenv('EMBEDDING_CACHE_PATH') or None
+)
+
+STREAM_BATCH_SIZE = 256
+
+# Upper bound on num_clusters for /cluster-content
+MAX_CLUSTERS = int(os.getenv('MAX_CLUSTERS', 200))
+
+# Named, persistent vector collections served by /index/<name>/...
+vector_store = VectorStore(os.getenv('VECTOR_INDEX_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indexes')))
+
+# Direct writes into Chroma (/chroma/add, /ingest with chroma=true): CHROMA_PATH opens
+# the store in-process; without it the Chroma server at CHROMA_DB_URL is used
+CHROMA_PATH = os.getenv('CHROMA_PATH') or None
+CHROMA_DB_URL = os.getenv('CHROMA_DB_URL', 'http://localhost:8000')
+CHROMA_COLLECTION_NAME = os.getenv('CHROMA_COLLECTION_NAME', 'curriculum_documents')
+# Also store direct Chroma writes in the /index collection of the same name, so
+# lexical and hybrid search (and the search fallback) can be served from here
+CHROMA_MIRROR = os.getenv('CHROMA_MIRROR', 'True').lower() == 'true'
+_chroma_writers = {}
+_chroma_writers_lock = threading.Lock()
+
+
+def get_chroma_writer(collection_name=None):
+    """Return the (cached) ChromaWriter for a collection, default CHROMA_COLLECTION_NAME."""
+    collection_name = collection_name or CHROMA_COLLECTION_NAME
+    with _chroma_writers_lock:
+        writer = _chroma_writers.get(collection_name)
+        if writer is None:
+            writer = _chroma_writers[collection_name] = ChromaWriter(
+                collection_name, path=CHROMA_PATH, url=None if CHROMA_PATH else CHROMA_DB_URL
+            )
+        return writer
+
+
+def write_chroma_document(writer, chunks, embeddings, document_id, file_name, uploaded_at, model_name):
+    """
+    Write a document's chunks into Chroma and, with CHROMA_MIRROR, into the
+    /index collection of the same name. Returns the chunk ids.
+    """
+    ids = writer.add_document(chunks, embeddings, document_id, file_name, uploaded_at)
+    if CHROMA_MIRROR:
+        # Chroma already holds the chunks, so a failing mirror is logged rather than raised
+        try:
+            mirror = vector_store.get(writer.collection_name, create=True)
+            mirror.upsert(
+                ids, embeddings, chunks, chunk_metadatas(chunks, document_id, file_name, uploaded_at), model=model_name
+            )
+        except Exception as e:
+            logger.warning(f"Could not mirror {document_id} into index '{writer.collection_name}': {str(e)}")
+    return ids
+
+
+def chroma_mirror(collection_name):
+    """The CHROMA_MIRROR index of a Chroma collection, or None without mirroring."""
+    if not CHROMA_MIRROR:
+        return None
+    try:
+        return vector_store.get(collection_name, create=True)
+    except CollectionError:
+        # Chroma allows names the index does not (e.g. with dots); write_chroma_document logs those
+        return None
+
+
+def _document_vectors(collection, document_id, num_chunks, model_name):
+    """
+    Copy of the vectors of a stored document's chunks in chunkIndex order,
+    or None unless all num_chunks of them are still there, built with model_name.
+    """
+    with collection.reading():
+        if collection.model != model_name:
+            return None
+        rows = {}
+        for row in np.flatnonzero(collection.mask({'documentId': document_id})).tolist():
+            rows[collection.metadatas[row].get('chunkIndex')] = row
+        if len(rows) != num_chunks or any(index not in rows for index in range(num_chunks)):
+            return None
+        return np.array(collection.vectors[[rows[index] for index in range(num_chunks)]])
+
+
+def _chunk_list_reuse(collection, document_id, chunks, model_name):
+    """
+    Fingerprint check for a document the client chunked (/chroma/add, and
+    /embed/batch with index and document_id). Returns {registry, key,
+    document_id, reused_from, vectors}: vectors copies the stored document
+    reused_from if its chunks are the same, else None. Register key once the
+    document is stored.
+    """
+    registry = FingerprintRegistry(os.path.join(collection.path, 'fingerprints.json'))
+    key = registry.key(chunks_fingerprint(chunks), ('chunks',))
+    reuse = {'registry': registry, 'key': key, 'document_id': document_id, 'reused_from': None, 'vectors': None}
+    entry = registry.lookup(key)
+    if entry and entry['document_id'] != document_id:
+        reuse['vectors'] = _document_vectors(collection, entry['document_id'], len(chunks), model_name)
+        if reuse['vectors'] is not None:
+            reuse['reused_from'] = entry['document_id']
+    return reuse
+
+
+# Share of the time a re-embedding migration may keep the encoder busy
+MIGRATION_CPU_SHARE = float(os.getenv('MIGRATION_CPU_SHARE', 0.5))
+# Running migrations of this process, by index name
+_migrations = {}
+_migrations_lock = threading.Lock()
+
+# One batch planner and scheduler per model: token budgets depend on model size,
+# and a batch can only go through one model.
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+
+def get_pipeline(name):
+    """Return the (batch_planner, encode_scheduler) pair for a model, creating it on first use."""
+    with _pipelines_lock:
+        pipeline = _pipelines.get(name)
+        if pipeline is None:
+            # Length-bucketed batches under a padded-token budget, tuned from measured throughput
+            planner = BatchPlanner(
+                max_tokens_per_batch=int(os.getenv('BATCH_TOKEN_BUDGET', 16384)),
+                autotune=os.getenv('BATCH_AUTOTUNE', 'True').lower() == 'true',
+                rss_limit_mb=float(os.getenv('BATCH_RSS_LIMIT_MB')) if os.getenv('BATCH_RSS_LIMIT_MB') else None,
+                on_batch=lambda lengths, seconds: _record_encode_batch(name, lengths, seconds)
+            )
+
+            def encode_with_model(texts, normalize, timings=None):
+                """Encode texts coalesced by the scheduler, batched by token length."""
+                with model_registry.use(name) as loaded:
+                    return planner.encode(loaded, texts, normalize=normalize, timings=timings)
+
+            # Every endpoint sends its cache misses through this scheduler so concurrent
+            # requests share forward passes instead of each running a tiny batch.
+            scheduler = MicroBatchScheduler(
+                encode_with_model,
+                max_batch_size=int(os.getenv('SCHEDULER_MAX_BATCH_SIZE', 64)),
+                max_wait_ms=float(os.getenv('SCHEDULER_MAX_WAIT_MS', 5))
+            )
+            pipeline = _pipelines[name] = (planner, scheduler)
+        return pipeline
+
 
-# Initialize model at startup
-get_model()
+# Token overlap between consecutive chunks from /chunk and /ingest (chunking=tokens)
+CHUNK_OVERLAP_TOKENS = 32
+
+# One tokenizer copy per model for chunking: a fast tokenizer cannot be used
+# from two threads at once, and the encoder thread uses the model's own.
+_chunk_tokenizers = {}
+_chunk_tokenizers_lock = threading.Lock()
+
+
+def get_token_chunker(name, max_tokens=None, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Return a TokenChunker for a model's tokenizer. max_tokens defaults to,
+    and is capped at, the model's max_seq_length so no chunk is truncated.
+    """
+    with model_registry.use(name) as loaded:
+        tokenizer = getattr(loaded, 'tokenizer', None)
+        max_seq_length = getattr(loaded, 'max_seq_length', None) or 512
+    if tokenizer is None or not getattr(tokenizer, 'is_fast', False):
+        raise RuntimeError(f"Model '{name}' does not expose a fast tokenizer for chunking")
+
+    with _chunk_tokenizers_lock:
+        if name not in _chunk_tokenizers:
+            chunk_tokenizer = copy.deepcopy(tokenizer)
+            # Whole documents are tokenized to find boundaries, not fed to the model
+            chunk_tokenizer.model_max_length = int(1e30)
+            _chunk_tokenizers[name] = (chunk_tokenizer, threading.Lock())
+        chunk_tokenizer, lock = _chunk_tokenizers[name]
+
+    if max_tokens is None:
+        max_tokens = max_seq_length
+    elif max_tokens > max_seq_length:
+        raise ValueError(f"max_tokens must be at most the model's max_seq_length ({max_seq_length})")
+    return TokenChunker(chunk_tokenizer, max_tokens, overlap_tokens, lock=lock)
+
+
+# Prometheus metrics served by /metrics. Workers sharing METRICS_DIR (gunicorn.conf.py
+# sets one) each write their numbers there and a scrape merges them.
+metrics = MetricsRegistry(os.getenv('METRICS_DIR') or None)
+REQUESTS_TOTAL = metrics.counter(
+    'embedding_api_requests_total', 'HTTP requests by route, method and status code', ('route', 'method', 'status')
+)
+REQUEST_SECONDS = metrics.histogram(
+    'embedding_api_request_duration_seconds', 'Time to build the HTTP response', ('route', 'method')
+)
+ENCODE_BATCH_SECONDS = metrics.histogram(
+    'embedding_encode_batch_duration_seconds', 'Forward pass time per planned batch', ('model',)
+)
+ENCODE_BATCH_SIZE = metrics.histogram(
+    'embedding_encode_batch_size', 'Texts per forward batch', ('model',),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+SEQUENCE_LENGTH = metrics.histogram(
+    'embedding_sequence_length_tokens', 'Token length of encoded texts', ('model',),
+    buckets=(8, 16, 32, 64, 128, 256, 384, 512)
+)
+ENCODED_TEXTS = metrics.counter('embedding_encoded_texts_total', 'Texts run through the model', ('model',))
+ENCODED_TOKENS = metrics.counter('embedding_encoded_tokens_total', 'Real (unpadded) tokens run through the model', ('model',))
+PADDED_TOKENS = metrics.counter('embedding_padded_tokens_total', 'Tokens including batch padding', ('model',))
+DEDUP_SKIPPED = metrics.counter(
+    'embedding_dedup_skipped_total', 'Texts not encoded because they duplicate a stored document or an earlier text', ('kind',)
+)
+metrics.counter(
+    'embedding_cache_hits_total', 'Embedding cache hits by tier', ('tier',),
+    callback=lambda: {('memory',): embedding_cache.memory_hits, ('disk',): embedding_cache.disk_hits}
+)
+metrics.counter('embedding_cache_misses_total', 'Embedding cache misses', callback=lambda: embedding_cache.misses)
+metrics.gauge(
+    'embedding_scheduler_queue_depth', 'Requests waiting for the micro-batching scheduler', ('model',),
+    callback=lambda: {(name,): scheduler.queue_depth() for name, (_, scheduler) in list(_pipelines.items())}
+)
+metrics.counter('embedding_model_loads_total', 'Models loaded', callback=lambda: model_registry.loads)
+metrics.counter('embedding_model_load_seconds_total', 'Time spent loading models', callback=lambda: model_registry.load_seconds)
+metrics.counter('embedding_model_evictions_total', 'Models unloaded by the memory budget', callback=lambda: model_registry.evictions)
+metrics.gauge('embedding_api_ready', '1 once the default model is loaded and warmed up', callback=lambda: int(is_ready()))
+metrics.gauge('embedding_models_loaded', 'Models currently loaded', callback=lambda: len(model_registry.loaded_models()))
+metrics.gauge(
+    'process_resident_memory_bytes', 'Resident memory of this worker process',
+    callback=lambda: int((current_rss_mb() or 0) * 1024 * 1024)
+)
+
+
+def _record_encode_batch(model_name, lengths, seconds):
+    ENCODE_BATCH_SECONDS.observe(seconds, model=model_name)
+    ENCODE_BATCH_SIZE.observe(len(lengths), model=model_name)
+    SEQUENCE_LENGTH.observe_many(lengths, model=model_name)
+    ENCODED_TEXTS.inc(len(lengths), model=model_name)
+    ENCODED_TOKENS.inc(int(lengths.sum()), model=model_name)
+    PADDED_TOKENS.inc(int(len(lengths) * lengths.max()), model=model_name)
+
+
+# Opt-in per-request cProfile (?profile=1 or X-Profile: 1); reports are kept in PROFILE_DIR
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    g.timings = request_timing.RequestTimings()
+    if PROFILING_ENABLED and (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'):
+        g.profiler = request_timing.start_profile()
+
+
+@app.after_request
+def _record_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Route templates (not raw paths) keep label cardinality bounded
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+        REQUESTS_TOTAL.inc(route=route, method=request.method, status=response.status_code)
+    timings = g.get('timings')
+    if timings is not None:
+        response.headers['Server-Timing'] = timings.header()
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profile_id = request_timing.save_profile(profiler, PROFILE_DIR, f'{request.method} {request.full_path}')
+        response.headers['X-Profile-Id'] = profile_id
+        response.headers['X-Profile-Report'] = f'/profiles/{profile_id}'
+    return response
+
+
+def encode_texts(texts, normalize=True, model_name=None):
+    """
+    Encode a list of texts, serving repeated texts from the embedding cache.
+    Only cache misses (deduplicated within the request) reach the model, via
+    the micro-batching scheduler. model_name defaults to the current default model.
+
+    Returns (embeddings, cache_info) where embeddings is a float32 array with
+    one row per input text, in input order.
+    """
+    model_name = model_registry.resolve(model_name)
+    timings = request_timing.current()
+    with request_timing.phase('cache'):
+        keys = [EmbeddingCache.make_key(cache_model_id(model_name), normalize, text) for text in texts]
+        vectors = embedding_cache.get_many(keys)
+
+    missing = {}
+    for position, (key, vector) in enumerate(zip(keys, vectors)):
+        if vector is None:
+            missing.setdefault(key, []).append(position)
+
+    if missing:
+        miss_texts = [texts[positions[0]] for positions in missing.values()]
+        planner, scheduler = get_pipeline(model_name)
+        encode_timings = {} if timings is not None else None
+        if timings is not None and g.get('profiler') is not None:
+            # Profiled requests encode on their own thread so the profile includes the forward pass
+            with model_registry.use(model_name) as loaded:
+                new_embeddings = planner.encode(loaded, miss_texts, normalize=normalize, timings=encode_timings)
+        else:
+            new_embeddings = scheduler.submit(miss_texts, normalize=normalize, timings=encode_timings)
+        if timings is not None:
+            timings.merge(encode_timings)
+        with request_timing.phase('cache'):
+            embedding_cache.put_many(list(missing.keys()), new_embeddings)
+        for row, positions in zip(new_embeddings, missing.values()):
+            for position in positions:
+                vectors[position] = row
+
+    embeddings = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    cache_info = {
+        'hits': len(texts) - sum(len(positions) for positions in missing.values()),
+        'misses': len(missing)
+    }
+    return embeddings, cache_info
+
+
+def encode_unique(texts, roots, offset, stored, normalize=True, model_name=None, keep=None):
+    """
+    Encode a batch in which some texts duplicate earlier ones. texts[i] sits
+    at overall position offset + i and uses the vector of position roots[i];
+    only texts with roots[i] == offset + i reach encode_texts. Vectors that
+    later batches may point at are kept in stored (position -> vector): all
+    encoded ones, or only the positions in keep.
+
+    Returns (embeddings, cache_info) with one row per text.
+    """
+    own = [i for i, root in enumerate(roots) if root == offset + i]
+    vectors = {}
+    cache_info = {'hits': 0, 'misses': 0}
+    if own:
+        encoded, cache_info = encode_texts([texts[i] for i in own], normalize=normalize, model_name=model_name)
+        for i, vector in zip(own, encoded):
+            vectors[offset + i] = vector
+            if keep is None or offset + i in keep:
+                stored[offset + i] = vector
+    rows = [vectors[root] if root in vectors else stored[root] for root in roots]
+    return np.vstack(rows), cache_info
+
+
+def _validate_texts(texts):
+    """Return an error message for a texts value that is not a non-empty list of strings, or None."""
+    if not isinstance(texts, list) or len(texts) == 0:
+        return 'texts must be a non-empty list'
+    # Validate all texts are strings
+    with request_timing.phase('validate'):
+        all_strings = all(isinstance(t, str) for t in texts)
+    if not all_strings:
+        return 'All items in texts must be strings'
+    return None
+
+
+def _parse_embed_request(data):
+    """
+    (params, None) for a valid /embed body, or (None, error message). params
+    holds texts, normalize, model_name and the negotiated fmt and dtype.
+    """
+    if not data or 'texts' not in data:
+        return None, 'Missing texts in request body'
+    model_name = model_registry.resolve(data.get('model'))
+    error = _validate_texts(data['texts'])
+    if error:
+        return None, error
+    fmt, dtype = negotiate(data)
+    return {
+        'texts': data['texts'],
+        'normalize': data.get('normalize', True),
+        'model_name': model_name,
+        'fmt': fmt,
+        'dtype': dtype
+    }, None
+
+
+def _embed_result(params, embeddings, cache_info):
+    """The /embed response."""
+    return embeddings_response('embeddings', embeddings, {
+        'model': params['model_name'],
+        'num_texts': len(params['texts']),
+        'embedding_dimension': int(embeddings.shape[1]),
+        'normalized': params['normalize'],
+        'cache': cache_info
+    }, params['fmt'], params['dtype'])
+
+
+def _parse_single_request(data):
+    """(params, None) for a valid /embed/single body, or (None, error message); texts is [text]."""
+    if not data or 'text' not in data:
+        return None, 'Missing text in request body'
+    text = data['text']
+    model_name = model_registry.resolve(data.get('model'))
+    if not isinstance(text, str) or len(text.strip()) == 0:
+        return None, 'text must be a non-empty string'
+    fmt, dtype = negotiate(data)
+    return {
+        'texts': [text],
+        'normalize': data.get('normalize', True),
+        'model_name': model_name,
+        'fmt': fmt,
+        'dtype': dtype
+    }, None
+
+
+def _single_result(params, embeddings, cache_info):
+    """The /embed/single response."""
+    return embeddings_response('embedding', embeddings[0], {
+        'model': params['model_name'],
+        'embedding_dimension': int(embeddings.shape[1]),
+        'normalized': params['normalize'],
+        'cache': cache_info
+    }, params['fmt'], params['dtype'])
+
+
+def _parse_batch_request(data):
+    """
+    (params, None) for a valid /embed/batch body, or (None, error message).
+    Besides the /embed params it holds stream, batch_size, dedup and
+    dedup_threshold; streams negotiate only json or base64. "index" is
+    checked separately by _batch_index.
+    """
+    if not data or 'texts' not in data:
+        return None, 'Missing texts in request body'
+    texts = data['texts']
+    stream = data.get('stream', request.accept_mimetypes.best == 'application/x-ndjson')
+    default_batch_size = STREAM_BATCH_SIZE if stream or not isinstance(texts, list) else max(len(texts), 1)
+    batch_size = data.get('batch_size', default_batch_size)
+    model_name = model_registry.resolve(data.get('model'))
+    
+    error = _validate_texts(texts)
+    if error:
+        return None, error
+    if not isinstance(batch_size, int) or batch_size < 1:
+        return None, 'batch_size must be a positive integer'
+    dedup_threshold = data.get('dedup_threshold', NEAR_DUPLICATE_THRESHOLD)
+    if not isinstance(dedup_threshold, (int, float)) or not 0 < dedup_threshold <= 1:
+        return None, 'dedup_threshold must be a number in (0, 1]'
+    
+    if stream:
+        fmt, dtype = negotiate({'encoding': data.get('encoding', 'json'), 'dtype': data.get('dtype')})
+        if fmt not in ('json', 'base64'):
+            return None, 'Streaming supports only json and base64 encodings'
+    else:
+        fmt, dtype = negotiate(data)
+    return {
+        'texts': texts,
+        'normalize': data.get('normalize', True),
+        'model_name': model_name,
+        'fmt': fmt,
+        'dtype': dtype,
+        'stream': stream,
+        'batch_size': batch_size,
+        'dedup': data.get('dedup', False),
+        'dedup_threshold': float(dedup_threshold)
+    }, None
 
 
 @app.route('/embed', methods=['POST'])
@@ -45,7 +622,10 @@ def generate_embeddings():
     Request body:
     {
         "texts": ["text1", "text2", ...],
-        "normalize": true/false (optional, default: true)
+        "normalize": true/false (optional, default: true),
+        "model": "model name" (optional, default: the server's default model),
+        "encoding": "json" | "base64" | "binary" | "msgpack" (optional),
+        "dtype": "float32" | "float16" | "int8" | "binary" (optional, packed encodings only)
     }
     
     Response:
@@ -55,48 +635,28 @@ def generate_embeddings():
         "num_texts": n,
         "embedding_dimension": d
     }
+    
+    With a packed encoding (or Accept: application/octet-stream / application/msgpack)
+    "embeddings" is {"data": ..., "dtype": ..., "shape": [n, d]} or a raw body.
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'texts' not in data:
-            return jsonify({
-                'error': 'Missing texts in request body'
-            }), 400
-        
-        texts = data['texts']
-        normalize = data.get('normalize', True)
-        
-        if not isinstance(texts, list) or len(texts) == 0:
-            return jsonify({
-                'error': 'texts must be a non-empty list'
-            }), 400
-        
-        # Validate all texts are strings
-        if not all(isinstance(t, str) for t in texts):
+        params, error = _parse_embed_request(read_request_data())
+        if error:
             return jsonify({
-                'error': 'All items in texts must be strings'
+                'error': error
             }), 400
         
-        # Generate embeddings
-        current_model = get_model()
-        embeddings = current_model.encode(
-            texts, 
-            normalize_embeddings=normalize,
-            show_progress_bar=False
+        # Generate embeddings (cache misses only)
+        embeddings, cache_info = encode_texts(
+            params['texts'], normalize=params['normalize'], model_name=params['model_name']
         )
         
-        # Convert numpy arrays to lists for JSON serialization
-        embeddings_list = embeddings.tolist()
+        return _embed_result(params, embeddings, cache_info)
         
+    except (WireFormatError, ModelNotAllowedError) as e:
         return jsonify({
-            'embeddings': embeddings_list,
-            'model': MODEL_NAME,
-            'num_texts': len(texts),
-            'embedding_dimension': len(embeddings_list[0]) if embeddings_list else 0,
-            'normalized': normalize
-        })
-        
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error generating embeddings: {str(e)}")
         return jsonify({
@@ -112,7 +672,10 @@ def generate_single_embedding():
     Request body:
     {
         "text": "your text here",
-        "normalize": true/false (optional, default: true)
+        "normalize": true/false (optional, default: true),
+        "model": "model name" (optional, default: the server's default model),
+        "encoding": "json" | "base64" | "binary" | "msgpack" (optional),
+        "dtype": "float32" | "float16" | "int8" | "binary" (optional, packed encodings only)
     }
     
     Response:
@@ -123,39 +686,23 @@ def generate_single_embedding():
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'text' not in data:
-            return jsonify({
-                'error': 'Missing text in request body'
-            }), 400
-        
-        text = data['text']
-        normalize = data.get('normalize', True)
-        
-        if not isinstance(text, str) or len(text.strip()) == 0:
+        params, error = _parse_single_request(read_request_data())
+        if error:
             return jsonify({
-                'error': 'text must be a non-empty string'
+                'error': error
             }), 400
         
-        # Generate embedding
-        current_model = get_model()
-        embedding = current_model.encode(
-            text, 
-            normalize_embeddings=normalize,
-            show_progress_bar=False
+        # Generate embedding (served from cache when seen before)
+        embeddings, cache_info = encode_texts(
+            params['texts'], normalize=params['normalize'], model_name=params['model_name']
         )
         
-        # Convert numpy array to list for JSON serialization
-        embedding_list = embedding.tolist()
+        return _single_result(params, embeddings, cache_info)
         
+    except (WireFormatError, ModelNotAllowedError) as e:
         return jsonify({
-            'embedding': embedding_list,
-            'model': MODEL_NAME,
-            'embedding_dimension': len(embedding_list),
-            'normalized': normalize
-        })
-        
+            'error': str(e)
+        }), 400
     except Exception as e:
         logger.error(f"Error generating single embedding: {str(e)}")
         return jsonify({
@@ -172,8 +719,20 @@ def generate_batch_embeddings():
     Request body:
     {
         "texts": ["text1", "text2", ...],
-        "batch_size": 32 (optional, default: 32),
-        "normalize": true/false (optional, default: true)
+        "batch_size": 256 (optional, texts per streamed batch; default: 256 when streaming, all texts otherwise),
+        "normalize": true/false (optional, default: true),
+        "model": "model name" (optional, default: the server's default model),
+        "encoding": "json" | "base64" | "binary" | "msgpack" (optional),
+        "dtype": "float32" | "float16" | "int8" | "binary" (optional, packed encodings only),
+        "stream": true/false (optional, default: false),
+        "dedup": true/false (optional, default: false),
+        "dedup_threshold": 0.9 (optional, Jaccard similarity of word shingles),
+        "index": "collection name" (optional, also store the texts there),
+        "ids": ["id1", "id2", ...] (required with index, one per text),
+        "metadatas": [{...}, {...}, ...] (optional, with index),
+        "document_id": "..." (optional, with index: the texts are this document's
+                              chunks; every metadata then needs "documentId"
+                              and "chunkIndex")
     }
     
     Response:
@@ -184,457 +743,2326 @@ def generate_batch_embeddings():
         "embedding_dimension": d,
         "batches_processed": b
     }
+    
+    With "index", each batch is also upserted into that collection as soon as
+    it is encoded (the texts as documents), so a client that stores the
+    vectors elsewhere keeps the collection's BM25 index current too; the
+    response then has "index": "collection name".
+    
+    Forward passes are planned by token length regardless of batch_size, which
+    only controls how texts are grouped in the response and stream.
+    
+    With "dedup", a text identical or nearly identical (MinHash/LSH) to an
+    earlier one is not encoded and gets that text's embedding; "duplicate_of"
+    lists the index each text reuses (null for encoded texts) and "dedup"
+    reports how many encodes were skipped. With "index" and "document_id" as
+    well, texts matching the chunks of a document stored there earlier (same
+    fingerprint) copy that document's vectors instead of being encoded
+    ("dedup": {"reused_document": ...}). The stored rows are found through
+    their metadata, so each metadata must have "documentId" (the document_id)
+    and "chunkIndex" (the text's position); otherwise the request is a 400.
+    
+    With "stream": true (or Accept: application/x-ndjson) the response is NDJSON:
+    one {"start": i, "end": j, "embeddings": ...} line per batch as soon as it is
+    encoded, followed by a final {"done": true, ...} summary line.
+    """
+    try:
+        data = read_request_data()
+        params, error = _parse_batch_request(data)
+        if error:
+            return jsonify({
+                'error': error
+            }), 400
+        
+        target = _batch_index(data, params['texts'], params['model_name'])
+        roots, deduplicator = _batch_duplicates(params, target)
+        
+        if params['stream']:
+            return Response(
+                stream_with_context(_stream_batch_embeddings(params, roots, deduplicator, target)),
+                mimetype='application/x-ndjson'
+            )
+        
+        all_embeddings = []
+        cache = {'hits': 0, 'misses': 0}
+        # Vectors of texts that later duplicates point at
+        stored = {}
+        keep = _referenced(roots)
+        
+        # Process in batches
+        for start in range(0, len(params['texts']), params['batch_size']):
+            batch_embeddings, cache_info = _encode_batch(params, target, roots, start, stored, keep)
+            all_embeddings.append(batch_embeddings)
+            cache['hits'] += cache_info['hits']
+            cache['misses'] += cache_info['misses']
+        _register_batch_document(target, len(params['texts']))
+        
+        embeddings = np.vstack(all_embeddings)
+        
+        return _batch_result(params, embeddings, len(all_embeddings), cache, roots, deduplicator, target)
+        
+    except (WireFormatError, ModelNotAllowedError, CollectionError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error generating batch embeddings: {str(e)}")
+        return jsonify({
+            'error': f'Failed to generate batch embeddings: {str(e)}'
+        }), 500
+
+
+def _validate_search_params(top_k, min_score):
+    """Return an error message for invalid top_k/min_score values, or None."""
+    if not isinstance(top_k, int) or isinstance(top_k, bool) or top_k < 1:
+        return 'top_k must be a positive integer'
+    if min_score is not None and (not isinstance(min_score, (int, float)) or isinstance(min_score, bool)):
+        return 'min_score must be a number'
+    return None
+
+
+def _stream_batch_embeddings(params, roots, deduplicator=None, target=None):
+    """
+    Yield one NDJSON line per encoded batch so memory stays bounded by a
+    single batch and clients can start storing vectors before encoding ends.
+    roots[i] is the text whose vector text i uses (see find_duplicates);
+    target (see _batch_index) is where each batch is also upserted.
+    """
+    num_batches = 0
+    cache = {'hits': 0, 'misses': 0}
+    dimension = 0
+    stored = {}
+    keep = _referenced(roots)
+    
+    try:
+        for start in range(0, len(params['texts']), params['batch_size']):
+            batch_embeddings, cache_info = _encode_batch(params, target, roots, start, stored, keep)
+            cache['hits'] += cache_info['hits']
+            cache['misses'] += cache_info['misses']
+            dimension = int(batch_embeddings.shape[1])
+            num_batches += 1
+            
+            yield json.dumps(_batch_event(params, start, batch_embeddings, roots, deduplicator)) + '\n'
+        
+        _register_batch_document(target, len(params['texts']))
+        summary = _batch_summary(params, dimension, num_batches, cache, deduplicator, target)
+        yield json.dumps({'done': True, **summary}) + '\n'
+        
+    except Exception as e:
+        logger.error(f"Error streaming batch embeddings: {str(e)}")
+        yield json.dumps({
+            'error': f'Failed to generate batch embeddings: {str(e)}',
+            'batches_processed': num_batches
+        }) + '\n'
+
+
+def _batch_index(data, texts, model_name):
+    """
+    (collection, ids, metadatas, reuse) for an /embed/batch request with
+    "index", or None without one. With "document_id" and "dedup", reuse is
+    the fingerprint check of the texts as a document (see _chunk_list_reuse).
+    Raises CollectionError for invalid ids, metadatas or document_id, or an
+    index built with another model. Reuse finds a stored document's rows by
+    their documentId/chunkIndex metadata, so with document_id every metadata
+    must carry both (the document id and the text's position).
+    """
+    name = data.get('index')
+    if not name:
+        return None
+    ids = data.get('ids')
+    metadatas = data.get('metadatas') or [{} for _ in texts]
+    document_id = data.get('document_id')
+    if not isinstance(ids, list) or len(ids) != len(texts) or not all(isinstance(item_id, str) for item_id in ids):
+        raise CollectionError('ids must be a list of strings with one id per text')
+    if not isinstance(metadatas, list) or len(metadatas) != len(texts) or \
+            not all(isinstance(metadata, dict) for metadata in metadatas):
+        raise CollectionError('metadatas must be a list with one object per text')
+    if document_id is not None and (not isinstance(document_id, str) or not document_id):
+        raise CollectionError('document_id must be a non-empty string')
+    if document_id is not None and any(
+            metadata.get('documentId') != document_id or metadata.get('chunkIndex') != position
+            for position, metadata in enumerate(metadatas)):
+        raise CollectionError(
+            'with document_id, metadatas must have "documentId": document_id and "chunkIndex": '
+            'the position of the text'
+        )
+    existing = vector_store.get(name)
+    if existing is not None and existing.model and existing.model != model_name:
+        raise CollectionError(f"Index '{name}' was built with model '{existing.model}', not '{model_name}'")
+    collection = vector_store.get(name, create=True)
+    reuse = None
+    if document_id and data.get('dedup', False):
+        reuse = _chunk_list_reuse(collection, document_id, texts, model_name)
+    return collection, ids, metadatas, reuse
+
+
+def _batch_reused_from(target):
+    """The stored document whose vectors an /embed/batch request copies, or None."""
+    return target[3]['reused_from'] if target is not None and target[3] is not None else None
+
+
+def _batch_duplicates(params, target):
+    """
+    (roots, deduplicator) for an /embed/batch request: find_duplicates with
+    "dedup", an empty deduplicator when target copies a stored document,
+    else every text its own root and no deduplicator.
+    """
+    texts = params['texts']
+    if _batch_reused_from(target):
+        # A copied document is not encoded, so there is nothing to deduplicate
+        return np.arange(len(texts)), ChunkDeduplicator(params['dedup_threshold'])
+    if params['dedup']:
+        with request_timing.phase('dedup'):
+            return find_duplicates(texts, params['dedup_threshold'])
+    return np.arange(len(texts)), None
+
+
+def _encode_batch(params, target, roots, start, stored, keep):
+    """
+    (embeddings, cache_info) for the batch of texts starting at start:
+    encode_unique, or the batch's rows of the stored document target copies.
+    With target the batch is also upserted into its collection.
+    """
+    texts = params['texts'][start:start + params['batch_size']]
+    if _batch_reused_from(target):
+        embeddings, cache_info = target[3]['vectors'][start:start + len(texts)], {'hits': 0, 'misses': 0}
+    else:
+        embeddings, cache_info = encode_unique(
+            texts, roots[start:start + len(texts)], start, stored,
+            normalize=params['normalize'], model_name=params['model_name'], keep=keep
+        )
+    if target is not None:
+        _index_batch(target, start, texts, embeddings, params['model_name'])
+    return embeddings, cache_info
+
+
+def _index_batch(target, start, texts, embeddings, model_name):
+    """Upsert the batch of texts starting at start into the collection of target."""
+    collection, ids, metadatas, _ = target
+    end = start + len(texts)
+    collection.upsert(ids[start:end], embeddings, documents=texts, metadatas=metadatas[start:end], model=model_name)
+
+
+def _register_batch_document(target, num_texts):
+    """Record the fingerprint of a stored /embed/batch document for later re-uploads."""
+    if target is not None and target[3] is not None:
+        reuse = target[3]
+        reuse['registry'].register([reuse['key']], reuse['document_id'], num_texts)
+
+
+def _batch_dedup_report(deduplicator, num_texts, cache_misses, target=None):
+    """The "dedup" block of an /embed/batch response."""
+    reused_from = _batch_reused_from(target)
+    report = _dedup_report(
+        deduplicator.duplicates, deduplicator.threshold, num_texts, cache_misses, num_texts if reused_from else 0
+    )
+    if target is not None and target[3] is not None:
+        report['reused_document'] = reused_from
+    return report
+
+
+def _batch_event(params, start, embeddings, roots, deduplicator=None):
+    """One streamed batch line; with a deduplicator it adds the duplicate_of indexes."""
+    event = {
+        'start': start,
+        'end': start + len(embeddings),
+        'embeddings': pack_array(embeddings, params['dtype']) if params['fmt'] == 'base64' else embeddings.tolist()
+    }
+    if deduplicator is not None:
+        event['duplicate_of'] = _duplicate_of(roots[start:start + len(embeddings)], start)
+    return event
+
+
+def _batch_summary(params, dimension, num_batches, cache, deduplicator=None, target=None):
+    """
+    What an /embed/batch response reports besides the embeddings: the final
+    line of a stream (with "done": true), or the fields of a whole response.
+    """
+    summary = {
+        'model': params['model_name'],
+        'num_texts': len(params['texts']),
+        'embedding_dimension': dimension,
+        'batches_processed': num_batches,
+        'normalized': params['normalize'],
+        'cache': cache
+    }
+    if target is not None:
+        summary['index'] = target[0].name
+    if deduplicator is not None:
+        summary['dedup'] = _batch_dedup_report(deduplicator, len(params['texts']), cache['misses'], target)
+    return summary
+
+
+def _batch_result(params, embeddings, num_batches, cache, roots, deduplicator=None, target=None):
+    """The whole (non-streamed) /embed/batch response."""
+    response = _batch_summary(params, int(embeddings.shape[1]), num_batches, cache, deduplicator, target)
+    if deduplicator is not None:
+        response['duplicate_of'] = _duplicate_of(roots, 0)
+    return embeddings_response('embeddings', embeddings, response, params['fmt'], params['dtype'])
+
+
+def _referenced(roots):
+    """Positions whose vectors later texts reuse."""
+    return set(roots[roots != np.arange(len(roots))].tolist())
+
+
+def _duplicate_of(roots, offset):
+    """Per text: the index whose embedding it reuses, or None if it was encoded itself."""
+    return [None if root == offset + i else int(root) for i, root in enumerate(roots)]
+
+
+def _dedup_report(duplicates, threshold, num_texts, cache_misses, reused_chunks=0):
+    """
+    How many texts were not run through the model, and why. duplicates
+    counts exact and near duplicates; the rest of the skipped encodes are
+    reused_chunks and embedding cache hits.
+    """
+    DEDUP_SKIPPED.inc(reused_chunks, kind='document')
+    DEDUP_SKIPPED.inc(duplicates['exact'], kind='exact')
+    DEDUP_SKIPPED.inc(duplicates['near'], kind='near')
+    return {
+        'exact_duplicates': duplicates['exact'],
+        'near_duplicates': duplicates['near'],
+        'threshold': threshold,
+        'reused_chunks': reused_chunks,
+        'encoded': cache_misses,
+        'encodes_skipped': num_texts - cache_misses
+    }
+
+
+# Asynchronous embedding jobs (/jobs/embed): a persistent SQLite queue and result
+# files under JOBS_DIR, run by JOB_WORKERS threads per process
+job_queue = JobQueue(os.getenv('JOBS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs')))
+job_workers = JobWorkerPool(
+    job_queue,
+    lambda texts, model, normalize: encode_texts(texts, normalize=normalize, model_name=model)[0],
+    num_workers=int(os.getenv('JOB_WORKERS', 1))
+)
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def _job_status(job):
+    """Public view of a job record, with progress and result links."""
+    status = {key: value for key, value in job.items() if key != 'heartbeat'}
+    status['progress'] = job['done'] / job['num_texts'] if job['num_texts'] else 1.0
+    status['rows_available'] = job['done']
+    status['result_url'] = f"/jobs/{job['id']}/embeddings"
+    if job['state'] == 'completed':
+        status['npy_url'] = f"/jobs/{job['id']}/embeddings.npy"
+    return status
+
+
+@app.route('/jobs/embed', methods=['POST'])
+def submit_embed_job():
+    """
+    Queue texts for encoding in the background and return a job id at once.
+    The job survives restarts; poll GET /jobs/<id> and fetch the vectors from
+    /jobs/<id>/embeddings (row ranges) or /jobs/<id>/embeddings.npy.
+    
+    Request body:
+    {
+        "texts": ["text1", "text2", ...],
+        "normalize": true/false (optional, default: true),
+        "model": "model name" (optional, default: the server's default model),
+        "batch_size": 256 (optional, texts per checkpoint)
+    }
+    
+    Response (202):
+    {
+        "id": "job id",
+        "state": "queued",
+        "num_texts": n,
+        "done": 0,
+        ...
+    }
     """
     try:
-        data = request.get_json()
+        data = read_request_data()
         
         if not data or 'texts' not in data:
             return jsonify({
-                'error': 'Missing texts in request body'
+                'error': 'Missing texts in request body'
+            }), 400
+        
+        texts = data['texts']
+        normalize = data.get('normalize', True)
+        batch_size = data.get('batch_size', STREAM_BATCH_SIZE)
+        model_name = model_registry.resolve(data.get('model'))
+        
+        if not isinstance(texts, list) or len(texts) == 0:
+            return jsonify({
+                'error': 'texts must be a non-empty list'
+            }), 400
+        
+        if not isinstance(batch_size, int) or batch_size < 1:
+            return jsonify({
+                'error': 'batch_size must be a positive integer'
+            }), 400
+        
+        with request_timing.phase('validate'):
+            all_strings = all(isinstance(t, str) for t in texts)
+        if not all_strings:
+            return jsonify({
+                'error': 'All items in texts must be strings'
+            }), 400
+        
+        job = job_queue.submit(texts, model_name, normalize=bool(normalize), batch_size=batch_size)
+        job_workers.start()
+        job_workers.notify()
+        logger.info(f"Queued embedding job {job['id']} ({len(texts)} texts, {model_name})")
+        
+        response = jsonify(_job_status(job))
+        response.headers['Location'] = f"/jobs/{job['id']}"
+        return response, 202
+        
+    except (WireFormatError, ModelNotAllowedError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error queueing embedding job: {str(e)}")
+        return jsonify({
+            'error': f'Failed to queue embedding job: {str(e)}'
+        }), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def embed_job_status(job_id):
+    """
+    Report a job's progress (GET), or cancel it and delete its results (DELETE).
+    
+    Response:
+    {
+        "id": "job id",
+        "state": "queued" | "running" | "completed" | "failed",
+        "num_texts": n,
+        "done": rows written so far,
+        "progress": 0.0-1.0,
+        "dimension": d,
+        "error": null,
+        ...
+    }
+    """
+    job = job_queue.get(job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None:
+        return jsonify({
+            'error': f"Job '{job_id}' not found"
+        }), 404
+    
+    if request.method == 'DELETE':
+        job_queue.delete(job_id)
+        return jsonify({'id': job_id, 'deleted': True})
+    
+    return jsonify(_job_status(job))
+
+
+@app.route('/jobs/<job_id>/embeddings', methods=['GET', 'POST'])
+def embed_job_results(job_id):
+    """
+    Fetch rows [start, end) of a job's embeddings. Rows are available as soon
+    as their batch is written, so results can be read while the job runs.
+    
+    Query parameters (or body fields with POST):
+        start: first row (default: 0)
+        end: row after the last one (default: all rows written so far)
+        encoding, dtype: as for /embed
+    
+    Response:
+    {
+        "id": "job id",
+        "state": "running",
+        "start": 0,
+        "end": 256,
+        "num_texts": n,
+        "embeddings": [[...], ...]
+    }
+    """
+    try:
+        data = read_request_data() if request.method == 'POST' else request.args.to_dict()
+        data = data or {}
+        job = job_queue.get(job_id) if JOB_ID_PATTERN.match(job_id) else None
+        if job is None:
+            return jsonify({
+                'error': f"Job '{job_id}' not found"
+            }), 404
+        
+        try:
+            start = int(data.get('start', 0))
+            end = int(data.get('end', job['done']))
+        except (TypeError, ValueError):
+            return jsonify({
+                'error': 'start and end must be integers'
+            }), 400
+        if start < 0 or end < start:
+            return jsonify({
+                'error': 'start must be non-negative and end must not be smaller than start'
+            }), 400
+        
+        if end > job['done']:
+            return jsonify({
+                'error': f"Only rows [0, {job['done']}) of {job['num_texts']} are available",
+                'state': job['state'],
+                'done': job['done']
+            }), 416 if job['state'] == 'completed' else 409
+        
+        fmt, dtype = negotiate(data)
+        vectors = job_queue.read_rows(job_id, start, end)
+        if vectors is None:
+            vectors = np.empty((0, job['dimension'] or 0), dtype=np.float32)
+        
+        return embeddings_response('embeddings', vectors, {
+            'id': job_id,
+            'state': job['state'],
+            'model': job['model'],
+            'start': start,
+            'end': start + len(vectors),
+            'num_texts': job['num_texts']
+        }, fmt, dtype)
+        
+    except WireFormatError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error reading job results: {str(e)}")
+        return jsonify({
+            'error': f'Failed to read job results: {str(e)}'
+        }), 500
+
+
+@app.route('/jobs/<job_id>/embeddings.npy', methods=['GET'])
+def embed_job_npy(job_id):
+    """
+    Download a completed job's embeddings as a float32 .npy file (HTTP Range
+    requests are supported, so large results can be fetched in parts).
+    """
+    job = job_queue.get(job_id) if JOB_ID_PATTERN.match(job_id) else None
+    if job is None:
+        return jsonify({
+            'error': f"Job '{job_id}' not found"
+        }), 404
+    if job['state'] != 'completed':
+        return jsonify({
+            'error': f"Job '{job_id}' is {job['state']}; the .npy file is served once it completes",
+            'done': job['done']
+        }), 409
+    return send_file(
+        job_queue.result_path(job_id),
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=f'{job_id}.npy',
+        conditional=True
+    )
+
+
+@app.route('/chunk', methods=['POST'])
+def chunk_texts():
+    """
+    Split text into chunks that fit the model's max_seq_length, counted with
+    the model's own tokenizer.
+
+    Sentences are packed into each chunk up to max_tokens (special tokens
+    included); a sentence longer than that is split between words.
+    Consecutive chunks overlap by up to overlap_tokens.
+
+    Request body:
+    {
+        "text": "..." or "texts": ["...", ...],
+        "max_tokens": 256 (optional, default and maximum: the model's max_seq_length),
+        "overlap_tokens": 32 (optional),
+        "model": "model name" (optional, default: the server's default model)
+    }
+
+    Response:
+    {
+        "chunks": [{"text": "...", "start": 0, "end": 1043, "num_tokens": 251}, ...],
+        "num_chunks": n,
+        "max_tokens": 256,
+        "overlap_tokens": 32,
+        "model": "model_name"
+    }
+
+    start/end are character offsets into the text (end exclusive). With
+    "texts", "results" holds {"chunks", "num_chunks"} per text instead.
+    """
+    try:
+        data = read_request_data()
+
+        if not data or ('text' not in data and 'texts' not in data):
+            return jsonify({
+                'error': 'Missing text or texts in request body'
+            }), 400
+
+        texts = data['texts'] if 'texts' in data else [data['text']]
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return jsonify({
+                'error': 'text must be a string and texts a list of strings'
+            }), 400
+
+        max_tokens = data.get('max_tokens')
+        overlap_tokens = data.get('overlap_tokens', CHUNK_OVERLAP_TOKENS)
+        if not isinstance(overlap_tokens, int) or not (max_tokens is None or isinstance(max_tokens, int)):
+            return jsonify({
+                'error': 'max_tokens and overlap_tokens must be integers'
+            }), 400
+
+        model_name = model_registry.resolve(data.get('model'))
+        chunker = get_token_chunker(model_name, max_tokens, overlap_tokens)
+
+        with request_timing.phase('chunk'):
+            results = [chunker.chunk(text) for text in texts]
+
+        response = {
+            'max_tokens': chunker.max_tokens,
+            'overlap_tokens': chunker.overlap_tokens,
+            'model': model_name
+        }
+        if 'texts' in data:
+            response['results'] = [{'chunks': chunks, 'num_chunks': len(chunks)} for chunks in results]
+        else:
+            response.update({'chunks': results[0], 'num_chunks': len(results[0])})
+        return jsonify(response)
+
+    except (ValueError, ModelNotAllowedError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error chunking text: {str(e)}")
+        return jsonify({
+            'error': f'Failed to chunk text: {str(e)}'
+        }), 500
+
+
+# PDF uploads for /ingest
+INGEST_MAX_MB = float(os.getenv('INGEST_MAX_MB', 50))
+INGEST_BATCH_SIZE = 64
+UPLOAD_FIELDS = ('file', 'pdf', 'document', 'curriculum')
+
+
+@app.route('/ingest', methods=['POST'])
+def ingest_pdf():
+    """
+    Extract, chunk and embed a PDF in one pipelined pass.
+    
+    Pages are extracted one at a time on a background thread and chunked as
+    they arrive (same rules as textChunker.js). Chunks are encoded while later
+    pages are still being extracted, and each batch is sent or stored as soon
+    as it is encoded.
+    
+    Request: multipart/form-data with the PDF in "file" (or "pdf", "document",
+    "curriculum"), or a raw application/pdf body. Options as form fields or
+    query parameters:
+        index: collection to store the chunks in (optional; without it the
+               embeddings are streamed back)
+        document_id, file_name: kept in each chunk's metadata (optional)
+        model, batch_size (64), chunk_size (1000), overlap (200)
+        chunking: "characters" (default, as textChunker.js) or "tokens" to
+                  pack sentences up to max_tokens (default: the model's
+                  max_seq_length) with overlap_tokens (32), as /chunk does
+        encoding: "json" | "base64" (streamed embeddings only)
+        stream: "true" to get progress lines when storing into an index
+        chroma: "true" to write the chunks straight into the Chroma collection
+                chroma_collection (default CHROMA_COLLECTION_NAME) instead,
+                as ChromaDBManager.addDocuments would; uploaded_at (default now)
+        dedup: "false" to encode every chunk; dedup_threshold (0.9)
+    
+    Response (NDJSON, one line per encoded batch, then a summary):
+    {"start": 0, "end": 12, "pages": [1, 3], "chunks": ["..."], "embeddings": [[...], ...]}
+    {"done": true, "document_id": "...", "num_pages": p, "num_chunks": n,
+     "time_to_first_embedding_ms": t, "total_ms": t, "text_preview": "...", ...}
+    
+    With "index", chunks are upserted with ids "<document_id>_chunk_<i>" and
+    metadata {documentId, fileName, chunkIndex, page}, and the response is
+    the summary as JSON. With "chroma", the chunks are collected and written
+    in a few bulk upserts once the document is encoded (totalChunks is only
+    known then), with the ids and metadata of chromaManager.js (and, with
+    CHROMA_MIRROR, into the index of the same name).
+    
+    Deduplication: a chunk identical or nearly identical to an earlier chunk
+    of the document reuses its embedding (metadata "duplicateOf" holds that
+    chunk's id; streamed batches carry "duplicate_of"). With "index" (or
+    "chroma" and CHROMA_MIRROR), a document whose extracted text matches one
+    already stored there (same fingerprint and chunking) copies its vectors
+    instead of encoding them.
+    The summary's "dedup" block reports the skipped encodes.
+    """
+    started = time.perf_counter()
+    try:
+        options = request.values
+        upload = next((request.files[name] for name in UPLOAD_FIELDS if name in request.files), None)
+        if upload is None and request.files:
+            upload = next(iter(request.files.values()))
+        
+        if upload is not None:
+            pdf_bytes = upload.read()
+            file_name = options.get('file_name') or upload.filename
+        elif request.mimetype == 'application/pdf':
+            pdf_bytes = request.get_data()
+            file_name = options.get('file_name')
+        else:
+            return jsonify({
+                'error': 'Upload a PDF as multipart field "file" or as an application/pdf body'
+            }), 400
+        
+        if len(pdf_bytes) > INGEST_MAX_MB * 1024 * 1024:
+            return jsonify({
+                'error': f'PDF is larger than {INGEST_MAX_MB:g} MB'
+            }), 413
+        if b'%PDF' not in pdf_bytes[:1024]:
+            return jsonify({
+                'error': 'Uploaded file is not a PDF'
+            }), 400
+        
+        try:
+            batch_size = int(options.get('batch_size', INGEST_BATCH_SIZE))
+            chunk_size = int(options.get('chunk_size', CHUNK_SIZE))
+            overlap = int(options.get('overlap', CHUNK_OVERLAP))
+            max_tokens = int(options['max_tokens']) if options.get('max_tokens') else None
+            overlap_tokens = int(options.get('overlap_tokens', CHUNK_OVERLAP_TOKENS))
+        except ValueError:
+            return jsonify({
+                'error': 'batch_size, chunk_size, overlap, max_tokens and overlap_tokens must be integers'
+            }), 400
+        chunking = options.get('chunking', 'characters').lower()
+        if chunking not in ('characters', 'tokens'):
+            return jsonify({
+                'error': 'chunking must be "characters" or "tokens"'
+            }), 400
+        
+        deduplicator = None
+        if options.get('dedup', 'true').lower() == 'true':
+            try:
+                deduplicator = ChunkDeduplicator(float(options.get('dedup_threshold', NEAR_DUPLICATE_THRESHOLD)))
+            except ValueError:
+                return jsonify({
+                    'error': 'dedup_threshold must be a number in (0, 1]'
+                }), 400
+        if batch_size < 1 or chunk_size < 1 or overlap < 0 or overlap >= chunk_size:
+            return jsonify({
+                'error': 'batch_size and chunk_size must be positive and overlap smaller than chunk_size'
+            }), 400
+        
+        index_name = options.get('index')
+        collection = None
+        chroma = None
+        if options.get('chroma', 'false').lower() == 'true':
+            if index_name:
+                return jsonify({
+                    'error': 'Store into either an index or chroma, not both'
+                }), 400
+            try:
+                chroma = get_chroma_writer(options.get('chroma_collection'))
+                chroma.connect()
+            except ImportError:
+                return jsonify({
+                    'error': 'chromadb is required for chroma=true. Install with: pip install chromadb'
+                }), 500
+        if index_name:
+            existing = vector_store.get(index_name)
+            model_name = model_registry.resolve(options.get('model') or (existing.model if existing else None))
+            if existing is not None and existing.model and existing.model != model_name:
+                return jsonify({
+                    'error': f"Index '{index_name}' was built with model '{existing.model}', not '{model_name}'"
+                }), 409
+            collection = vector_store.get(index_name, create=True)
+        else:
+            model_name = model_registry.resolve(options.get('model'))
+        
+        fmt, dtype = negotiate({'encoding': options.get('encoding', 'json'), 'dtype': options.get('dtype')})
+        if fmt not in ('json', 'base64'):
+            return jsonify({
+                'error': 'Streaming supports only json and base64 encodings'
+            }), 400
+        
+        try:
+            reader = open_pdf(pdf_bytes)
+        except ImportError:
+            return jsonify({
+                'error': 'pypdf is required for PDF ingestion. Install with: pip install pypdf'
+            }), 500
+        
+        token_chunker = None
+        chunk_settings = ('characters', chunk_size, overlap)
+        if chunking == 'tokens':
+            try:
+                token_chunker = IncrementalTokenChunker(get_token_chunker(model_name, max_tokens, overlap_tokens))
+            except ValueError as e:
+                return jsonify({
+                    'error': str(e)
+                }), 400
+            chunk_settings = ('tokens', token_chunker.chunker.max_tokens, token_chunker.chunker.overlap_tokens)
+        
+        # Fingerprints of the documents stored in the collection (or in the Chroma mirror), for re-uploads
+        registry = None
+        source = collection if chroma is None else chroma_mirror(chroma.collection_name)
+        if source is not None and deduplicator is not None:
+            registry = FingerprintRegistry(os.path.join(source.path, 'fingerprints.json'))
+        
+        chunks = ChunkStream(extract_pages(reader), chunk_size=chunk_size, overlap=overlap, chunker=token_chunker)
+        events = _ingest_events(
+            chunks, started, batch_size, model_name, collection,
+            document_id=options.get('document_id') or f'doc_{uuid.uuid4().hex[:12]}',
+            file_name=file_name,
+            fmt=fmt,
+            dtype=dtype,
+            deduplicator=deduplicator,
+            registry=registry,
+            source=source,
+            chunk_settings=chunk_settings,
+            file_fingerprint=hashlib.sha256(pdf_bytes).hexdigest(),
+            chroma=chroma,
+            uploaded_at=options.get('uploaded_at') or iso_now()
+        )
+        
+        if (collection is None and chroma is None) or options.get('stream', 'false').lower() == 'true':
+            return Response(
+                stream_with_context(json.dumps(event) + '\n' for event in events),
+                mimetype='application/x-ndjson'
+            )
+        
+        summary = None
+        for event in events:
+            summary = event
+        if 'error' in summary:
+            return jsonify(summary), 500
+        if summary['num_chunks'] == 0:
+            return jsonify({
+                'error': 'Could not extract text from PDF. The file might be image-based or corrupted.'
+            }), 400
+        return jsonify(summary)
+        
+    except (PdfIngestError, WireFormatError, ModelNotAllowedError, CollectionError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error ingesting PDF: {str(e)}")
+        return jsonify({
+            'error': f'Failed to ingest PDF: {str(e)}'
+        }), 500
+
+
+def _ingest_events(chunks, started, batch_size, model_name, collection, document_id, file_name, fmt, dtype,
+                   deduplicator=None, registry=None, source=None, chunk_settings=(), file_fingerprint=None,
+                   chroma=None, uploaded_at=None):
+    """
+    Encode chunks as the extractor produces them. Yields one event per batch
+    (with the chunks and embeddings, or stored into collection), then a
+    summary, or an error event if anything fails part-way.
+    
+    With a deduplicator, duplicate chunks reuse the vector of the chunk they
+    repeat. With a registry (of the collection source), batches are copied
+    from a document stored there with the same fingerprint instead of
+    encoded: the file's (byte-identical re-upload) from the first batch, or
+    the extracted text's once the extractor has read the last page (batches
+    encoded before that stay).
+    With a ChromaWriter, the chunks are written to Chroma after the last batch.
+    """
+    num_chunks = 0
+    num_batches = 0
+    dimension = 0
+    first_embedding = None
+    cache_hits = 0
+    cache_misses = 0
+    # Vectors of encoded chunks that later duplicates may point at
+    stored = {}
+    duplicates = {'exact': 0, 'near': 0}
+    reuse_from = None
+    reused = None
+    reused_chunks = 0
+    checked = set()
+    # Chunks and vectors for Chroma, written once the document is complete
+    chroma_texts = []
+    chroma_vectors = []
+    
+    try:
+        for batch in chunks.batches(batch_size):
+            texts = [text for _, _, text in batch]
+            offset = batch[0][0]
+            
+            if registry is not None and reuse_from is None:
+                for fingerprint in (file_fingerprint, chunks.fingerprint):
+                    if fingerprint is None or fingerprint in checked:
+                        continue
+                    checked.add(fingerprint)
+                    entry = registry.lookup(registry.key(fingerprint, chunk_settings))
+                    if entry and entry['document_id'] != document_id:
+                        reused = _document_vectors(source, entry['document_id'], entry['num_chunks'], model_name)
+                        if reused is not None:
+                            reuse_from = entry['document_id']
+                            break
+            embeddings = None
+            if reused is not None and offset + len(batch) <= len(reused):
+                embeddings = reused[offset:offset + len(batch)]
+            
+            # Every chunk goes through the deduplicator so later chunks can match it
+            roots = list(range(offset, offset + len(batch)))
+            if deduplicator is not None:
+                with request_timing.phase('dedup'):
+                    for i, text in enumerate(texts):
+                        original, kind = deduplicator.add(text)
+                        if original is not None:
+                            roots[i] = original
+                            if embeddings is None:
+                                duplicates[kind] += 1
+            
+            if embeddings is not None:
+                # Copied from the stored document; later duplicates may point at these rows
+                reused_chunks += len(batch)
+                stored.update((offset + i, vector) for i, vector in enumerate(embeddings))
+                cache_info = {'hits': 0, 'misses': 0}
+            else:
+                embeddings, cache_info = encode_unique(texts, roots, offset, stored, model_name=model_name)
+            if first_embedding is None:
+                first_embedding = time.perf_counter() - started
+            cache_hits += cache_info['hits']
+            cache_misses += cache_info['misses']
+            dimension = int(embeddings.shape[1])
+            num_chunks += len(batch)
+            num_batches += 1
+            
+            event = {
+                'start': batch[0][0],
+                'end': batch[-1][0] + 1,
+                'pages': [batch[0][1], batch[-1][1]]
+            }
+            duplicate_of = [None if root == offset + i else root for i, root in enumerate(roots)]
+            if collection is not None:
+                metadatas = [
+                    {'documentId': document_id, 'fileName': file_name, 'chunkIndex': index, 'page': page}
+                    for index, page, _ in batch
+                ]
+                for metadata, original in zip(metadatas, duplicate_of):
+                    if original is not None:
+                        metadata['duplicateOf'] = f'{document_id}_chunk_{original}'
+                collection.upsert(
+                    [f'{document_id}_chunk_{index}' for index, _, _ in batch],
+                    embeddings,
+                    documents=texts,
+                    metadatas=metadatas,
+                    model=model_name
+                )
+            elif chroma is not None:
+                chroma_texts.extend(texts)
+                chroma_vectors.append(embeddings)
+            else:
+                event['chunks'] = texts
+                event['embeddings'] = pack_array(embeddings, dtype) if fmt == 'base64' else embeddings.tolist()
+            if deduplicator is not None:
+                event['duplicate_of'] = duplicate_of
+            yield event
+        
+        if chroma is not None and num_chunks:
+            write_chroma_document(
+                chroma, chroma_texts, np.vstack(chroma_vectors), document_id, file_name or document_id, uploaded_at, model_name
+            )
+        
+        if registry is not None and num_chunks:
+            registry.register(
+                [registry.key(fingerprint, chunk_settings) for fingerprint in (file_fingerprint, chunks.fingerprint) if fingerprint],
+                document_id,
+                num_chunks
+            )
+        
+        summary = {
+            'done': True,
+            'document_id': document_id,
+            'file_name': file_name,
+            'index': collection.name if collection is not None else None,
+            'model': model_name,
+            'num_pages': chunks.pages,
+            'num_characters': chunks.characters,
+            'num_chunks': num_chunks,
+            'embedding_dimension': dimension,
+            'batches_processed': num_batches,
+            'cache': {'hits': cache_hits, 'misses': cache_misses},
+            'time_to_first_embedding_ms': round(first_embedding * 1000, 1) if first_embedding is not None else None,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1),
+            'text_preview': chunks.preview
+        }
+        if chroma is not None:
+            summary['chroma'] = {'collection': chroma.collection_name, 'chunks_written': num_chunks}
+        if deduplicator is not None:
+            summary['dedup'] = dict(
+                _dedup_report(duplicates, deduplicator.threshold, num_chunks, cache_misses, reused_chunks),
+                fingerprint=chunks.fingerprint,
+                file_fingerprint=file_fingerprint,
+                reused_document=reuse_from
+            )
+        yield summary
+        
+    except Exception as e:
+        logger.error(f"Error ingesting PDF: {str(e)}")
+        yield {
+            'error': f'Failed to ingest PDF: {str(e)}',
+            'chunks_processed': num_chunks
+        }
+    finally:
+        chunks.close()
+
+
+@app.route('/chroma/add', methods=['POST'])
+def add_to_chroma():
+    """
+    Encode a document's chunks and write them straight into a Chroma
+    collection, with the ids and metadata ChromaDBManager.addDocuments uses.
+    Replaces the addDocuments -> Chroma -> /embed round trip with one request.
+    With CHROMA_MIRROR the chunks are also stored in the /index collection of
+    the same name, for lexical and hybrid search.
+    
+    Request body:
+    {
+        "chunks": ["chunk1", "chunk2", ...],
+        "documentId": "...",
+        "fileName": "...",
+        "uploadedAt": "2025-01-01T00:00:00.000Z" (optional, default: now),
+        "collection": "name" (optional, default: CHROMA_COLLECTION_NAME),
+        "model": "model name" (optional, default: the server's default model),
+        "dedup": true/false (optional, default: true)
+    }
+    
+    Response:
+    {
+        "collection": "curriculum_documents",
+        "documentId": "...",
+        "ids": ["<documentId>_chunk_0_<ms>", ...],
+        "num_chunks": n,
+        "embedding_dimension": d,
+        "model": "model_name"
+    }
+    
+    With dedup, repeated chunks are encoded once, and a document whose chunks
+    match one already written (fingerprint of the chunk list, kept with the
+    CHROMA_MIRROR index) copies that document's vectors from the index
+    instead of encoding them ("dedup": {"reused_document": ...}).
+    """
+    try:
+        data = read_request_data()
+        
+        if not data or 'chunks' not in data or 'documentId' not in data:
+            return jsonify({
+                'error': 'Missing chunks or documentId in request body'
+            }), 400
+        
+        chunks = data['chunks']
+        document_id = data['documentId']
+        file_name = data.get('fileName', document_id)
+        uploaded_at = data.get('uploadedAt') or iso_now()
+        model_name = model_registry.resolve(data.get('model'))
+        
+        if not isinstance(chunks, list) or len(chunks) == 0 or not all(isinstance(c, str) for c in chunks):
+            return jsonify({
+                'error': 'chunks must be a non-empty list of strings'
+            }), 400
+        
+        if not all(isinstance(value, str) and value for value in (document_id, file_name, uploaded_at)):
+            return jsonify({
+                'error': 'documentId, fileName and uploadedAt must be non-empty strings'
+            }), 400
+        
+        try:
+            writer = get_chroma_writer(data.get('collection'))
+            writer.connect()
+        except ImportError:
+            return jsonify({
+                'error': 'chromadb is required for direct Chroma writes. Install with: pip install chromadb'
+            }), 500
+        
+        deduplicator = None
+        reuse = None
+        reused_from = None
+        roots = np.arange(len(chunks))
+        if data.get('dedup', True):
+            mirror = chroma_mirror(writer.collection_name)
+            if mirror is not None:
+                reuse = _chunk_list_reuse(mirror, document_id, chunks, model_name)
+                reused_from = reuse['reused_from']
+            if reused_from:
+                # A copied document is not encoded, so there is nothing to deduplicate
+                deduplicator = ChunkDeduplicator()
+            else:
+                with request_timing.phase('dedup'):
+                    roots, deduplicator = find_duplicates(chunks)
+        if reused_from:
+            embeddings, cache_info = reuse['vectors'], {'hits': 0, 'misses': 0}
+        else:
+            embeddings, cache_info = encode_unique(chunks, roots, 0, {}, normalize=True, model_name=model_name)
+        
+        ids = write_chroma_document(writer, chunks, embeddings, document_id, file_name, uploaded_at, model_name)
+        logger.info(f"Wrote {len(ids)} chunks of {document_id} to Chroma collection '{writer.collection_name}'")
+        if reuse is not None:
+            reuse['registry'].register([reuse['key']], document_id, len(chunks))
+        
+        response = {
+            'collection': writer.collection_name,
+            'documentId': document_id,
+            'ids': ids,
+            'num_chunks': len(ids),
+            'embedding_dimension': int(embeddings.shape[1]),
+            'model': model_name
+        }
+        if deduplicator is not None:
+            response['dedup'] = dict(
+                _dedup_report(
+                    deduplicator.duplicates, deduplicator.threshold, len(chunks), cache_info['misses'],
+                    len(chunks) if reused_from else 0
+                ),
+                reused_document=reused_from
+            )
+        return jsonify(response)
+        
+    except (ChromaWriteError, WireFormatError, ModelNotAllowedError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error writing to Chroma: {str(e)}")
+        return jsonify({
+            'error': f'Failed to write to Chroma: {str(e)}'
+        }), 500
+
+
+@app.route('/similarity', methods=['POST'])
+def compute_similarity():
+    """
+    Compute cosine similarity between a query and a list of documents.
+    
+    Request body:
+    {
+        "query": "query text",
+        "documents": ["doc1", "doc2", ...],
+        "top_k": 5 (optional, default: all),
+        "min_score": 0.3 (optional, drop results scoring below this),
+        "model": "model name" (optional)
+    }
+    
+    Response:
+    {
+        "results": [
+            {"document": "doc1", "index": 0, "score": 0.95},
+            ...
+        ],
+        "query": "query text",
+        "model": "model_name"
+    }
+    """
+    try:
+        data = read_request_data()
+        
+        if not data or 'query' not in data or 'documents' not in data:
+            return jsonify({
+                'error': 'Missing query or documents in request body'
+            }), 400
+        
+        query = data['query']
+        documents = data['documents']
+        top_k = data.get('top_k', len(documents) if isinstance(documents, list) else 0)
+        min_score = data.get('min_score')
+        model_name = model_registry.resolve(data.get('model'))
+        
+        if not isinstance(query, str) or len(query.strip()) == 0:
+            return jsonify({
+                'error': 'query must be a non-empty string'
+            }), 400
+        
+        if not isinstance(documents, list) or len(documents) == 0:
+            return jsonify({
+                'error': 'documents must be a non-empty list'
+            }), 400
+        
+        error = _validate_search_params(top_k, min_score)
+        if error:
+            return jsonify({
+                'error': error
+            }), 400
+        
+        # Generate query and document embeddings in one scheduled call
+        embeddings, _ = encode_texts([query] + documents, normalize=True, model_name=model_name)
+        
+        with request_timing.phase('search'):
+            indices, scores = top_k_search(embeddings[:1], embeddings[1:], top_k, min_score=min_score)[0]
+        
+        results = [
+            {'document': documents[idx], 'index': idx, 'score': score}
+            for idx, score in zip(indices.tolist(), scores.tolist())
+        ]
+        
+        return jsonify({
+            'results': results,
+            'query': query,
+            'model': model_name,
+            'total_documents': len(documents),
+            'top_k': top_k
+        })
+        
+    except ModelNotAllowedError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error computing similarity: {str(e)}")
+        return jsonify({
+            'error': f'Failed to compute similarity: {str(e)}'
+        }), 500
+
+
+@app.route('/similarity/embeddings', methods=['POST'])
+def compute_similarity_from_embeddings():
+    """
+    Compute cosine similarity between pre-computed embeddings.
+    Useful when you have cached embeddings in ChromaDB.
+    
+    Request body:
+    {
+        "query_embedding": [...],
+        "document_embeddings": [[...], [...], ...],
+        "top_k": 5 (optional, default: all),
+        "min_score": 0.3 (optional, drop results scoring below this)
+    }
+    
+    Either embedding field may also be a packed {"data", "dtype", "shape"} object
+    (base64 in JSON, bytes in msgpack). A raw application/octet-stream body is read
+    as one matrix whose first row is the query and whose remaining rows are the
+    documents (shape in X-Embedding-Shape, top_k in the query string).
+    
+    Response:
+    {
+        "results": [
+            {"index": 0, "score": 0.95},
+            ...
+        ]
+    }
+    """
+    try:
+        data = read_request_data()
+        
+        if data and 'embeddings' in data and 'query_embedding' not in data:
+            # Raw binary body: first row is the query, the rest are documents
+            matrix = decode_array(data['embeddings'], ndim=2)
+            data['query_embedding'] = matrix[0]
+            data['document_embeddings'] = matrix[1:]
+        
+        if not data or 'query_embedding' not in data or 'document_embeddings' not in data:
+            return jsonify({
+                'error': 'Missing query_embedding or document_embeddings in request body'
+            }), 400
+        
+        query_embedding = decode_array(data['query_embedding'], ndim=1)
+        doc_embeddings = decode_array(data['document_embeddings'], ndim=2)
+        top_k = data.get('top_k', len(doc_embeddings))
+        min_score = data.get('min_score')
+        
+        error = _validate_search_params(top_k, min_score)
+        if error:
+            return jsonify({
+                'error': error
+            }), 400
+        
+        if query_embedding.shape[0] != doc_embeddings.shape[1]:
+            return jsonify({
+                'error': 'query_embedding and document_embeddings must have the same dimension'
+            }), 400
+        
+        # Normalize embeddings for cosine similarity, then select the top k
+        with request_timing.phase('search'):
+            indices, scores = top_k_search(
+                normalize_rows(query_embedding),
+                normalize_rows(doc_embeddings),
+                top_k,
+                min_score=min_score
+            )[0]
+        
+        results = [
+            {'index': idx, 'score': score}
+            for idx, score in zip(indices.tolist(), scores.tolist())
+        ]
+        
+        return jsonify({
+            'results': results,
+            'total_documents': len(doc_embeddings),
+            'top_k': top_k
+        })
+        
+    except WireFormatError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error computing similarity from embeddings: {str(e)}")
+        return jsonify({
+            'error': f'Failed to compute similarity: {str(e)}'
+        }), 500
+
+
+@app.route('/model/info', methods=['GET'])
+def get_model_info():
+    """
+    Get detailed information about a model (?model=name, default: the default model).
+    
+    Response:
+    {
+        "model_name": "all-MiniLM-L6-v2",
+        "default_model": "all-MiniLM-L6-v2",
+        "backend": "torch",
+        "embedding_dimension": 384,
+        "max_seq_length": 256,
+        "available_models": [...],
+        "registry": {"loaded_models": [...], "memory_bytes": b, ...}
+    }
+    """
+    try:
+        model_name = model_registry.resolve(request.args.get('model'))
+        current_model = get_model(model_name)
+        
+        return jsonify({
+            'model_name': model_name,
+            'default_model': model_registry.default_model,
+            'backend': EMBEDDING_BACKEND,
+            'embedding_dimension': current_model.get_sentence_embedding_dimension(),
+            'max_seq_length': current_model.max_seq_length,
+            'available_models': AVAILABLE_MODELS,
+            'registry': model_registry.stats()
+        })
+        
+    except ModelNotAllowedError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error getting model info: {str(e)}")
+        return jsonify({
+            'error': f'Failed to get model info: {str(e)}'
+        }), 500
+
+
+@app.route('/model/default', methods=['POST'])
+def set_default_model():
+    """
+    Switch the default model. The new model is loaded before the switch, so
+    requests keep being served; requests already running finish on the old one.
+    
+    Request body:
+    {
+        "model": "all-mpnet-base-v2"
+    }
+    
+    Response:
+    {
+        "default_model": "all-mpnet-base-v2",
+        "previous_model": "all-MiniLM-L6-v2"
+    }
+    """
+    try:
+        data = read_request_data()
+        
+        if not data or 'model' not in data:
+            return jsonify({
+                'error': 'Missing model in request body'
+            }), 400
+        
+        previous = model_registry.set_default(data['model'])
+        return jsonify({
+            'default_model': model_registry.default_model,
+            'previous_model': previous
+        })
+        
+    except ModelNotAllowedError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error switching default model: {str(e)}")
+        return jsonify({
+            'error': f'Failed to switch default model: {str(e)}'
+        }), 500
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """
+    Health check endpoint with detailed status.
+    
+    Response:
+    {
+        "status": "healthy",
+        "model": "model_name",
+        "embedding_dimension": d,
+        "model_loaded": true/false
+    }
+    
+    While the default model is still loading this returns 503 with
+    "status": "loading" instead of waiting for it.
+    """
+    if not is_ready():
+        return jsonify({
+            'status': _startup['state'],
+            'model': model_registry.default_model,
+            'model_loaded': model_registry.is_loaded(),
+            'error': _startup['error']
+        }), 503
+    try:
+        current_model = get_model()
+        return jsonify({
+            'status': 'healthy',
+            'model': model_registry.default_model,
+            'backend': EMBEDDING_BACKEND,
+            'embedding_dimension': current_model.get_sentence_embedding_dimension(),
+            'model_loaded': model_registry.is_loaded(),
+            'loaded_models': model_registry.loaded_models(),
+            'max_seq_length': current_model.max_seq_length
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'unhealthy',
+            'error': str(e),
+            'model_loaded': model_registry.is_loaded()
+        }), 500
+
+
+@app.route('/health/live', methods=['GET'])
+def liveness_check():
+    """
+    Liveness probe: the process is up and serving HTTP. Answers immediately,
+    also while the model is loading. Fails only if loading the default model
+    failed, which a restart is the fix for.
+    
+    Response:
+    {
+        "status": "alive" | "failed"
+    }
+    """
+    if _startup['state'] == 'failed':
+        return jsonify({
+            'status': 'failed',
+            'error': _startup['error']
+        }), 503
+    return jsonify({
+        'status': 'alive'
+    })
+
+
+@app.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness probe: 200 once the default model is loaded and a warm-up
+    encode has run, 503 before that. Includes the startup timings.
+    
+    Response:
+    {
+        "status": "ready" | "loading" | "failed",
+        "model": "model_name",
+        "load_seconds": s,
+        "warmup_seconds": s,
+        "ready_after_seconds": s
+    }
+    """
+    return jsonify({
+        'status': _startup['state'],
+        'model': model_registry.default_model,
+        'warmup': MODEL_WARMUP,
+        'error': _startup['error'],
+        'load_seconds': _startup['load_seconds'],
+        'warmup_seconds': _startup['warmup_seconds'],
+        'ready_after_seconds': _startup['ready_after_seconds']
+    }), 200 if is_ready() else 503
+
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    """
+    Embedding cache statistics.
+    
+    Response:
+    {
+        "memory_entries": n,
+        "memory_hits": h,
+        "disk_hits": h,
+        "misses": m,
+        "hit_rate": 0.87,
+        ...
+    }
+    """
+    return jsonify(embedding_cache.stats())
+
+
+@app.route('/scheduler/stats', methods=['GET'])
+def get_scheduler_stats():
+    """
+    Micro-batching scheduler statistics.
+    
+    Response:
+    {
+        "batches_dispatched": b,
+        "requests_served": r,
+        "texts_encoded": t,
+        "avg_requests_per_batch": 2.4,
+        "queue_depth": q,
+        "planner": {"token_budget": 16384, "padding_ratio": 0.12, ...},
+        ...,
+        "models": {"model_name": {...same fields per model...}}
+    }
+    
+    Top-level fields describe the default model.
+    """
+    with _pipelines_lock:
+        pipelines = dict(_pipelines)
+    models = {}
+    for name, (planner, scheduler) in pipelines.items():
+        models[name] = scheduler.stats()
+        models[name]['planner'] = planner.stats()
+    stats = dict(models.get(model_registry.default_model, {}))
+    stats['models'] = models
+    return jsonify(stats)
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Prometheus metrics in the text exposition format.
+    
+    Request counts and latency per route, forward batch time, batch size and
+    sequence length distributions, encoded texts/tokens (rate() gives
+    texts/sec and tokens/sec), cache hits/misses, queue depth and model loads.
+    """
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+
+@app.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """
+    Fetch a stored per-request profile: the text report (sorted by cumulative
+    time), or the raw cProfile dump with ?format=prof.
+    """
+    if not PROFILING_ENABLED:
+        return jsonify({
+            'error': 'Profiling is disabled. Set PROFILING_ENABLED=True'
+        }), 404
+    if not profile_id.isalnum() or len(profile_id) != request_timing.PROFILE_ID_LENGTH:
+        return jsonify({
+            'error': 'Invalid profile id'
+        }), 400
+    raw = request.args.get('format') == 'prof'
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{'prof' if raw else 'txt'}")
+    if not os.path.exists(path):
+        return jsonify({
+            'error': f"Profile '{profile_id}' not found"
+        }), 404
+    with open(path, 'rb') as f:
+        body = f.read()
+    return Response(body, mimetype='application/octet-stream' if raw else 'text/plain')
+
+
+@app.route('/find-relevant-content', methods=['POST'])
+def find_relevant_content():
+    """
+    Find relevant content from a set of documents based on topics.
+    This endpoint helps identify the most relevant curriculum content
+    for generating assessment questions.
+    
+    Request body:
+    {
+        "topics": ["topic1", "topic2"],
+        "documents": ["doc1 text", "doc2 text", ...],
+        "top_k": 10 (optional, default: 10),
+        "min_score": 0.3 (optional, default: 0.3),
+        "model": "model name" (optional)
+    }
+    
+    Response:
+    {
+        "relevant_content": [
+            {
+                "topic": "topic1",
+                "documents": [
+                    {"text": "...", "index": 0, "score": 0.95},
+                    ...
+                ]
+            }
+        ]
+    }
+    """
+    try:
+        data = read_request_data()
+        
+        if not data or 'topics' not in data or 'documents' not in data:
+            return jsonify({
+                'error': 'Missing topics or documents in request body'
+            }), 400
+        
+        topics = data['topics']
+        documents = data['documents']
+        top_k = data.get('top_k', 10)
+        min_score = data.get('min_score', 0.3)
+        model_name = model_registry.resolve(data.get('model'))
+        
+        if not isinstance(topics, list) or len(topics) == 0:
+            return jsonify({
+                'error': 'topics must be a non-empty list'
+            }), 400
+        
+        if not isinstance(documents, list) or len(documents) == 0:
+            return jsonify({
+                'error': 'documents must be a non-empty list'
+            }), 400
+        
+        error = _validate_search_params(top_k, min_score)
+        if error:
+            return jsonify({
+                'error': error
+            }), 400
+        
+        # Generate embeddings for topics and documents in one scheduled call
+        embeddings, _ = encode_texts(topics + documents, normalize=True, model_name=model_name)
+        
+        # One topics x documents product; only reasonably relevant content (>= min_score) is kept
+        with request_timing.phase('search'):
+            matches = top_k_search(embeddings[:len(topics)], embeddings[len(topics):], top_k, min_score=min_score)
+        
+        results = []
+        for topic, (indices, scores) in zip(topics, matches):
+            results.append({
+                'topic': topic,
+                'documents': [
+                    {'text': documents[idx], 'index': idx, 'score': score}
+                    for idx, score in zip(indices.tolist(), scores.tolist())
+                ]
+            })
+        
+        return jsonify({
+            'relevant_content': results,
+            'model': model_name,
+            'total_topics': len(topics),
+            'total_documents': len(documents)
+        })
+        
+    except ModelNotAllowedError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error finding relevant content: {str(e)}")
+        return jsonify({
+            'error': f'Failed to find relevant content: {str(e)}'
+        }), 500
+
+
+@app.route('/cluster-content', methods=['POST'])
+def cluster_content():
+    """
+    Cluster similar content together for better question generation.
+    
+    Documents are grouped by cosine similarity with spherical k-means. The
+    vectors come from one of:
+    - "documents": texts, encoded through the embedding cache
+    - "embeddings": pre-computed vectors (list or packed), with optional
+      "documents" holding the matching texts
+    - "index": a stored collection (optionally filtered with "where"), so a
+      whole curriculum is clustered without re-encoding it
+    
+    Request body:
+    {
+        "documents": ["doc1", "doc2", ...],
+        "num_clusters": 5 | "auto" (optional, default: 5),
+        "min_clusters": 2, "max_clusters": 20 (optional, range for "auto"),
+        "include_documents": true (optional, list every member per cluster),
+        "include_centroids": false (optional, add each cluster's centroid),
+        "model": "model name" (optional)
+    }
+    
+    Response:
+    {
+        "clusters": [
+            {
+                "cluster_id": 0,
+                "size": n,
+                "cohesion": 0.71,
+                "representative": {"text": "...", "index": 3, "score": 0.88},
+                "centroid": [...] (with include_centroids),
+                "documents": [{"text": "...", "index": 0}, ...]
+            }
+        ],
+        "num_clusters": k,
+        "k_selection": {"scores": {"2": 0.08, ...}, "chosen": k} (with "auto")
+    }
+    
+    Clusters are ordered by size, largest first. The representative is the
+    member closest to the centroid; cohesion is the members' mean similarity
+    to the centroid.
+    """
+    try:
+        data = read_request_data()
+        
+        if not data or not any(key in data for key in ('documents', 'embeddings', 'index')):
+            return jsonify({
+                'error': 'Missing documents, embeddings or index in request body'
+            }), 400
+        
+        documents = data.get('documents')
+        ids = None
+        if documents is not None and (not isinstance(documents, list) or not all(isinstance(d, str) for d in documents)):
+            return jsonify({
+                'error': 'documents must be a list of strings'
+            }), 400
+        
+        if 'index' in data:
+            collection = vector_store.get(data['index'])
+            if collection is None:
+                return jsonify({
+                    'error': f"Index '{data['index']}' not found"
+                }), 404
+            with collection.reading():
+                mask = collection.mask(data.get('where'))
+                rows = np.flatnonzero(mask) if mask is not None else np.arange(collection.count)
+                embeddings = np.asarray(collection.vectors[rows], dtype=np.float32)
+                ids = [collection.ids[row] for row in rows]
+                documents = [collection.documents[row] for row in rows]
+            model_name = collection.model
+        elif 'embeddings' in data:
+            embeddings = decode_array(data['embeddings'], ndim=2)
+            if documents is not None and len(documents) != len(embeddings):
+                return jsonify({
+                    'error': 'documents and embeddings must have the same length'
+                }), 400
+            model_name = data.get('model')
+        else:
+            model_name = model_registry.resolve(data.get('model'))
+            embeddings, _ = encode_texts(documents, normalize=True, model_name=model_name)
+        
+        count = len(embeddings)
+        if count == 0:
+            return jsonify({
+                'error': 'Nothing to cluster'
+            }), 400
+        
+        num_clusters = data.get('num_clusters', 5)
+        min_clusters = data.get('min_clusters', 2)
+        max_clusters = data.get('max_clusters', 20)
+        for name, value in (('min_clusters', min_clusters), ('max_clusters', max_clusters)):
+            if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+                return jsonify({
+                    'error': f'{name} must be a positive integer'
+                }), 400
+        
+        k_selection = None
+        with request_timing.phase('cluster'):
+            vectors = normalize_rows(embeddings)
+            if num_clusters == 'auto':
+                min_clusters = max(2, min_clusters)
+                max_clusters = min(max_clusters, count - 1, MAX_CLUSTERS)
+                if max_clusters < min_clusters:
+                    num_clusters = min(min_clusters, count)
+                else:
+                    num_clusters, scores = choose_k(vectors, candidate_ks(min_clusters, max_clusters))
+                    k_selection = {
+                        'scores': {str(k): round(score, 4) for k, score in scores.items()},
+                        'chosen': num_clusters
+                    }
+            elif isinstance(num_clusters, bool) or not isinstance(num_clusters, int) or num_clusters < 1:
+                return jsonify({
+                    'error': 'num_clusters must be a positive integer or "auto"'
+                }), 400
+            num_clusters = min(num_clusters, count, MAX_CLUSTERS)
+            centroids, labels, similarities = spherical_kmeans(vectors, num_clusters)
+        
+        include_documents = data.get('include_documents', True)
+        include_centroids = data.get('include_centroids', False)
+        
+        def describe(position):
+            entry = {'index': int(position)}
+            if documents is not None:
+                entry['text'] = documents[position]
+            if ids is not None:
+                entry['id'] = ids[position]
+            return entry
+        
+        # Members of each cluster, grouped with one sort
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        clusters = []
+        for cluster_id in range(len(centroids)):
+            members = order[bounds[cluster_id]:bounds[cluster_id + 1]]
+            if len(members) == 0:
+                continue
+            best = members[np.argmax(similarities[members])]
+            cluster = {
+                'cluster_id': cluster_id,
+                'size': int(len(members)),
+                'cohesion': round(float(similarities[members].mean()), 4),
+                'representative': {**describe(best), 'score': round(float(similarities[best]), 4)}
+            }
+            if include_centroids:
+                cluster['centroid'] = centroids[cluster_id].tolist()
+            if include_documents:
+                cluster['documents'] = [describe(position) for position in members]
+            clusters.append(cluster)
+        
+        clusters.sort(key=lambda cluster: -cluster['size'])
+        for cluster_id, cluster in enumerate(clusters):
+            cluster['cluster_id'] = cluster_id
+        
+        response = {
+            'clusters': clusters,
+            'num_clusters': len(clusters),
+            'total_documents': count,
+            'model': model_name
+        }
+        if k_selection is not None:
+            response['k_selection'] = k_selection
+        return jsonify(response)
+        
+    except (ModelNotAllowedError, WireFormatError, CollectionError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error clustering content: {str(e)}")
+        return jsonify({
+            'error': f'Failed to cluster content: {str(e)}'
+        }), 500
+
+
+@app.route('/index', methods=['GET'])
+def list_indexes():
+    """
+    List stored vector collections.
+    
+    Response:
+    {
+        "collections": [{"name": "...", "count": n, "dimension": d, "model": "..."}]
+    }
+    """
+    try:
+        return jsonify({'collections': vector_store.list()})
+    except Exception as e:
+        logger.error(f"Error listing indexes: {str(e)}")
+        return jsonify({
+            'error': f'Failed to list indexes: {str(e)}'
+        }), 500
+
+
+@app.route('/index/<name>', methods=['GET'])
+def get_index_info(name):
+    """
+    Get size, dimension and model of a stored vector collection.
+    """
+    try:
+        collection = vector_store.get(name)
+        if collection is None:
+            return jsonify({
+                'error': f"Index '{name}' not found"
+            }), 404
+        return jsonify(collection.info())
+    except CollectionError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
+
+
+@app.route('/index/<name>/upsert', methods=['POST'])
+def upsert_index(name):
+    """
+    Insert or update items in a named vector collection (created on first use).
+    Texts are encoded once here and never again at query time.
+    
+    Request body:
+    {
+        "ids": ["id1", "id2", ...],
+        "texts": ["text1", "text2", ...] (encoded unless embeddings are given),
+        "embeddings": [[...], ...] or packed array (optional),
+        "metadatas": [{...}, {...}, ...] (optional),
+        "model": "model name" (optional; encodes texts, or labels given embeddings)
+    }
+    
+    Response:
+    {
+        "index": "name",
+        "inserted": n,
+        "updated": m,
+        "count": total
+    }
+    """
+    try:
+        data = read_request_data()
+        
+        if not data or 'ids' not in data:
+            return jsonify({
+                'error': 'Missing ids in request body'
             }), 400
         
-        texts = data['texts']
-        batch_size = data.get('batch_size', 32)
-        normalize = data.get('normalize', True)
+        ids = data['ids']
+        texts = data.get('texts')
+        metadatas = data.get('metadatas')
         
-        if not isinstance(texts, list) or len(texts) == 0:
+        if not isinstance(ids, list) or len(ids) == 0 or not all(isinstance(i, str) for i in ids):
             return jsonify({
-                'error': 'texts must be a non-empty list'
+                'error': 'ids must be a non-empty list of strings'
             }), 400
         
-        if not isinstance(batch_size, int) or batch_size < 1:
+        if texts is not None and (not isinstance(texts, list) or not all(isinstance(t, str) for t in texts)):
             return jsonify({
-                'error': 'batch_size must be a positive integer'
+                'error': 'texts must be a list of strings'
             }), 400
         
-        # Validate all texts are strings
-        if not all(isinstance(t, str) for t in texts):
+        if metadatas is not None and (not isinstance(metadatas, list) or not all(isinstance(m, dict) for m in metadatas)):
             return jsonify({
-                'error': 'All items in texts must be strings'
+                'error': 'metadatas must be a list of objects'
             }), 400
         
-        current_model = get_model()
-        all_embeddings = []
-        num_batches = 0
+        if 'embeddings' in data:
+            embeddings = decode_array(data['embeddings'], ndim=2)
+            model_name = data.get('model')
+        elif texts is not None:
+            if len(texts) != len(ids):
+                return jsonify({
+                    'error': 'texts must have one entry per id'
+                }), 400
+            existing = vector_store.get(name)
+            model_name = model_registry.resolve(data.get('model') or (existing.model if existing else None))
+            if existing is not None and existing.model and existing.model != model_name:
+                return jsonify({
+                    'error': f"Index '{name}' was built with model '{existing.model}', not '{model_name}'"
+                }), 409
+            embeddings, _ = encode_texts(texts, normalize=True, model_name=model_name)
+        else:
+            return jsonify({
+                'error': 'Provide texts or embeddings'
+            }), 400
         
-        # Process in batches
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            batch_embeddings = current_model.encode(
-                batch, 
-                normalize_embeddings=normalize,
-                show_progress_bar=False
-            )
-            all_embeddings.extend(batch_embeddings.tolist())
-            num_batches += 1
+        collection = vector_store.get(name, create=True)
+        inserted, updated = collection.upsert(ids, embeddings, documents=texts, metadatas=metadatas, model=model_name)
         
         return jsonify({
-            'embeddings': all_embeddings,
-            'model': MODEL_NAME,
-            'num_texts': len(texts),
-            'embedding_dimension': len(all_embeddings[0]) if all_embeddings else 0,
-            'batches_processed': num_batches,
-            'normalized': normalize
+            'index': name,
+            'inserted': inserted,
+            'updated': updated,
+            'count': collection.count
         })
         
+    except (CollectionError, WireFormatError, ModelNotAllowedError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f"Error generating batch embeddings: {str(e)}")
+        logger.error(f"Error upserting into index: {str(e)}")
         return jsonify({
-            'error': f'Failed to generate batch embeddings: {str(e)}'
+            'error': f'Failed to upsert into index: {str(e)}'
         }), 500
 
 
-@app.route('/similarity', methods=['POST'])
-def compute_similarity():
+@app.route('/index/<name>/query', methods=['POST'])
+def query_index(name):
     """
-    Compute cosine similarity between a query and a list of documents.
+    Find the stored items most similar to one or more queries.
     
     Request body:
     {
-        "query": "query text",
-        "documents": ["doc1", "doc2", ...],
-        "top_k": 5 (optional, default: all)
+        "query": "query text" or "queries": ["q1", "q2"],
+        (or "query_embedding": [...] / "query_embeddings": [[...]]),
+        "top_k": 5 (optional, default: 5),
+        "where": {"documentId": "..."} (optional metadata equality filter),
+        "min_score": 0.3 (optional, drop results scoring below this),
+        "mode": "auto" | "exact" | "ann" (optional, default: auto = ann when built),
+        "nprobe": 8 (optional, IVF lists visited per query),
+        "quantization": "int8" | "binary" (optional, search quantized codes),
+        "rescore": true/false (optional, default: true, re-rank candidates with float vectors),
+        "rescore_factor": 4 (optional, candidates kept per result before rescoring; default: 4 int8, 10 binary),
+        "model": "model name" (optional, default: the model the index was built with),
+        "search": "vector" | "lexical" | "hybrid" (optional, default: vector),
+        "candidates": 50 (optional, hybrid: results taken from each ranking; default: max(4 * top_k, 50))
     }
     
     Response:
     {
         "results": [
-            {"document": "doc1", "index": 0, "score": 0.95},
-            ...
+            [{"id": "...", "score": 0.92, "document": "...", "metadata": {...}}, ...]
         ],
-        "query": "query text",
-        "model": "model_name"
+        "index": "name"
     }
+    
+    "results" holds one list per query. Lexical search ranks the documents by
+    BM25 over their words (score is the BM25 score, no query encoding needed);
+    hybrid fuses the vector and BM25 rankings with reciprocal-rank fusion
+    (score is the fused score, plus vector_score and bm25_score). min_score
+    applies to vector scores only.
     """
     try:
-        data = request.get_json()
+        data = read_request_data()
         
-        if not data or 'query' not in data or 'documents' not in data:
+        if not data:
             return jsonify({
-                'error': 'Missing query or documents in request body'
+                'error': 'Missing request body'
             }), 400
         
-        query = data['query']
-        documents = data['documents']
-        top_k = data.get('top_k', len(documents))
+        collection = vector_store.get(name)
+        if collection is None:
+            return jsonify({
+                'error': f"Index '{name}' not found"
+            }), 404
+        
+        top_k = data.get('top_k', 5)
+        min_score = data.get('min_score')
+        where = data.get('where')
+        mode = data.get('mode', 'auto')
+        nprobe = data.get('nprobe')
+        quantization = data.get('quantization')
+        rescore = data.get('rescore', True)
+        rescore_factor = data.get('rescore_factor')
+        search = data.get('search', 'vector')
+        candidates = data.get('candidates')
+        
+        error = _validate_search_params(top_k, min_score)
+        if error:
+            return jsonify({
+                'error': error
+            }), 400
         
-        if not isinstance(query, str) or len(query.strip()) == 0:
+        if mode not in ('auto', 'exact', 'ann'):
             return jsonify({
-                'error': 'query must be a non-empty string'
+                'error': 'mode must be one of auto, exact, ann'
             }), 400
         
-        if not isinstance(documents, list) or len(documents) == 0:
+        if nprobe is not None and (not isinstance(nprobe, int) or nprobe < 1):
             return jsonify({
-                'error': 'documents must be a non-empty list'
+                'error': 'nprobe must be a positive integer'
             }), 400
         
-        current_model = get_model()
+        if quantization not in (None, 'int8', 'binary'):
+            return jsonify({
+                'error': 'quantization must be int8 or binary'
+            }), 400
+        
+        if rescore_factor is not None and (not isinstance(rescore_factor, int) or rescore_factor < 1):
+            return jsonify({
+                'error': 'rescore_factor must be a positive integer'
+            }), 400
         
-        # Generate embeddings
-        query_embedding = current_model.encode(query, normalize_embeddings=True)
-        doc_embeddings = current_model.encode(documents, normalize_embeddings=True)
+        if where is not None and not isinstance(where, dict):
+            return jsonify({
+                'error': 'where must be an object'
+            }), 400
         
-        # Compute cosine similarities
-        similarities = np.dot(doc_embeddings, query_embedding)
+        if search not in ('vector', 'lexical', 'hybrid'):
+            return jsonify({
+                'error': 'search must be one of vector, lexical, hybrid'
+            }), 400
         
-        # Sort by similarity score (descending)
-        sorted_indices = np.argsort(similarities)[::-1][:top_k]
+        if candidates is not None and (not isinstance(candidates, int) or candidates < 1):
+            return jsonify({
+                'error': 'candidates must be a positive integer'
+            }), 400
         
-        results = []
-        for idx in sorted_indices:
-            results.append({
-                'document': documents[idx],
-                'index': int(idx),
-                'score': float(similarities[idx])
+        if search != 'vector':
+            queries = data.get('queries', [data['query']] if 'query' in data else None)
+            if not isinstance(queries, list) or len(queries) == 0 or not all(isinstance(q, str) for q in queries):
+                return jsonify({
+                    'error': 'Lexical and hybrid search need query or queries text'
+                }), 400
+        
+        if search == 'lexical':
+            with collection.lock, request_timing.phase('search'):
+                matches = collection.lexical_query(queries, top_k=top_k, where=where)
+                results = [
+                    [dict(collection.record(row), score=score) for row, score in query_matches]
+                    for query_matches in matches
+                ]
+            return jsonify({
+                'results': results,
+                'index': name,
+                'total_documents': collection.count,
+                'top_k': top_k,
+                'search': 'bm25'
             })
         
+        if 'query_embedding' in data or 'query_embeddings' in data:
+            raw = data.get('query_embeddings', data.get('query_embedding'))
+            query_vectors = normalize_rows(decode_array(raw))
+        else:
+            queries = data.get('queries', [data['query']] if 'query' in data else None)
+            if not isinstance(queries, list) or len(queries) == 0 or not all(isinstance(q, str) for q in queries):
+                return jsonify({
+                    'error': 'Provide query, queries, query_embedding or query_embeddings'
+                }), 400
+            # Text queries are encoded with the collection's own model unless told otherwise
+            model_name = model_registry.resolve(data.get('model') or collection.model)
+            if collection.model and collection.model != model_name:
+                return jsonify({
+                    'error': f"Index '{name}' was built with model '{collection.model}', not '{model_name}'"
+                }), 409
+            query_vectors, _ = encode_texts(queries, normalize=True, model_name=model_name)
+        
+        # Hybrid search fuses longer vector and BM25 rankings than the results it returns
+        depth = top_k if search == 'vector' else (candidates or max(4 * top_k, 50))
+        with collection.lock, request_timing.phase('search'):
+            matches = collection.query(
+                query_vectors, top_k=depth, where=where, mode=mode, nprobe=nprobe, min_score=min_score,
+                quantization=quantization, rescore=bool(rescore), rescore_factor=rescore_factor
+            )
+            if search == 'vector':
+                results = [
+                    [dict(collection.record(row), score=score) for row, score in query_matches]
+                    for query_matches in matches
+                ]
+            else:
+                lexical_matches = collection.lexical_query(queries, top_k=depth, where=where)
+                results = []
+                for vector_hits, lexical_hits in zip(matches, lexical_matches):
+                    vector_scores = dict(vector_hits)
+                    bm25_scores = dict(lexical_hits)
+                    fused = reciprocal_rank_fusion(
+                        [[row for row, _ in vector_hits], [row for row, _ in lexical_hits]], top_k
+                    )
+                    results.append([
+                        dict(
+                            collection.record(row), score=score,
+                            vector_score=vector_scores.get(row), bm25_score=bm25_scores.get(row)
+                        )
+                        for row, score in fused
+                    ])
+        
+        vector_search = quantization or ('exact' if mode == 'exact' or collection.ann is None else 'ann')
         return jsonify({
             'results': results,
-            'query': query,
-            'model': MODEL_NAME,
-            'total_documents': len(documents),
-            'top_k': top_k
+            'index': name,
+            'total_documents': collection.count,
+            'top_k': top_k,
+            'search': vector_search if search == 'vector' else f'hybrid ({vector_search} + bm25)'
         })
         
+    except (CollectionError, WireFormatError, ModelNotAllowedError) as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f"Error computing similarity: {str(e)}")
+        logger.error(f"Error querying index: {str(e)}")
         return jsonify({
-            'error': f'Failed to compute similarity: {str(e)}'
+            'error': f'Failed to query index: {str(e)}'
         }), 500
 
 
-@app.route('/similarity/embeddings', methods=['POST'])
-def compute_similarity_from_embeddings():
+@app.route('/index/<name>/ann', methods=['POST', 'DELETE'])
+def build_index_ann(name):
     """
-    Compute cosine similarity between pre-computed embeddings.
-    Useful when you have cached embeddings in ChromaDB.
+    Build (POST) or drop (DELETE) an IVF approximate nearest-neighbour index
+    for a stored collection. Items upserted later are assigned to the
+    existing lists; rebuild after large changes to rebalance them.
     
-    Request body:
+    Request body (POST, all optional):
     {
-        "query_embedding": [...],
-        "document_embeddings": [[...], [...], ...],
-        "top_k": 5 (optional, default: all)
+        "nlist": 400 (default: ~4 * sqrt(count)),
+        "nprobe": 8 (default lists visited per query)
     }
     
     Response:
     {
-        "results": [
-            {"index": 0, "score": 0.95},
-            ...
-        ]
+        "index": "name",
+        "ann": {"type": "ivf", "nlist": 400, "nprobe": 8, ...}
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'query_embedding' not in data or 'document_embeddings' not in data:
+        collection = vector_store.get(name)
+        if collection is None:
             return jsonify({
-                'error': 'Missing query_embedding or document_embeddings in request body'
-            }), 400
-        
-        query_embedding = np.array(data['query_embedding'])
-        doc_embeddings = np.array(data['document_embeddings'])
-        top_k = data.get('top_k', len(doc_embeddings))
-        
-        # Normalize embeddings for cosine similarity
-        query_norm = query_embedding / np.linalg.norm(query_embedding)
-        doc_norms = doc_embeddings / np.linalg.norm(doc_embeddings, axis=1, keepdims=True)
+                'error': f"Index '{name}' not found"
+            }), 404
         
-        # Compute cosine similarities
-        similarities = np.dot(doc_norms, query_norm)
+        if request.method == 'DELETE':
+            collection.drop_ann()
+            return jsonify({'index': name, 'ann': None})
         
-        # Sort by similarity score (descending)
-        sorted_indices = np.argsort(similarities)[::-1][:top_k]
-        
-        results = []
-        for idx in sorted_indices:
-            results.append({
-                'index': int(idx),
-                'score': float(similarities[idx])
-            })
+        data = read_request_data() or {}
+        nlist = data.get('nlist')
+        nprobe = data.get('nprobe', 8)
         
-        return jsonify({
-            'results': results,
-            'total_documents': len(doc_embeddings),
-            'top_k': top_k
-        })
+        if nlist is not None and (not isinstance(nlist, int) or nlist < 1):
+            return jsonify({
+                'error': 'nlist must be a positive integer'
+            }), 400
         
-    except Exception as e:
-        logger.error(f"Error computing similarity from embeddings: {str(e)}")
-        return jsonify({
-            'error': f'Failed to compute similarity: {str(e)}'
-        }), 500
-
-
-@app.route('/model/info', methods=['GET'])
-def get_model_info():
-    """
-    Get detailed information about the loaded model.
-    
-    Response:
-    {
-        "model_name": "all-MiniLM-L6-v2",
-        "embedding_dimension": 384,
-        "max_seq_length": 256,
-        "tokenizer_info": {...}
-    }
-    """
-    try:
-        current_model = get_model()
+        if not isinstance(nprobe, int) or nprobe < 1:
+            return jsonify({
+                'error': 'nprobe must be a positive integer'
+            }), 400
         
         return jsonify({
-            'model_name': MODEL_NAME,
-            'embedding_dimension': current_model.get_sentence_embedding_dimension(),
-            'max_seq_length': current_model.max_seq_length,
-            'available_models': [
-                {
-                    'name': 'all-MiniLM-L6-v2',
-                    'dimensions': 384,
-                    'description': 'Fast and good quality (default)'
-                },
-                {
-                    'name': 'all-mpnet-base-v2',
-                    'dimensions': 768,
-                    'description': 'Better quality, slower'
-                },
-                {
-                    'name': 'multi-qa-MiniLM-L6-cos-v1',
-                    'dimensions': 384,
-                    'description': 'Optimized for Q&A tasks'
-                },
-                {
-                    'name': 'paraphrase-multilingual-MiniLM-L12-v2',
-                    'dimensions': 384,
-                    'description': 'Multilingual support'
-                }
-            ]
+            'index': name,
+            'ann': collection.build_ann(nlist=nlist, nprobe=nprobe)
         })
         
-    except Exception as e:
-        logger.error(f"Error getting model info: {str(e)}")
-        return jsonify({
-            'error': f'Failed to get model info: {str(e)}'
-        }), 500
-
-
-@app.route('/health', methods=['GET'])
-def health_check():
-    """
-    Health check endpoint with detailed status.
-    
-    Response:
-    {
-        "status": "healthy",
-        "model": "model_name",
-        "embedding_dimension": d,
-        "model_loaded": true/false
-    }
-    """
-    try:
-        current_model = get_model()
+    except CollectionError as e:
         return jsonify({
-            'status': 'healthy',
-            'model': MODEL_NAME,
-            'embedding_dimension': current_model.get_sentence_embedding_dimension(),
-            'model_loaded': model is not None,
-            'max_seq_length': current_model.max_seq_length
-        })
+            'error': str(e)
+        }), 400
     except Exception as e:
+        logger.error(f"Error building ANN index: {str(e)}")
         return jsonify({
-            'status': 'unhealthy',
-            'error': str(e),
-            'model_loaded': model is not None
+            'error': f'Failed to build ANN index: {str(e)}'
         }), 500
 
 
-@app.route('/find-relevant-content', methods=['POST'])
-def find_relevant_content():
+@app.route('/index/<name>/delete', methods=['POST'])
+def delete_from_index(name):
     """
-    Find relevant content from a set of documents based on topics.
-    This endpoint helps identify the most relevant curriculum content
-    for generating assessment questions.
+    Delete items from a stored vector collection.
     
     Request body:
     {
-        "topics": ["topic1", "topic2"],
-        "documents": ["doc1 text", "doc2 text", ...],
-        "top_k": 10 (optional, default: 10)
+        "ids": ["id1", ...] (optional),
+        "where": {"documentId": "..."} (optional)
     }
     
     Response:
     {
-        "relevant_content": [
-            {
-                "topic": "topic1",
-                "documents": [
-                    {"text": "...", "index": 0, "score": 0.95},
-                    ...
-                ]
-            }
-        ]
+        "index": "name",
+        "deleted": n,
+        "count": remaining
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'topics' not in data or 'documents' not in data:
-            return jsonify({
-                'error': 'Missing topics or documents in request body'
-            }), 400
-        
-        topics = data['topics']
-        documents = data['documents']
-        top_k = data.get('top_k', 10)
+        data = read_request_data()
         
-        if not isinstance(topics, list) or len(topics) == 0:
+        if not data or ('ids' not in data and 'where' not in data):
             return jsonify({
-                'error': 'topics must be a non-empty list'
+                'error': 'Provide ids or where in request body'
             }), 400
         
-        if not isinstance(documents, list) or len(documents) == 0:
+        collection = vector_store.get(name)
+        if collection is None:
             return jsonify({
-                'error': 'documents must be a non-empty list'
-            }), 400
-        
-        current_model = get_model()
-        
-        # Generate embeddings for documents
-        doc_embeddings = current_model.encode(documents, normalize_embeddings=True)
-        
-        results = []
+                'error': f"Index '{name}' not found"
+            }), 404
         
-        for topic in topics:
-            # Generate embedding for topic
-            topic_embedding = current_model.encode(topic, normalize_embeddings=True)
-            
-            # Compute similarities
-            similarities = np.dot(doc_embeddings, topic_embedding)
-            
-            # Get top k indices
-            sorted_indices = np.argsort(similarities)[::-1][:top_k]
-            
-            topic_results = []
-            for idx in sorted_indices:
-                if similarities[idx] > 0.3:  # Only include reasonably relevant content
-                    topic_results.append({
-                        'text': documents[idx],
-                        'index': int(idx),
-                        'score': float(similarities[idx])
-                    })
-            
-            results.append({
-                'topic': topic,
-                'documents': topic_results
-            })
+        deleted = collection.delete(ids=data.get('ids'), where=data.get('where'))
         
         return jsonify({
-            'relevant_content': results,
-            'model': MODEL_NAME,
-            'total_topics': len(topics),
-            'total_documents': len(documents)
+            'index': name,
+            'deleted': deleted,
+            'count': collection.count
         })
         
+    except CollectionError as e:
+        return jsonify({
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f"Error finding relevant content: {str(e)}")
+        logger.error(f"Error deleting from index: {str(e)}")
         return jsonify({
-            'error': f'Failed to find relevant content: {str(e)}'
+            'error': f'Failed to delete from index: {str(e)}'
         }), 500
 
 
-@app.route('/cluster-content', methods=['POST'])
-def cluster_content():
+@app.route('/index/<name>/migrate', methods=['GET', 'POST', 'DELETE'])
+def migrate_index(name):
     """
-    Cluster similar content together for better question generation.
+    Re-encode a stored collection with another model in the background.
+    The texts are encoded into a shadow collection; when it is complete,
+    <name> is switched to it in one atomic step (the old collection stays
+    available as <name>__previous). Progress is checkpointed: POST the same
+    request again after a crash or a DELETE to resume.
     
-    Request body:
+    POST starts or resumes, GET reports progress, DELETE stops.
+    
+    Request body (POST):
     {
-        "documents": ["doc1", "doc2", ...],
-        "num_clusters": 5 (optional)
+        "model": "all-mpnet-base-v2",
+        "batch_size": 256 (optional, texts per checkpoint),
+        "cpu_share": 0.5 (optional, default MIGRATION_CPU_SHARE)
     }
     
     Response:
     {
-        "clusters": [
-            {
-                "cluster_id": 0,
-                "documents": [{"text": "...", "index": 0}, ...]
-            }
-        ]
+        "index": "name",
+        "state": "running" | "stopped" | "completed" | "failed" | "interrupted",
+        "source": "name", "target": "name__all-mpnet-base-v2",
+        "model": "...", "source_model": "...",
+        "total": n, "cursor": m, "encoded": k, "reused": r, ...
     }
     """
     try:
-        from sklearn.cluster import KMeans
+        if request.method == 'GET':
+            model = request.args.get('model')
+            status = read_status(vector_store, name, model_registry.resolve(model) if model else None)
+            if status is None:
+                return jsonify({
+                    'error': f"No migration found for index '{name}'"
+                }), 404
+            return jsonify(status)
+        
+        if request.method == 'DELETE':
+            with _migrations_lock:
+                job = _migrations.get(name)
+            if job is None or not job.is_running():
+                return jsonify({
+                    'error': f"No migration of index '{name}' is running in this process"
+                }), 404
+            job.stop()
+            return jsonify({'index': name, 'state': 'stopping'})
+        
+        data = read_request_data()
+        if not data or 'model' not in data:
+            return jsonify({
+                'error': 'Missing model in request body'
+            }), 400
         
-        data = request.get_json()
+        batch_size = data.get('batch_size', STREAM_BATCH_SIZE)
+        cpu_share = data.get('cpu_share', MIGRATION_CPU_SHARE)
         
-        if not data or 'documents' not in data:
+        if not isinstance(batch_size, int) or batch_size < 1:
             return jsonify({
-                'error': 'Missing documents in request body'
+                'error': 'batch_size must be a positive integer'
             }), 400
         
-        documents = data['documents']
-        num_clusters = data.get('num_clusters', min(5, len(documents)))
-        
-        if len(documents) < num_clusters:
-            num_clusters = len(documents)
+        if not isinstance(cpu_share, (int, float)) or not 0 < cpu_share <= 1:
+            return jsonify({
+                'error': 'cpu_share must be a number in (0, 1]'
+            }), 400
         
-        current_model = get_model()
+        model_name = model_registry.resolve(data['model'])
+        if vector_store.get(name) is None:
+            return jsonify({
+                'error': f"Index '{name}' not found"
+            }), 404
+        
+        scheduler = get_pipeline(model_name)[1]
+        
+        def live_requests_waiting():
+            with _pipelines_lock:
+                schedulers = [pipeline[1] for pipeline in _pipelines.values()]
+            return any(s.queue_depth() > 0 for s in schedulers)
+        
+        with _migrations_lock:
+            running = _migrations.get(name)
+            if running is not None and running.is_running():
+                return jsonify({
+                    'error': f"A migration of index '{name}' is already running",
+                    'status': running.status
+                }), 409
+            # Through the model's scheduler: its batches share forward passes with live requests
+            job = MigrationJob(
+                vector_store, name, model_name,
+                encode=lambda texts: scheduler.submit(texts, normalize=True),
+                batch_size=batch_size,
+                cpu_share=float(cpu_share),
+                is_busy=live_requests_waiting
+            )
+            status = job.start()
+            _migrations[name] = job
         
-        # Generate embeddings
-        embeddings = current_model.encode(documents, normalize_embeddings=True)
-        
-        # Cluster embeddings
-        kmeans = KMeans(n_clusters=num_clusters, random_state=42, n_init=10)
-        cluster_labels = kmeans.fit_predict(embeddings)
-        
-        # Organize results by cluster
-        clusters = {}
-        for idx, label in enumerate(cluster_labels):
-            label = int(label)
-            if label not in clusters:
-                clusters[label] = []
-            clusters[label].append({
-                'text': documents[idx],
-                'index': idx
-            })
+        logger.info(f"Migrating index '{name}' to '{model_name}' ({status['cursor']}/{status['total']} done)")
+        return jsonify(status), 202
         
+    except MigrationRunningError as e:
         return jsonify({
-            'clusters': [
-                {'cluster_id': cid, 'documents': docs}
-                for cid, docs in sorted(clusters.items())
-            ],
-            'num_clusters': num_clusters,
-            'total_documents': len(documents)
-        })
-        
-    except ImportError:
+            'error': str(e)
+        }), 409
+    except (CollectionError, ModelNotAllowedError) as e:
         return jsonify({
-            'error': 'scikit-learn is required for clustering. Install with: pip install scikit-learn'
-        }), 500
+            'error': str(e)
+        }), 400
     except Exception as e:
-        logger.error(f"Error clustering content: {str(e)}")
+        logger.error(f"Error migrating index: {str(e)}")
         return jsonify({
-            'error': f'Failed to cluster content: {str(e)}'
+            'error': f'Failed to migrate index: {str(e)}'
         }), 500
 
 
@@ -646,7 +3074,7 @@ def home():
     return jsonify({
         'message': 'Embedding API is running',
         'version': '1.0.0',
-        'model': MODEL_NAME,
+        'model': model_registry.default_model,
         'endpoints': {
             '/embed': {
                 'method': 'POST',
@@ -661,7 +3089,7 @@ def home():
             '/embed/batch': {
                 'method': 'POST',
                 'description': 'Generate embeddings for large batches with chunking',
-                'body': '{"texts": [...], "batch_size": 32, "normalize": true}'
+                'body': '{"texts": [...], "batch_size": 256, "normalize": true, "stream": false}'
             },
             '/similarity': {
                 'method': 'POST',
@@ -678,18 +3106,88 @@ def home():
                 'description': 'Find relevant content from documents based on topics',
                 'body': '{"topics": [...], "documents": [...], "top_k": 10}'
             },
+            '/ingest': {
+                'method': 'POST',
+                'description': 'Extract, chunk and embed a PDF page by page (NDJSON stream or stored in an index)',
+                'body': 'multipart/form-data: file=<pdf>, index=<name> (optional)'
+            },
+            '/jobs/embed': {
+                'method': 'POST',
+                'description': 'Queue a large embedding job; poll /jobs/<id>, fetch /jobs/<id>/embeddings?start=&end=',
+                'body': '{"texts": [...], "normalize": true}'
+            },
+            '/chroma/add': {
+                'method': 'POST',
+                'description': 'Encode chunks and write them straight into a Chroma collection (chromaManager.js layout)',
+                'body': '{"chunks": [...], "documentId": "...", "fileName": "..."}'
+            },
+            '/chunk': {
+                'method': 'POST',
+                'description': "Split text into sentence-aligned chunks that fit the model's max_seq_length",
+                'body': '{"text": "...", "max_tokens": 256, "overlap_tokens": 32}'
+            },
             '/cluster-content': {
                 'method': 'POST',
                 'description': 'Cluster similar content together',
-                'body': '{"documents": [...], "num_clusters": 5}'
+                'body': '{"documents": [...] | "embeddings": [[...]] | "index": "name", "num_clusters": 5 | "auto"}'
             },
             '/model/info': {
                 'method': 'GET',
                 'description': 'Get model information and available models'
             },
+            '/model/default': {
+                'method': 'POST',
+                'description': 'Switch the default model without dropping in-flight requests',
+                'body': '{"model": "all-mpnet-base-v2"}'
+            },
             '/health': {
                 'method': 'GET',
                 'description': 'Health check endpoint'
+            },
+            '/health/live': {
+                'method': 'GET',
+                'description': 'Liveness probe (answers while the model loads)'
+            },
+            '/health/ready': {
+                'method': 'GET',
+                'description': 'Readiness probe (200 once the model is loaded and warmed up)'
+            },
+            '/index/<name>/upsert': {
+                'method': 'POST',
+                'description': 'Encode and store items in a persistent named collection',
+                'body': '{"ids": [...], "texts": [...], "metadatas": [...]}'
+            },
+            '/index/<name>/query': {
+                'method': 'POST',
+                'description': 'Query a stored collection (vector, BM25 lexical or hybrid search)',
+                'body': '{"query": "...", "top_k": 5, "where": {...}, "search": "vector|lexical|hybrid"}'
+            },
+            '/index/<name>/ann': {
+                'method': 'POST',
+                'description': 'Build an IVF approximate nearest-neighbour index for a collection',
+                'body': '{"nlist": 400, "nprobe": 8}'
+            },
+            '/index/<name>/delete': {
+                'method': 'POST',
+                'description': 'Delete items from a stored collection',
+                'body': '{"ids": [...]} or {"where": {...}}'
+            },
+            '/index/<name>/migrate': {
+                'method': 'POST | GET | DELETE',
+                'description': 'Re-encode a collection with another model in the background, then switch to it',
+                'body': '{"model": "all-mpnet-base-v2", "cpu_share": 0.5}'
+            },
+            '/cache/stats': {
+                'method': 'GET',
+                'description': 'Embedding cache hit/miss statistics'
+            },
+            '/scheduler/stats': {
+                'method': 'GET',
+                'description': 'Micro-batching scheduler statistics'
+            },
+            '/metrics': {
+                'method': 'GET',
+                'description': 'Prometheus metrics (request latency, batch sizes, throughput, cache hit rate)'
             }
         }
     })
@@ -711,6 +3209,26 @@ def server_error(e):
     }), 500
 
 
+# Start loading the default model (see MODEL_WARMUP). Placed last so the
+# warm-up thread only sees a fully initialised module.
+if MODEL_WARMUP == 'eager':
+    warm_up()
+elif MODEL_WARMUP == 'lazy':
+    _startup['state'] = 'ready'
+else:
+    threading.Thread(target=warm_up, name='model-warmup', daemon=True).start()
+
+# Pick up queued jobs, including those left behind by a previous run. A preloading
+# gunicorn master must not run them (threads do not survive the fork), so
+# gunicorn.conf.py turns this off there and starts the pool in each worker.
+if os.getenv('JOBS_AUTOSTART', 'True').lower() == 'true':
+    job_workers.start()
+
+# Likewise for the thread that writes this worker's metrics to METRICS_DIR
+if os.getenv('METRICS_AUTOSTART', 'True').lower() == 'true':
+    metrics.start()
+
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'False').lower() == 'true'
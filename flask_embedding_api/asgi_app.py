@@ -0,0 +1,419 @@
+"""
+ASGI entry point for the embedding API.
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+    WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi_app:app
+
+Serves the same routes and payloads as app.py. Connection handling moves
+onto an event loop:
+
+- /embed, /embed/single and /embed/batch are coroutines: the body is parsed
+  and validated, and the response serialized and written, on the loop; only
+  encode_texts (and dedup/numpy packing) runs in a bounded compute pool
+  (ASGI_COMPUTE_THREADS). torch and numpy release the GIL while they work
+- every other route runs the Flask app in a pool thread, never on the loop.
+  That thread also iterates the response body (so stream_with_context
+  generators run where their request context was pushed) and hands chunks
+  to the loop through a small queue
+- cheap metadata routes (/health, stats, /metrics) use their own small pool,
+  so they stay fast while the compute pool is busy (and a lazy model load
+  behind /health does not block the loop)
+- when more than ASGI_MAX_PENDING requests are waiting for the compute pool,
+  new compute requests get 503 instead of queueing without bound
+
+Requires: pip install uvicorn
+"""
+
+import asyncio
+import contextvars
+import functools
+import io
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import Response, jsonify
+
+from app import (
+    CollectionError, ModelNotAllowedError, WireFormatError, _batch_duplicates, _batch_event, _batch_index,
+    _batch_result, _batch_summary, _embed_result, _encode_batch, _parse_batch_request, _parse_embed_request,
+    _parse_single_request, _referenced, _register_batch_document, _single_result, app as flask_app,
+    encode_texts, read_request_data
+)
+
+logger = logging.getLogger(__name__)
+
+# GET routes that only read in-memory state and never touch the model's forward pass
+CONTROL_ROUTES = ('/', '/health', '/health/live', '/health/ready', '/cache/stats', '/scheduler/stats', '/metrics')
+
+_END = object()
+
+# Chunks a streamed response may run ahead of a slow client
+STREAM_QUEUE_SIZE = 8
+
+
+class AsgiEmbeddingApp:
+    """Serve the embedding routes from an event loop, offloading compute to a thread pool."""
+
+    def __init__(self, wsgi_app, compute_threads=4, max_pending=256, control_routes=CONTROL_ROUTES,
+                 control_threads=2):
+        self.wsgi_app = wsgi_app
+        self.compute_threads = compute_threads
+        self.max_pending = max_pending
+        self.control_routes = set(control_routes)
+        self.executor = ThreadPoolExecutor(max_workers=compute_threads, thread_name_prefix='asgi-compute')
+        self.control_executor = ThreadPoolExecutor(max_workers=control_threads, thread_name_prefix='asgi-control')
+        self.pending = 0
+        self.native_routes = {
+            '/embed': self._embed,
+            '/embed/single': self._embed_single,
+            '/embed/batch': self._embed_batch
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        control = scope['method'] in ('GET', 'HEAD') and scope['path'] in self.control_routes
+        if not control and self.pending >= self.max_pending:
+            await self._send_error(send, 503, 'Server is busy, retry later')
+            return
+
+        body = await self._read_body(receive)
+        environ = self._environ(scope, body)
+        handler = self.native_routes.get(scope['path']) if scope['method'] == 'POST' else None
+        if control:
+            await self._run_wsgi(environ, send, self.control_executor)
+            return
+        self.pending += 1
+        try:
+            if handler is not None:
+                await self._run_native(handler, environ, receive, send)
+            else:
+                await self._run_wsgi(environ, send, self.executor)
+        finally:
+            self.pending -= 1
+
+    async def compute(self, function, *args, **kwargs):
+        """
+        Run function in the compute pool. It sees the caller's request context
+        (g, request timings, the profiler) through a copy of the context vars.
+        """
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, function, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    async def _run_native(self, handler, environ, receive, send):
+        """
+        Run a coroutine handler inside a Flask request context pushed on the
+        loop, so read_request_data, negotiate and the before/after request
+        hooks (metrics, Server-Timing) work as they do for Flask views. A
+        handler returns a Flask response value, or an async iterator of
+        NDJSON lines to stream.
+        """
+        ctx = self.wsgi_app.request_context(environ)
+        ctx.push()
+        try:
+            try:
+                rv = self.wsgi_app.preprocess_request()
+                if rv is None:
+                    rv = await handler()
+            except Exception as e:
+                logger.error(f"Error handling {environ['PATH_INFO']}: {str(e)}")
+                rv = jsonify({'error': 'Internal server error'}), 500
+
+            if hasattr(rv, '__aiter__'):
+                response = self.wsgi_app.process_response(Response(mimetype='application/x-ndjson'))
+                await self._send_start(send, response)
+                await self._send_lines(rv, receive, send)
+                return
+            response = self.wsgi_app.process_response(self.wsgi_app.make_response(rv))
+            await self._send_start(send, response)
+            await send({'type': 'http.response.body', 'body': response.get_data(), 'more_body': False})
+        finally:
+            ctx.pop()
+
+    async def _embed(self):
+        """POST /embed (see app.generate_embeddings)."""
+        try:
+            params, error = _parse_embed_request(read_request_data())
+            if error:
+                return jsonify({'error': error}), 400
+            embeddings, cache_info = await self.compute(
+                encode_texts, params['texts'], normalize=params['normalize'], model_name=params['model_name']
+            )
+            return _embed_result(params, embeddings, cache_info)
+
+        except (WireFormatError, ModelNotAllowedError) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {str(e)}")
+            return jsonify({'error': f'Failed to generate embeddings: {str(e)}'}), 500
+
+    async def _embed_single(self):
+        """POST /embed/single (see app.generate_single_embedding)."""
+        try:
+            params, error = _parse_single_request(read_request_data())
+            if error:
+                return jsonify({'error': error}), 400
+            embeddings, cache_info = await self.compute(
+                encode_texts, params['texts'], normalize=params['normalize'], model_name=params['model_name']
+            )
+            return _single_result(params, embeddings, cache_info)
+
+        except (WireFormatError, ModelNotAllowedError) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"Error generating single embedding: {str(e)}")
+            return jsonify({'error': f'Failed to generate embedding: {str(e)}'}), 500
+
+    async def _embed_batch(self):
+        """POST /embed/batch (see app.generate_batch_embeddings)."""
+        try:
+            data = read_request_data()
+            params, error = _parse_batch_request(data)
+            if error:
+                return jsonify({'error': error}), 400
+
+            # Opening the collection reads files and may wait for another process's write lock
+            target = await self.compute(_batch_index, data, params['texts'], params['model_name'])
+            roots, deduplicator = await self.compute(_batch_duplicates, params, target)
+
+            if params['stream']:
+                return self._stream_batches(params, roots, deduplicator, target)
+
+            all_embeddings = []
+            cache = {'hits': 0, 'misses': 0}
+            stored = {}
+            keep = _referenced(roots)
+            for start in range(0, len(params['texts']), params['batch_size']):
+                batch_embeddings, cache_info = await self.compute(
+                    _encode_batch, params, target, roots, start, stored, keep
+                )
+                all_embeddings.append(batch_embeddings)
+                cache['hits'] += cache_info['hits']
+                cache['misses'] += cache_info['misses']
+            await self.compute(_register_batch_document, target, len(params['texts']))
+            embeddings = await self.compute(np.vstack, all_embeddings)
+
+            return _batch_result(params, embeddings, len(all_embeddings), cache, roots, deduplicator, target)
+
+        except (WireFormatError, ModelNotAllowedError, CollectionError) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            logger.error(f"Error generating batch embeddings: {str(e)}")
+            return jsonify({'error': f'Failed to generate batch embeddings: {str(e)}'}), 500
+
+    async def _stream_batches(self, params, roots, deduplicator, target=None):
+        """
+        NDJSON lines for a streamed /embed/batch (see app._stream_batch_embeddings).
+        The next batch encodes while the current line is written, and a slow
+        reader pauses encoding after that one batch. With target, each batch
+        is upserted in the pool thread that encoded it.
+        """
+        num_batches = 0
+        cache = {'hits': 0, 'misses': 0}
+        dimension = 0
+        stored = {}
+        keep = _referenced(roots)
+
+        def encode_batch(start):
+            batch_embeddings, cache_info = _encode_batch(params, target, roots, start, stored, keep)
+            event = _batch_event(params, start, batch_embeddings, roots, deduplicator)
+            return event, cache_info, batch_embeddings.shape[1]
+
+        starts = range(0, len(params['texts']), params['batch_size'])
+        upcoming = asyncio.ensure_future(self.compute(encode_batch, starts[0]))
+        try:
+            for position in range(len(starts)):
+                event, cache_info, dimension = await upcoming
+                # Later batches may reuse vectors this one stored, so they start only now
+                if position + 1 < len(starts):
+                    upcoming = asyncio.ensure_future(self.compute(encode_batch, starts[position + 1]))
+                cache['hits'] += cache_info['hits']
+                cache['misses'] += cache_info['misses']
+                num_batches += 1
+                yield json.dumps(event) + '\n'
+
+            await self.compute(_register_batch_document, target, len(params['texts']))
+            summary = _batch_summary(params, int(dimension), num_batches, cache, deduplicator, target)
+            yield json.dumps({'done': True, **summary}) + '\n'
+
+        except Exception as e:
+            logger.error(f"Error streaming batch embeddings: {str(e)}")
+            yield json.dumps({
+                'error': f'Failed to generate batch embeddings: {str(e)}',
+                'batches_processed': num_batches
+            }) + '\n'
+        finally:
+            if not upcoming.done():
+                # The client left: let the batch in flight finish in the pool, unobserved
+                upcoming.add_done_callback(lambda future: future.exception())
+
+    async def _send_lines(self, lines, receive, send):
+        """Write an async iterator of text lines, stopping early if the client disconnects."""
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            async for line in lines:
+                if disconnected.done():
+                    break
+                await send({'type': 'http.response.body', 'body': line.encode('utf-8'), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            disconnected.cancel()
+            await lines.aclose()
+
+    async def _run_wsgi(self, environ, send, executor):
+        """
+        Run the Flask app on one pool thread. The same thread iterates the
+        response body and hands the status and chunks to the loop through a
+        small queue, so a slow client pauses a streamed response instead of
+        buffering it.
+        """
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(messages.put(message), loop).result()
+
+        def run():
+            started = {}
+
+            def start_response(status, headers, exc_info=None):
+                started['status'] = int(status.split(' ', 1)[0])
+                started['headers'] = [
+                    (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers
+                ]
+                return lambda data: None
+
+            try:
+                result = self.wsgi_app(environ, start_response)
+                try:
+                    put((started['status'], started['headers']))
+                    for chunk in result:
+                        if stop.is_set():
+                            break
+                        if chunk:
+                            put(chunk)
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+            finally:
+                put(_END)
+
+        producer = loop.run_in_executor(executor, run)
+        try:
+            start = await messages.get()
+            if start is _END:
+                await self._send_error(send, 500, 'Internal server error')
+                return
+            status, headers = start
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while True:
+                chunk = await messages.get()
+                if chunk is _END:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            # On client disconnect, unblock the producer and let it close the iterator
+            stop.set()
+            while not producer.done():
+                while not messages.empty():
+                    messages.get_nowait()
+                await asyncio.sleep(0.01)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.control_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def _send_start(send, response):
+        headers = [
+            (name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.to_wsgi_list()
+        ]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+    @staticmethod
+    async def _send_error(send, status, message):
+        body = json.dumps({'error': message}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def _environ(scope, body):
+        """Build a PEP 3333 environ for one buffered request."""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+                continue
+            if name == 'CONTENT_LENGTH':
+                continue
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+app = AsgiEmbeddingApp(
+    flask_app,
+    compute_threads=int(os.getenv('ASGI_COMPUTE_THREADS', 4)),
+    max_pending=int(os.getenv('ASGI_MAX_PENDING', 256))
+)
@@ -0,0 +1,242 @@
+"""
+Token-length-aware batch planning for model.encode.
+
+Texts are tokenized once, sorted by token length and packed into batches under
+a padded-token budget (batch size x longest sequence), so short headings are
+never padded to the length of a full chunk. The budget is tuned at runtime from
+measured throughput and process RSS. Results are returned in input order.
+
+Each batch runs the model's forward pass on its rows of the tokenizer output,
+cut to the batch's longest sequence, so no text is tokenized a second time
+inside model.encode. Models that cannot take tokenized features (no tokenize
+method) get an estimated length and go through model.encode instead.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB, or None if it cannot be read."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    except Exception:
+        return None
+
+
+class BatchPlanner:
+    """
+    Plan and run length-bucketed encode batches under a token budget.
+
+    With autotune enabled the budget is hill-climbed: every adapt_every
+    batches the measured tokens/sec is compared with the previous window and
+    the budget keeps moving in the direction that improved throughput. If RSS
+    rises above rss_limit_mb the budget is halved.
+
+    on_batch, if given, is called after every forward batch with the token
+    lengths of its texts and the seconds it took (used for metrics).
+    """
+
+    def __init__(self, max_tokens_per_batch=16384, min_tokens=1024, max_tokens=131072,
+                 max_batch_size=512, autotune=True, rss_limit_mb=None, adapt_every=8, on_batch=None):
+        self.budget = max_tokens_per_batch
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.max_batch_size = max_batch_size
+        self.autotune = autotune
+        self.rss_limit_mb = rss_limit_mb
+        self.adapt_every = adapt_every
+        self.on_batch = on_batch
+        self._lock = threading.Lock()
+        self._direction = 1
+        self._last_rate = None
+        self._window_tokens = 0
+        self._window_seconds = 0.0
+        self._window_batches = 0
+        self.batches_run = 0
+        self.tokens_processed = 0
+        self.padded_tokens = 0
+        self.encode_seconds = 0.0
+
+    def tokenize(self, model, texts):
+        """
+        Tokenize texts once for the whole call. Returns (lengths, features):
+        the token count per text (special tokens included, capped at
+        max_seq_length) and the padded model features, or None as features
+        when the model only takes raw texts.
+        """
+        # sentence-transformers >= 5 names it preprocess and deprecates tokenize
+        tokenize = getattr(model, 'preprocess', None) or getattr(model, 'tokenize', None)
+        if not callable(tokenize):
+            # Rough estimate for models that cannot take tokenized input
+            max_length = getattr(model, 'max_seq_length', None) or 512
+            return np.minimum(np.array([len(text) // 4 + 2 for text in texts], dtype=np.int64), max_length), None
+
+        features = tokenize(list(texts))
+        lengths = np.asarray(features['attention_mask'].sum(1), dtype=np.int64)
+        return lengths, features
+
+    def plan(self, lengths, budget=None):
+        """
+        Split indices into batches, shortest sequences first.
+
+        Returns a list of index arrays. Each batch satisfies
+        len(batch) * max(lengths[batch]) <= budget (a single over-long text
+        still gets its own batch).
+        """
+        budget = budget or self.budget
+        order = np.argsort(lengths, kind='stable')
+        batches = []
+        start = 0
+        for position in range(1, len(order) + 1):
+            if position == len(order):
+                batches.append(order[start:position])
+                break
+            count = position - start + 1
+            longest = lengths[order[position]]
+            if count * longest > budget or count > self.max_batch_size:
+                batches.append(order[start:position])
+                start = position
+        return batches
+
+    def encode(self, model, texts, normalize=True, timings=None):
+        """
+        Encode texts batch by batch under the token budget; output rows follow input order.
+        If timings is a dict, 'tokenize' and 'forward' seconds are added to it.
+        """
+        started = time.perf_counter()
+        lengths, features = self.tokenize(model, texts)
+        left_padded = getattr(getattr(model, 'tokenizer', None), 'padding_side', 'right') == 'left'
+        if timings is not None:
+            timings['tokenize'] = timings.get('tokenize', 0.0) + time.perf_counter() - started
+        output = None
+
+        for indices in self.plan(lengths):
+            started = time.perf_counter()
+            if features is None:
+                batch = [texts[i] for i in indices]
+                embeddings = model.encode(
+                    batch,
+                    batch_size=len(batch),
+                    normalize_embeddings=normalize,
+                    show_progress_bar=False,
+                    convert_to_numpy=True
+                )
+            else:
+                batch_features = _select(features, indices, int(lengths[indices].max()), len(texts), left_padded)
+                embeddings = _forward(model, batch_features, normalize)
+            elapsed = time.perf_counter() - started
+            if timings is not None:
+                timings['forward'] = timings.get('forward', 0.0) + elapsed
+
+            if output is None:
+                output = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+            output[indices] = embeddings
+
+            self._observe(
+                tokens=int(lengths[indices].sum()),
+                padded=int(len(indices) * lengths[indices].max()),
+                seconds=elapsed
+            )
+            if self.on_batch is not None:
+                self.on_batch(lengths[indices], elapsed)
+
+        return output
+
+    def stats(self):
+        with self._lock:
+            return {
+                'token_budget': self.budget,
+                'autotune': self.autotune,
+                'batches_run': self.batches_run,
+                'tokens_processed': self.tokens_processed,
+                'padding_ratio': (
+                    1.0 - self.tokens_processed / self.padded_tokens if self.padded_tokens else 0.0
+                ),
+                'tokens_per_second': (
+                    self.tokens_processed / self.encode_seconds if self.encode_seconds else 0.0
+                ),
+                'rss_mb': current_rss_mb()
+            }
+
+    def _observe(self, tokens, padded, seconds):
+        with self._lock:
+            self.batches_run += 1
+            self.tokens_processed += tokens
+            self.padded_tokens += padded
+            self.encode_seconds += seconds
+
+            if not self.autotune:
+                return
+            self._window_tokens += tokens
+            self._window_seconds += seconds
+            self._window_batches += 1
+            if self._window_batches < self.adapt_every or self._window_seconds <= 0:
+                return
+
+            rate = self._window_tokens / self._window_seconds
+            self._window_tokens = 0
+            self._window_seconds = 0.0
+            self._window_batches = 0
+
+            rss = current_rss_mb() if self.rss_limit_mb else None
+            if rss is not None and rss > self.rss_limit_mb:
+                new_budget = self.budget // 2
+                self._direction = -1
+            else:
+                if self._last_rate is not None and rate < self._last_rate * 0.97:
+                    self._direction = -self._direction
+                new_budget = int(self.budget * (1.25 if self._direction > 0 else 0.8))
+            self._last_rate = rate
+
+            new_budget = max(self.min_tokens, min(self.max_tokens, new_budget))
+            if new_budget != self.budget:
+                logger.debug(f"Token budget {self.budget} -> {new_budget} ({rate:.0f} tokens/s, rss={rss})")
+                self.budget = new_budget
+
+
+def _select(features, indices, length, count, left_padded=False):
+    """Rows of padded features for one batch, cut to its longest sequence."""
+    selected = {}
+    for name, value in features.items():
+        if getattr(value, 'ndim', 0) >= 1 and value.shape[0] == count:
+            value = value[indices]
+            if value.ndim == 2:
+                value = value[:, -length:] if left_padded else value[:, :length]
+        selected[name] = value
+    return selected
+
+
+def _forward(model, features, normalize):
+    """Sentence embeddings (float32 numpy) from tokenized features."""
+    encode_features = getattr(model, 'encode_features', None)
+    if encode_features is not None:
+        return encode_features(features, normalize_embeddings=normalize)
+
+    import torch
+
+    if model.training:
+        model.eval()
+    device = model.device
+    with torch.inference_mode():
+        features = {
+            name: value.to(device) if isinstance(value, torch.Tensor) else value
+            for name, value in features.items()
+        }
+        embeddings = model(features)['sentence_embedding']
+        if normalize:
+            embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        return embeddings.float().cpu().numpy()
@@ -0,0 +1,163 @@
+"""
+Dynamic micro-batching for model.encode.
+
+Request handlers submit their texts to a single scheduler thread, which
+coalesces texts from concurrent requests into one forward pass and hands each
+caller back its own slice of the result.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingEncode:
+    __slots__ = ('texts', 'normalize', 'future', 'timings', 'queued_at')
+
+    def __init__(self, texts, normalize, timings=None):
+        self.texts = texts
+        self.normalize = normalize
+        self.future = Future()
+        self.timings = timings
+        self.queued_at = time.perf_counter()
+
+
+class MicroBatchScheduler:
+    """
+    Coalesce concurrent encode calls into shared batches.
+
+    encode_fn(texts, normalize, timings) must return a 2-D numpy array with one
+    row per text; it may add phase durations (seconds) to the timings dict.
+    A batch is dispatched when it holds max_batch_size texts or when the wait
+    window (max_wait_ms) has passed since its first request arrived.
+
+    The wait window is only applied while requests are actually overlapping:
+    if the previous dispatch served a single request and nothing else is
+    queued, the next request is dispatched immediately, so an idle server adds
+    no latency.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._owner_pid = None
+        self._linger = False
+        self.batches_dispatched = 0
+        self.requests_served = 0
+        self.texts_encoded = 0
+
+    def submit(self, texts, normalize=True, timings=None):
+        """
+        Queue texts for encoding and block until their embeddings are ready.
+
+        If timings is a dict, the time spent queued and the phases reported by
+        encode_fn for the shared batch are added to it.
+        """
+        if len(texts) == 0:
+            return np.empty((0, 0), dtype=np.float32)
+        self._ensure_worker()
+        pending = _PendingEncode(list(texts), normalize, timings)
+        self._queue.put(pending)
+        return pending.future.result()
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'batches_dispatched': self.batches_dispatched,
+                'requests_served': self.requests_served,
+                'texts_encoded': self.texts_encoded,
+                'avg_requests_per_batch': (
+                    self.requests_served / self.batches_dispatched if self.batches_dispatched else 0.0
+                ),
+                'queue_depth': self._queue.qsize(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0
+            }
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so a worker process restarts its own scheduler thread.
+        if self._thread is not None and self._thread.is_alive() and self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._owner_pid == os.getpid():
+                return
+            if self._owner_pid != os.getpid():
+                self._queue = queue.Queue()
+            self._owner_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='encode-scheduler', daemon=True)
+            self._thread.start()
+
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the window closes."""
+        first = self._queue.get()
+        batch = [first]
+        count = len(first.texts)
+        deadline = time.monotonic() + self.max_wait if self._linger and self.max_wait > 0 else None
+
+        while count < self.max_batch_size:
+            try:
+                pending = self._queue.get_nowait()
+            except queue.Empty:
+                if deadline is None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(pending)
+            count += len(pending.texts)
+
+        # Only linger next time if this batch showed overlapping traffic.
+        self._linger = len(batch) > 1
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for pending in batch:
+                groups.setdefault(pending.normalize, []).append(pending)
+
+            for normalize, members in groups.items():
+                texts = [text for pending in members for text in pending.texts]
+                dispatched_at = time.perf_counter()
+                batch_timings = {}
+                try:
+                    embeddings = self.encode_fn(texts, normalize, batch_timings)
+                except Exception as e:
+                    logger.error(f"Error in batched encode: {str(e)}")
+                    for pending in members:
+                        pending.future.set_exception(e)
+                    continue
+
+                offset = 0
+                for pending in members:
+                    size = len(pending.texts)
+                    if pending.timings is not None:
+                        pending.timings['queue'] = pending.timings.get('queue', 0.0) + dispatched_at - pending.queued_at
+                        for name, seconds in batch_timings.items():
+                            pending.timings[name] = pending.timings.get(name, 0.0) + seconds
+                    pending.future.set_result(embeddings[offset:offset + size])
+                    offset += size
+
+                with self._lock:
+                    self.batches_dispatched += 1
+                    self.requests_served += len(members)
+                    self.texts_encoded += len(texts)
@@ -0,0 +1,120 @@
+"""
+Recall vs latency benchmark for the IVF approximate nearest-neighbour index.
+
+Compares IVF search against exact search over the same vectors and reports
+recall@k and per-query latency for a grid of nlist/nprobe settings, so the
+knobs can be picked from data.
+
+Usage:
+    python benchmark_ann.py                              # synthetic clustered corpus
+    python benchmark_ann.py --count 50000 --dim 768
+    python benchmark_ann.py --index curriculum           # a stored collection
+    python benchmark_ann.py --output ann_results.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from ann_index import IVFIndex, default_nlist
+
+
+def synthetic_corpus(count, dim, clusters, seed=0):
+    """Normalized vectors drawn around random topic directions, like chunk embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, count, seed=1):
+    """Perturbed corpus rows, so queries land near real content."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(vectors), size=count, replace=False)
+    queries = vectors[rows] + 0.3 * rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_search(vectors, queries, top_k):
+    started = time.perf_counter()
+    scores = queries @ vectors.T
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    elapsed = time.perf_counter() - started
+    return [set(row.tolist()) for row in top], elapsed / len(queries)
+
+
+def run(vectors, queries, top_k, nlists, nprobes):
+    truth, exact_latency = exact_search(vectors, queries, top_k)
+    print(f"Exact search: {exact_latency * 1000:.3f} ms/query over {len(vectors)} vectors")
+
+    results = []
+    for nlist in nlists:
+        started = time.perf_counter()
+        index = IVFIndex.build(vectors, nlist=nlist)
+        build_seconds = time.perf_counter() - started
+        print(f"\nnlist={index.nlist} (built in {build_seconds:.2f}s)")
+        print(f"{'nprobe':>8} {'recall@' + str(top_k):>10} {'ms/query':>10} {'speedup':>8}")
+
+        for nprobe in nprobes:
+            if nprobe > index.nlist:
+                continue
+            started = time.perf_counter()
+            found = index.search(vectors, queries, top_k, nprobe=nprobe)
+            latency = (time.perf_counter() - started) / len(queries)
+            recall = float(np.mean([
+                len(truth_rows & set(rows.tolist())) / top_k
+                for truth_rows, (rows, _) in zip(truth, found)
+            ]))
+            print(f"{nprobe:>8} {recall:>10.4f} {latency * 1000:>10.3f} {exact_latency / latency:>7.1f}x")
+            results.append({
+                'nlist': index.nlist,
+                'nprobe': nprobe,
+                'recall': recall,
+                'ms_per_query': latency * 1000,
+                'exact_ms_per_query': exact_latency * 1000,
+                'build_seconds': build_seconds
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000, help='synthetic corpus size')
+    parser.add_argument('--dim', type=int, default=384, help='synthetic embedding dimension')
+    parser.add_argument('--clusters', type=int, default=200, help='synthetic topic count')
+    parser.add_argument('--index', help='benchmark a stored collection instead of synthetic data')
+    parser.add_argument('--index-dir', default=os.getenv('VECTOR_INDEX_DIR', 'indexes'))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, nargs='*', help='nlist values (default: auto)')
+    parser.add_argument('--nprobe', type=int, nargs='*', default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.index:
+        from vector_store import VectorStore
+        collection = VectorStore(args.index_dir).get(args.index)
+        if collection is None:
+            raise SystemExit(f"Index '{args.index}' not found in {args.index_dir}")
+        vectors = np.asarray(collection.vectors, dtype=np.float32)
+        source = f'index:{args.index}'
+    else:
+        vectors = synthetic_corpus(args.count, args.dim, args.clusters)
+        source = f'synthetic:{args.count}x{args.dim}'
+
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    nlists = args.nlist or [default_nlist(len(vectors))]
+    results = run(vectors, queries, args.top_k, nlists, args.nprobe)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'source': source, 'top_k': args.top_k, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
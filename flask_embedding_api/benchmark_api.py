@@ -0,0 +1,343 @@
+"""
+Latency and throughput benchmark for the embedding API endpoints.
+
+Drives /embed, /embed/batch, /similarity, /similarity/embeddings,
+/find-relevant-content and /cluster-content with chunks shaped like the ones
+the upload pipeline produces (chunkText: 1000 chars with 200 overlap, cut at
+sentence or word boundaries). Each scenario runs at several concurrency levels
+and reports p50/p95/p99 latency, requests/sec and texts/sec.
+
+Texts are made unique per request by default, so the embedding cache does not
+hide model time (use --cache-hits to measure the cached path instead).
+
+Usage:
+    python benchmark_api.py                                  # in-process Flask test client
+    python benchmark_api.py --url http://localhost:5000      # a running server over HTTP
+    python benchmark_api.py --scenario embed similarity --concurrency 1 8 32
+    python benchmark_api.py --output after.json --compare before.json --fail-threshold 10
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from pdf_ingest import IncrementalChunker
+
+TOPIC_WORDS = [
+    'photosynthesis', 'chlorophyll', 'energy', 'glucose', 'cell', 'membrane', 'mitochondria', 'respiration',
+    'equation', 'variable', 'function', 'gradient', 'derivative', 'integral', 'probability', 'statistics',
+    'revolution', 'empire', 'treaty', 'parliament', 'colonial', 'economy', 'trade', 'industry',
+    'molecule', 'atom', 'electron', 'reaction', 'acid', 'base', 'catalyst', 'temperature',
+    'ecosystem', 'habitat', 'species', 'evolution', 'inheritance', 'gene', 'protein', 'enzyme',
+    'force', 'velocity', 'acceleration', 'momentum', 'circuit', 'voltage', 'resistance', 'wave'
+]
+FILLER_WORDS = [
+    'the', 'of', 'and', 'to', 'in', 'is', 'that', 'students', 'should', 'be', 'able', 'to', 'describe',
+    'explain', 'how', 'which', 'with', 'for', 'as', 'an', 'are', 'this', 'process', 'between', 'their',
+    'example', 'learning', 'objective', 'understand', 'identify', 'compare', 'analyse', 'evaluate'
+]
+
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    """chunkText in src/utils/textChunker.js, through the ingest pipeline's chunker."""
+    chunker = IncrementalChunker(chunk_size, overlap)
+    return [chunk for _, chunk in chunker.feed(text) + chunker.finish()]
+
+
+def synthetic_document(words, seed=0):
+    """Curriculum-like prose: sentences of 8-30 words mixing topic and filler words."""
+    rng = random.Random(seed)
+    sentences = []
+    total = 0
+    while total < words:
+        length = rng.randint(8, 30)
+        sentence = [rng.choice(TOPIC_WORDS if rng.random() < 0.3 else FILLER_WORDS) for _ in range(length)]
+        sentences.append(' '.join(sentence).capitalize() + rng.choice(['.', '.', '.', '?', '!']))
+        total += length
+    return ' '.join(sentences)
+
+
+def load_chunks(path=None, words=60000):
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            return chunk_text(f.read())
+    return chunk_text(synthetic_document(words))
+
+
+class Scenario:
+    """
+    One endpoint call shape. build(rng, unique) returns (path, payload, items),
+    where items is the number of texts (or vectors) the call embeds or scores.
+    """
+
+    def __init__(self, name, build):
+        self.name = name
+        self.build = build
+
+
+def make_scenarios(chunks, dimension, args):
+    counter = iter(range(10 ** 12))
+    lock = threading.Lock()
+
+    def sample(rng, count, unique):
+        picked = [chunks[rng.randrange(len(chunks))] for _ in range(count)]
+        if unique:
+            with lock:
+                tag = next(counter)
+            picked = [f'[{tag}.{i}] {text}' for i, text in enumerate(picked)]
+        return picked
+
+    def embed(rng, unique):
+        texts = sample(rng, args.texts_per_request, unique)
+        return '/embed', {'texts': texts}, len(texts)
+
+    def embed_batch(rng, unique):
+        texts = sample(rng, args.batch_texts, unique)
+        return '/embed/batch', {'texts': texts}, len(texts)
+
+    def similarity(rng, unique):
+        query = sample(rng, 1, unique)[0][:200]
+        documents = sample(rng, args.documents, unique)
+        return '/similarity', {'query': query, 'documents': documents, 'top_k': 5}, len(documents) + 1
+
+    def similarity_embeddings(rng, unique):
+        vectors = np.random.default_rng(rng.randrange(2 ** 32)).standard_normal(
+            (args.documents * 4 + 1, dimension)
+        ).astype(np.float32)
+        return '/similarity/embeddings', {
+            'query_embedding': vectors[0].tolist(),
+            'document_embeddings': vectors[1:].tolist(),
+            'top_k': 5
+        }, len(vectors) - 1
+
+    def find_relevant_content(rng, unique):
+        topics = [' '.join(rng.sample(TOPIC_WORDS, 3)) for _ in range(5)]
+        documents = sample(rng, args.documents, unique)
+        return '/find-relevant-content', {'topics': topics, 'documents': documents, 'top_k': 10}, len(documents) + 5
+
+    def cluster_content(rng, unique):
+        documents = sample(rng, args.documents, unique)
+        return '/cluster-content', {'documents': documents, 'num_clusters': 5}, len(documents)
+
+    return {scenario.name: scenario for scenario in [
+        Scenario('embed', embed),
+        Scenario('embed_batch', embed_batch),
+        Scenario('similarity', similarity),
+        Scenario('similarity_embeddings', similarity_embeddings),
+        Scenario('find_relevant_content', find_relevant_content),
+        Scenario('cluster_content', cluster_content)
+    ]}
+
+
+class TestClientTarget:
+    """In-process Flask test client (one client per thread)."""
+
+    name = 'test_client'
+
+    def __init__(self):
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def post(self, path, payload):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post(path, json=payload)
+        return response.status_code
+
+    def get_json(self, path):
+        return self.app.test_client().get(path).get_json()
+
+
+class HttpTarget:
+    """A running server reached over real HTTP (standard library only)."""
+
+    name = 'http'
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        body = json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(
+            self.url + path, data=body, method='POST', headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def get_json(self, path):
+        with urllib.request.urlopen(self.url + path, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+def run_level(target, scenario, concurrency, requests, unique, seed):
+    """Run requests calls with concurrency threads; return latency/throughput stats."""
+    payloads = []
+    rng = random.Random(seed)
+    for _ in range(requests):
+        payloads.append(scenario.build(rng, unique))
+
+    latencies = np.zeros(requests)
+    statuses = [0] * requests
+
+    def call(slot):
+        path, payload, _ = payloads[slot]
+        started = time.perf_counter()
+        statuses[slot] = target.post(path, payload)
+        latencies[slot] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    wall = time.perf_counter() - started
+
+    ok = np.array([status == 200 for status in statuses])
+    texts = sum(count for (_, _, count), good in zip(payloads, ok) if good)
+    measured = latencies[ok] if ok.any() else latencies
+    p50, p95, p99 = np.percentile(measured, [50, 95, 99]) * 1000
+    return {
+        'scenario': scenario.name,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': int((~ok).sum()),
+        'mean_ms': float(measured.mean() * 1000),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'requests_per_sec': float(ok.sum() / wall),
+        'texts_per_sec': float(texts / wall),
+        'wall_seconds': wall
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':<24} {'conc':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8} {'texts/s':>9} {'err':>4}")
+    for row in results:
+        print(
+            f"{row['scenario']:<24} {row['concurrency']:>5} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+            f"{row['p99_ms']:>9.1f} {row['requests_per_sec']:>8.1f} {row['texts_per_sec']:>9.1f} {row['errors']:>4}"
+        )
+
+
+def compare(results, baseline_path, threshold):
+    """Print deltas against a previous run; return the rows that regressed past threshold percent."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(row['scenario'], row['concurrency']): row for row in json.load(f)['results']}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'scenario':<24} {'conc':>5} {'p95 ms':>18} {'texts/s':>20}")
+    for row in results:
+        before = baseline.get((row['scenario'], row['concurrency']))
+        if before is None:
+            continue
+        p95_change = (row['p95_ms'] / before['p95_ms'] - 1) * 100 if before['p95_ms'] else 0.0
+        rate_key = 'texts_per_sec' if before['texts_per_sec'] else 'requests_per_sec'
+        rate_change = (row[rate_key] / before[rate_key] - 1) * 100 if before[rate_key] else 0.0
+        print(
+            f"{row['scenario']:<24} {row['concurrency']:>5} {before['p95_ms']:>7.1f} -> {row['p95_ms']:>7.1f} "
+            f"({p95_change:+5.1f}%) {before[rate_key]:>7.1f} -> {row[rate_key]:>7.1f} ({rate_change:+5.1f}%)"
+        )
+        if threshold is not None and (p95_change > threshold or rate_change < -threshold):
+            regressions.append(row)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process test client')
+    parser.add_argument('--scenario', nargs='*', help='scenarios to run (default: all)')
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=50, help='measured requests per scenario and level')
+    parser.add_argument('--warmup', type=int, default=3, help='unmeasured requests before each scenario')
+    parser.add_argument('--texts-per-request', type=int, default=16, help='chunks per /embed call')
+    parser.add_argument('--batch-texts', type=int, default=256, help='chunks per /embed/batch call')
+    parser.add_argument('--documents', type=int, default=50, help='documents per search/cluster call')
+    parser.add_argument('--corpus', help='text file to chunk instead of the synthetic document')
+    parser.add_argument('--cache-hits', action='store_true', help='reuse texts so the embedding cache serves them')
+    parser.add_argument('--timeout', type=float, default=300.0, help='HTTP timeout in seconds')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='previous --output file to compare against')
+    parser.add_argument('--fail-threshold', type=float, help='exit 1 if p95 or throughput regress by more than this percent')
+    args = parser.parse_args()
+
+    target = HttpTarget(args.url, args.timeout) if args.url else TestClientTarget()
+    info = target.get_json('/model/info')
+    chunks = load_chunks(args.corpus)
+    lengths = np.array([len(chunk) for chunk in chunks])
+    print(
+        f"Target: {args.url or 'Flask test client'}, model {info.get('model_name')} "
+        f"({info.get('backend', 'torch')}), {len(chunks)} chunks of {lengths.mean():.0f} chars on average"
+    )
+
+    scenarios = make_scenarios(chunks, info['embedding_dimension'], args)
+    selected = args.scenario or list(scenarios)
+    unknown = [name for name in selected if name not in scenarios]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios {unknown}. Use: {', '.join(scenarios)}")
+
+    results = []
+    for name in selected:
+        scenario = scenarios[name]
+        if args.warmup:
+            run_level(target, scenario, 1, args.warmup, not args.cache_hits, seed=-1)
+        for concurrency in args.concurrency:
+            results.append(run_level(target, scenario, concurrency, args.requests, not args.cache_hits, seed=concurrency))
+            row = results[-1]
+            print(f"  {name} x{concurrency}: p95 {row['p95_ms']:.1f} ms, {row['texts_per_sec']:.1f} texts/s")
+
+    print()
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'target': target.name,
+                'url': args.url,
+                'model': info.get('model_name'),
+                'backend': info.get('backend'),
+                'git_revision': git_revision(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'chunks': {'count': len(chunks), 'mean_chars': float(lengths.mean()), 'max_chars': int(lengths.max())},
+                'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+                'results': results
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.fail_threshold)
+        if regressions:
+            print(f"\n{len(regressions)} result(s) regressed by more than {args.fail_threshold}%")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
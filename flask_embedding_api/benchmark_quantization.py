@@ -0,0 +1,99 @@
+"""
+Memory and recall benchmark for quantized embedding search.
+
+Compares int8 and binary (1-bit) search, with and without float rescoring,
+against exact float32 search and reports bytes per representation,
+recall@k and per-query latency.
+
+Usage:
+    python benchmark_quantization.py                         # synthetic corpus
+    python benchmark_quantization.py --count 100000 --dim 768
+    python benchmark_quantization.py --index curriculum      # a stored collection
+    python benchmark_quantization.py --output quant_results.json
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from benchmark_ann import make_queries, synthetic_corpus
+from quantization import QuantizedVectors, memory_report
+from topk import top_k_search
+
+
+def run(vectors, queries, top_k, rescore_factor):
+    started = time.perf_counter()
+    truth = [set(rows.tolist()) for rows, _ in top_k_search(queries, vectors, top_k)]
+    exact_latency = (time.perf_counter() - started) / len(queries)
+
+    report = memory_report(len(vectors), vectors.shape[1])
+    print(f"Vectors: {len(vectors)} x {vectors.shape[1]}")
+    print(f"  float32: {report['float32_bytes'] / 1e6:8.2f} MB")
+    print(f"  int8:    {report['int8_bytes'] / 1e6:8.2f} MB ({report['int8_ratio']:.1f}x smaller)")
+    print(f"  binary:  {report['binary_bytes'] / 1e6:8.2f} MB ({report['binary_ratio']:.1f}x smaller)")
+    print(f"\n{'method':<18} {'recall@' + str(top_k):>10} {'ms/query':>10}")
+    print(f"{'float32 exact':<18} {1.0:>10.4f} {exact_latency * 1000:>10.3f}")
+
+    results = [{'method': 'float32', 'recall': 1.0, 'ms_per_query': exact_latency * 1000}]
+    for kind in ('int8', 'binary'):
+        codes = QuantizedVectors.from_vectors(vectors, kind)
+        for rescore in (False, True):
+            started = time.perf_counter()
+            found = codes.search(
+                queries, top_k,
+                float_vectors=vectors if rescore else None,
+                rescore_factor=rescore_factor
+            )
+            latency = (time.perf_counter() - started) / len(queries)
+            recall = float(np.mean([
+                len(truth_rows & set(rows.tolist())) / top_k for truth_rows, (rows, _) in zip(truth, found)
+            ]))
+            method = f'{kind}+rescore' if rescore else kind
+            print(f"{method:<18} {recall:>10.4f} {latency * 1000:>10.3f}")
+            results.append({
+                'method': method,
+                'recall': recall,
+                'ms_per_query': latency * 1000,
+                'bytes': codes.nbytes
+            })
+    return report, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000, help='synthetic corpus size')
+    parser.add_argument('--dim', type=int, default=384, help='synthetic embedding dimension')
+    parser.add_argument('--clusters', type=int, default=200, help='synthetic topic count')
+    parser.add_argument('--index', help='benchmark a stored collection instead of synthetic data')
+    parser.add_argument('--index-dir', default=os.getenv('VECTOR_INDEX_DIR', 'indexes'))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--rescore-factor', type=int, help='default: 4 for int8, 10 for binary')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    if args.index:
+        from vector_store import VectorStore
+        collection = VectorStore(args.index_dir).get(args.index)
+        if collection is None:
+            raise SystemExit(f"Index '{args.index}' not found in {args.index_dir}")
+        vectors = np.asarray(collection.vectors, dtype=np.float32)
+        source = f'index:{args.index}'
+    else:
+        vectors = synthetic_corpus(args.count, args.dim, args.clusters)
+        source = f'synthetic:{args.count}x{args.dim}'
+
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    report, results = run(vectors, queries, args.top_k, args.rescore_factor)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'source': source, 'top_k': args.top_k, 'memory': report, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
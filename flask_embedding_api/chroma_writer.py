@@ -0,0 +1,156 @@
+"""
+Direct bulk writes from the embedding service into a Chroma collection.
+
+ChromaDBManager.addDocuments (src/utils/chromaManager.js) sends every
+chunk to Chroma, which calls back into this service for the vectors. A
+ChromaWriter instead writes chunks encoded here straight into the
+collection, in batches of the client's maximum batch size. Ids and
+metadata follow the layout addDocuments uses, so search.js and
+deleteDocument work on the result unchanged:
+
+    id:       <documentId>_chunk_<index>_<milliseconds>
+    metadata: {documentId, fileName, chunkIndex, chunkText (100-character
+               preview + "..."), uploadedAt, totalChunks}
+
+With a path the store is opened in-process (chromadb.PersistentClient) and
+the vectors never leave the process. Chroma's on-disk store must only be
+opened by one process at a time, so use a path only when no Chroma server
+(and no other worker) uses that directory; otherwise give the server's url.
+
+Requires: pip install chromadb
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import numpy as np
+
+PREVIEW_CHARS = 100
+COLLECTION_METADATA = {'description': 'Curriculum document embeddings'}
+
+
+class ChromaWriteError(ValueError):
+    """Chroma rejected the rows (e.g. vectors of another dimension than the collection's)."""
+
+
+def _rejection_errors():
+    """
+    The exceptions chromadb raises for rows it rejects. InvalidArgumentError
+    only exists from 0.5.9 and InvalidDimensionException is raised for a
+    dimension mismatch; older releases raise plain ValueError.
+    """
+    from chromadb import errors
+
+    names = ('InvalidArgumentError', 'InvalidDimensionException')
+    return tuple(getattr(errors, name) for name in names if hasattr(errors, name)) + (ValueError,)
+
+
+def _max_batch_size(client):
+    # get_max_batch_size() appeared in chromadb 0.5; 0.4 has the max_batch_size property
+    if hasattr(client, 'get_max_batch_size'):
+        return client.get_max_batch_size()
+    return client.max_batch_size
+
+
+def iso_now():
+    """Current UTC time as JavaScript's Date.toISOString() writes it (uploadedAt)."""
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def chunk_ids(document_id, count, timestamp_ms=None):
+    """Chunk ids as addDocuments builds them (one Date.now() for the whole document)."""
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    return [f'{document_id}_chunk_{index}_{timestamp_ms}' for index in range(count)]
+
+
+def chunk_metadatas(chunks, document_id, file_name, uploaded_at):
+    """Chunk metadata as addDocuments builds it."""
+    return [
+        {
+            'documentId': document_id,
+            'fileName': file_name,
+            'chunkIndex': index,
+            'chunkText': chunk[:PREVIEW_CHARS] + '...',
+            'uploadedAt': uploaded_at,
+            'totalChunks': len(chunks)
+        }
+        for index, chunk in enumerate(chunks)
+    ]
+
+
+class ChromaWriter:
+    """Write pre-computed embeddings into one Chroma collection (in-process store or server)."""
+
+    def __init__(self, collection_name, path=None, url=None):
+        if not path and not url:
+            raise ValueError('Give the Chroma store path or the server url')
+        self.collection_name = collection_name
+        self.path = path
+        self.url = url
+        self._client = None
+        self._collection = None
+        self._lock = threading.Lock()
+
+    @property
+    def target(self):
+        return self.path or self.url
+
+    def connect(self):
+        """Open the client and collection (once); raises ImportError without chromadb."""
+        with self._lock:
+            return self._connect()
+
+    def _connect(self):
+        """Open the client and collection on first use (caller holds the lock)."""
+        if self._collection is not None:
+            return self._collection
+        import chromadb
+        from chromadb.config import Settings
+
+        settings = Settings(anonymized_telemetry=False)
+        if self.path:
+            self._client = chromadb.PersistentClient(path=self.path, settings=settings)
+        else:
+            parsed = urlparse(self.url)
+            self._client = chromadb.HttpClient(
+                host=parsed.hostname or 'localhost',
+                port=parsed.port or (443 if parsed.scheme == 'https' else 8000),
+                ssl=parsed.scheme == 'https',
+                settings=settings
+            )
+        # Same metadata as ChromaDBManager.getCollection; vectors always come from here
+        self._collection = self._client.get_or_create_collection(
+            name=self.collection_name,
+            metadata=COLLECTION_METADATA
+        )
+        return self._collection
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        """Write rows in batches of the client's maximum batch size. Returns the number written."""
+        rejected = _rejection_errors()
+
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            collection = self._connect()
+            max_batch = _max_batch_size(self._client)
+            try:
+                for start in range(0, len(ids), max_batch):
+                    end = start + max_batch
+                    collection.upsert(
+                        ids=ids[start:end],
+                        embeddings=embeddings[start:end],
+                        documents=documents[start:end],
+                        metadatas=metadatas[start:end]
+                    )
+            except rejected as e:
+                raise ChromaWriteError(f"Chroma collection '{self.collection_name}': {str(e)}")
+        return len(ids)
+
+    def add_document(self, chunks, embeddings, document_id, file_name, uploaded_at):
+        """Store one document's chunks the way addDocuments does. Returns the chunk ids."""
+        ids = chunk_ids(document_id, len(chunks))
+        self.upsert(ids, embeddings, chunks, chunk_metadatas(chunks, document_id, file_name, uploaded_at))
+        return ids
@@ -0,0 +1,191 @@
+"""
+Spherical k-means clustering for /cluster-content.
+
+Embeddings are L2-normalized, so clusters are formed by cosine similarity:
+points are assigned to the centroid with the largest dot product and each
+centroid is the re-normalized sum of its members. Everything is vectorized
+numpy, with assignments computed in row blocks (ann_index.assign_to_centroids).
+
+- k-means++ seeding on a sample, best of a few seedings
+- full-batch Lloyd iterations up to MINIBATCH_THRESHOLD points, mini-batch
+  updates above it, then one full assignment pass
+- automatic k: each candidate is fitted on a sample and scored with the
+  silhouette coefficient of a smaller sample
+"""
+
+import numpy as np
+
+from ann_index import assign_to_centroids
+
+# Above this many points, centroids are updated from random mini-batches
+MINIBATCH_THRESHOLD = 20000
+MINIBATCH_SIZE = 2048
+
+SEED_SAMPLE_SIZE = 10000
+SILHOUETTE_SAMPLE_SIZE = 2000
+# Points used to fit each candidate k during automatic selection
+SELECTION_SAMPLE_SIZE = 5000
+
+
+def _cluster_sums(vectors, labels, k):
+    """Per-cluster sum of rows, via one sort and np.add.reduceat."""
+    order = np.argsort(labels, kind='stable')
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    sums = np.zeros((k, vectors.shape[1]), dtype=np.float32)
+    sums[sorted_labels[starts]] = np.add.reduceat(vectors[order], starts, axis=0)
+    return sums, np.bincount(labels, minlength=k)
+
+
+def _normalize(rows):
+    return (rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)).astype(np.float32)
+
+
+def kmeans_plus_plus(vectors, k, rng):
+    """k-means++ seeding with cosine distance (1 - dot product)."""
+    centroids = np.empty((k, vectors.shape[1]), dtype=np.float32)
+    centroids[0] = vectors[rng.integers(len(vectors))]
+    distances = np.maximum(1.0 - vectors @ centroids[0], 0.0)
+    for i in range(1, k):
+        weights = distances ** 2
+        total = weights.sum()
+        choice = rng.choice(len(vectors), p=weights / total) if total > 0 else rng.integers(len(vectors))
+        centroids[i] = vectors[choice]
+        distances = np.minimum(distances, np.maximum(1.0 - vectors @ centroids[i], 0.0))
+    return centroids
+
+
+def _lloyd(vectors, centroids, max_iter, tol):
+    for _ in range(max_iter):
+        labels = assign_to_centroids(vectors, centroids)
+        sums, counts = _cluster_sums(vectors, labels, len(centroids))
+        # An empty cluster keeps its old centroid
+        empty = counts == 0
+        sums[empty] = centroids[empty]
+        new_centroids = _normalize(sums)
+        shift = float(np.max(1.0 - np.sum(new_centroids * centroids, axis=1)))
+        centroids = new_centroids
+        if shift < tol:
+            break
+    return centroids
+
+
+def _minibatch(vectors, centroids, max_iter, tol, batch_size, rng):
+    """Mini-batch k-means on the sphere: per-centroid learning rate 1 / points seen."""
+    k = len(centroids)
+    seen = np.zeros(k, dtype=np.float64)
+    for _ in range(max_iter):
+        batch = np.asarray(vectors[rng.choice(len(vectors), size=batch_size, replace=False)], dtype=np.float32)
+        labels = assign_to_centroids(batch, centroids)
+        sums, counts = _cluster_sums(batch, labels, k)
+        updated = counts > 0
+        seen[updated] += counts[updated]
+        # c <- c + (batch_mean - c) * counts / seen, written as a weighted sum and re-normalized
+        weights = (seen[updated] - counts[updated])[:, None]
+        new_centroids = centroids.copy()
+        new_centroids[updated] = _normalize(centroids[updated] * weights + sums[updated])
+        shift = float(np.max(1.0 - np.sum(new_centroids * centroids, axis=1)))
+        centroids = new_centroids
+        if shift < tol:
+            break
+    return centroids
+
+
+def spherical_kmeans(vectors, k, n_init=3, max_iter=100, tol=1e-5, seed=42, batch_size=None):
+    """
+    Cluster normalized rows into k groups by cosine similarity.
+
+    Runs n_init k-means++ seedings and keeps the one with the highest total
+    similarity to the assigned centroids. batch_size switches to mini-batch
+    updates (default: MINIBATCH_SIZE above MINIBATCH_THRESHOLD points).
+
+    Returns (centroids (k, d), labels (n,), similarities (n,)) where
+    similarities is each row's dot product with its centroid.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    count = len(vectors)
+    k = max(1, min(int(k), count))
+    if batch_size is None and count > MINIBATCH_THRESHOLD:
+        batch_size = MINIBATCH_SIZE
+    rng = np.random.default_rng(seed)
+
+    best = None
+    for _ in range(max(1, n_init)):
+        seed_rows = rng.choice(count, size=min(count, max(SEED_SAMPLE_SIZE, 8 * k)), replace=False)
+        centroids = kmeans_plus_plus(vectors[seed_rows], k, rng)
+        if batch_size and count > batch_size:
+            centroids = _minibatch(vectors, centroids, max_iter, tol, batch_size, rng)
+        else:
+            centroids = _lloyd(vectors, centroids, max_iter, tol)
+
+        labels = assign_to_centroids(vectors, centroids)
+        similarities = np.einsum('ij,ij->i', vectors, centroids[labels])
+        objective = float(similarities.sum())
+        if best is None or objective > best[0]:
+            best = (objective, centroids, labels, similarities)
+
+    _, centroids, labels, similarities = best
+    return centroids, labels, similarities
+
+
+def silhouette_score(vectors, labels, sample_size=SILHOUETTE_SAMPLE_SIZE, seed=42):
+    """
+    Mean silhouette coefficient with cosine distance, estimated on a random
+    sample of rows (one sample_size x sample_size distance matrix).
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        rows = rng.choice(len(vectors), size=sample_size, replace=False)
+        vectors, labels = vectors[rows], labels[rows]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    clusters, labels = np.unique(labels, return_inverse=True)
+    if len(clusters) < 2:
+        return 0.0
+
+    count = len(vectors)
+    distances = 1.0 - vectors @ vectors.T
+    members = np.zeros((count, len(clusters)), dtype=np.float32)
+    members[np.arange(count), labels] = 1.0
+    totals = distances @ members
+    sizes = members.sum(axis=0)
+
+    own_size = sizes[labels]
+    own = totals[np.arange(count), labels] / np.maximum(own_size - 1, 1)
+    means = totals / sizes
+    means[np.arange(count), labels] = np.inf
+    nearest = means.min(axis=1)
+    scores = (nearest - own) / np.maximum(np.maximum(own, nearest), 1e-12)
+    # Points alone in their (sampled) cluster score 0, as in the usual definition
+    scores[own_size <= 1] = 0.0
+    return float(scores.mean())
+
+
+def choose_k(vectors, candidates, seed=42):
+    """
+    Pick the number of clusters with the best sampled silhouette score.
+
+    Each candidate k is fitted (one seeding) on up to SELECTION_SAMPLE_SIZE
+    rows. Returns (best_k, {k: score}).
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    if len(vectors) > SELECTION_SAMPLE_SIZE:
+        vectors = vectors[rng.choice(len(vectors), size=SELECTION_SAMPLE_SIZE, replace=False)]
+
+    scores = {}
+    for k in candidates:
+        if k < 2 or k >= len(vectors):
+            continue
+        _, labels, _ = spherical_kmeans(vectors, k, n_init=1, max_iter=30, seed=seed)
+        scores[k] = silhouette_score(vectors, labels, seed=seed)
+    if not scores:
+        return max(1, min(min(candidates), len(vectors))), scores
+    return max(scores, key=scores.get), scores
+
+
+def candidate_ks(min_k, max_k, max_candidates=12):
+    """At most max_candidates values between min_k and max_k, denser at the low end."""
+    if max_k - min_k + 1 <= max_candidates:
+        return list(range(min_k, max_k + 1))
+    values = np.unique(np.round(np.geomspace(min_k, max_k, max_candidates)).astype(int))
+    return values.tolist()
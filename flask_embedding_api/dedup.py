@@ -0,0 +1,214 @@
+"""
+Duplicate detection before encoding.
+
+Two levels:
+
+- documents: a SHA-256 fingerprint of the extracted, cleaned text (computed
+  by pdf_ingest.ChunkStream) and of the uploaded file, or of the chunk list
+  of a document the client chunked itself. FingerprintRegistry
+  remembers which stored document of a collection had them, so a re-upload
+  copies its vectors instead of encoding the chunks again.
+- chunks: identical texts, and near-duplicates found with MinHash over word
+  shingles and banded LSH. Only the first chunk of a group is encoded;
+  the others reuse its vector and point at it.
+
+Candidates from the LSH buckets are checked with the exact Jaccard
+similarity of their shingle sets, so the threshold is exact and the bands
+only decide which pairs are compared.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+SHINGLE_SIZE = 3
+NUM_PERMUTATIONS = 128
+# Jaccard similarity of word shingles above which chunks share one vector
+NEAR_DUPLICATE_THRESHOLD = 0.9
+# Probability that a pair exactly at the threshold shares an LSH bucket
+LSH_RECALL = 0.99
+
+# Shingle hashes and permutations live below this Mersenne prime, so
+# a * x + b fits in uint64 without overflow
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD = re.compile(r'\w+')
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Sorted unique hashes of the lower-cased word size-grams of text (uint32)."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint32)
+    ids = np.array([zlib.crc32(word.encode('utf-8')) for word in words], dtype=np.uint64)
+    size = min(size, len(ids))
+    hashes = np.zeros(len(ids) - size + 1, dtype=np.uint64)
+    for offset in range(size):
+        hashes = hashes * np.uint64(1000003) ^ ids[offset:offset + len(hashes)]
+    return np.unique(hashes % _PRIME).astype(np.uint32)
+
+
+def jaccard(a, b):
+    """Jaccard similarity of two sorted unique hash arrays (0 when both are empty)."""
+    union = len(a) + len(b)
+    if union == 0:
+        return 0.0
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (union - common)
+
+
+def band_layout(threshold, num_perm=NUM_PERMUTATIONS, recall=LSH_RECALL):
+    """
+    (bands, rows) for LSH: the most rows per band (fewest false candidates)
+    that still put a pair with Jaccard == threshold in a shared bucket with
+    probability >= recall.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1.0 - (1.0 - threshold ** rows) ** bands >= recall:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """MinHash signatures from universal hashes (a * x + b) mod p, vectorized over permutations."""
+
+    def __init__(self, num_perm=NUM_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, int(_PRIME), num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(_PRIME), num_perm, dtype=np.uint64)
+
+    def signature(self, shingles):
+        if len(shingles) == 0:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        values = np.outer(self.a, shingles.astype(np.uint64)) + self.b[:, None]
+        return (values % _PRIME).min(axis=1)
+
+
+class ChunkDeduplicator:
+    """
+    Exact and near-duplicate detection over chunks that arrive in order.
+
+    add(text) returns (index, kind): the position of the earlier chunk this
+    one duplicates and "exact" or "near", or (None, None) for a new chunk.
+    Only new chunks are indexed, so every match points at a chunk that was
+    itself encoded.
+    """
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, num_perm=NUM_PERMUTATIONS, shingle_size=SHINGLE_SIZE):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError('dedup_threshold must be in (0, 1]')
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = band_layout(threshold, num_perm)
+        self.count = 0
+        self.duplicates = {'exact': 0, 'near': 0}
+        self._texts = {}
+        self._shingles = {}
+        self._buckets = [{} for _ in range(self.bands)]
+
+    def add(self, text):
+        index = self.count
+        self.count += 1
+        original = self._texts.get(text)
+        if original is not None:
+            self.duplicates['exact'] += 1
+            return original, 'exact'
+
+        shingles = shingle_hashes(text, self.shingle_size)
+        signature = self.hasher.signature(shingles)
+        keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+        candidates = set()
+        for buckets, key in zip(self._buckets, keys):
+            candidates.update(buckets.get(key, ()))
+        best, best_score = None, self.threshold
+        for candidate in sorted(candidates):
+            score = jaccard(shingles, self._shingles[candidate])
+            if score >= best_score and (best is None or score > best_score):
+                best, best_score = candidate, score
+        if best is not None:
+            self.duplicates['near'] += 1
+            return best, 'near'
+
+        self._texts[text] = index
+        self._shingles[index] = shingles
+        for buckets, key in zip(self._buckets, keys):
+            buckets.setdefault(key, []).append(index)
+        return None, None
+
+
+def find_duplicates(texts, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Group texts by (near-)duplication. Returns (roots, deduplicator): roots[i]
+    is the index of the text whose vector text i can use (i itself for the
+    first of each group).
+    """
+    deduplicator = ChunkDeduplicator(threshold)
+    roots = np.arange(len(texts))
+    for position, text in enumerate(texts):
+        original, _ = deduplicator.add(text)
+        if original is not None:
+            roots[position] = original
+    return roots, deduplicator
+
+
+def chunks_fingerprint(chunks):
+    """SHA-256 fingerprint of a chunk list (each chunk's byte length, then its text)."""
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class FingerprintRegistry:
+    """
+    Document fingerprints of one collection, in a JSON file next to it:
+    {key: {"document_id": ..., "num_chunks": n}}. key combines a fingerprint
+    (of the extracted text, of the uploaded file or of the chunk list) with
+    the chunking settings, which decide the chunks.
+
+    Entries are not removed when documents are deleted; callers check that
+    the stored chunks still exist before reusing them.
+    """
+
+    # Shared by all instances: requests each open their own registry
+    _lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def key(fingerprint, chunking):
+        return fingerprint + ':' + ':'.join(str(value) for value in chunking)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def lookup(self, key):
+        with self._lock:
+            return self._read().get(key)
+
+    def register(self, keys, document_id, num_chunks):
+        with self._lock:
+            entries = self._read()
+            for key in keys:
+                entries[key] = {'document_id': document_id, 'num_chunks': num_chunks}
+            # Write-then-rename so a crash never leaves a half-written file
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
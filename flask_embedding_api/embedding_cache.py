@@ -0,0 +1,181 @@
+"""
+Content-addressed cache for text embeddings.
+
+Entries are keyed by a SHA-256 hash of (model name, normalize flag, text), so the
+same chunk is only encoded once no matter how many times a document is uploaded
+or how often overlapping chunks repeat. The cache has two tiers:
+
+- a bounded in-memory LRU tier
+- an optional SQLite tier on disk that survives restarts
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """
+    Two-tier (memory LRU + optional disk) embedding cache.
+
+    Vectors are stored as float32. All public methods are thread-safe.
+    """
+
+    def __init__(self, max_entries=50000, disk_path=None):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            directory = os.path.dirname(os.path.abspath(disk_path))
+            os.makedirs(directory, exist_ok=True)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings '
+                '(key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)'
+            )
+            self._db.commit()
+            logger.info(f"Embedding disk cache enabled at {disk_path}")
+
+    @property
+    def _db(self):
+        """
+        The SQLite connection for this process. A connection must not be used
+        across fork, so a forked worker opens its own on first use.
+        """
+        if not self.disk_path:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 or self._db is not None
+
+    @staticmethod
+    def make_key(model_name, normalize, text):
+        """Build the content address for one (model, normalize, text) triple."""
+        digest = hashlib.sha256()
+        digest.update(model_name.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(b'1' if normalize else b'0')
+        digest.update(b'\x00')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get_many(self, keys):
+        """
+        Look up several keys at once.
+
+        Returns a list the same length as keys holding a float32 vector for
+        every hit and None for every miss. Disk hits are promoted to memory.
+        """
+        results = [None] * len(keys)
+        if not self.enabled:
+            with self._lock:
+                self.misses += len(keys)
+            return results
+
+        disk_lookups = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                    self.memory_hits += 1
+                else:
+                    disk_lookups.setdefault(key, []).append(i)
+
+            if disk_lookups and self._db is not None:
+                found = self._read_disk(list(disk_lookups.keys()))
+                for key, vector in found.items():
+                    for i in disk_lookups.pop(key):
+                        results[i] = vector
+                        self.disk_hits += 1
+                    self._remember(key, vector)
+
+            self.misses += sum(len(positions) for positions in disk_lookups.values())
+
+        return results
+
+    def put_many(self, keys, vectors):
+        """Store freshly computed vectors (rows of a 2-D array) under keys."""
+        if not self.enabled or len(keys) == 0:
+            return
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector.copy())
+
+            if self._db is not None:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)',
+                    [(key, int(vector.shape[0]), vector.tobytes()) for key, vector in zip(keys, vectors)]
+                )
+                self._db.commit()
+
+    def clear(self, include_disk=False):
+        with self._lock:
+            self._memory.clear()
+            if include_disk and self._db is not None:
+                self._db.execute('DELETE FROM embeddings')
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            stats = {
+                'memory_entries': len(self._memory),
+                'max_memory_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'disk_enabled': self._db is not None
+            }
+            if self._db is not None:
+                stats['disk_entries'] = self._db.execute('SELECT COUNT(*) FROM embeddings').fetchone()[0]
+            return stats
+
+    def _remember(self, key, vector):
+        """Insert into the memory tier and evict least recently used entries. Caller holds the lock."""
+        if self.max_entries <= 0:
+            return
+        vector.setflags(write=False)
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, keys):
+        """Fetch keys from SQLite in chunks that stay under the bound-parameter limit. Caller holds the lock."""
+        found = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._db.execute(
+                f'SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})',
+                chunk
+            ).fetchall()
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32, count=dim).copy()
+        return found
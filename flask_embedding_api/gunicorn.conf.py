@@ -0,0 +1,101 @@
+"""
+Gunicorn configuration for the embedding API.
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app (and with it the model) is preloaded once in the master process, and
+workers are forked from it. The weight tensors are never written after
+loading, so every worker shares the same physical pages copy-on-write.
+Adding a worker costs its own Python heap and activations, not another copy
+of the model.
+
+Each worker gets cores // workers intra-op threads (WEB_TORCH_THREADS), so
+the workers together never ask for more threads than there are cores.
+
+Workers write their metrics to METRICS_DIR (a fresh temporary directory per
+server unless set) and /metrics merges them, so a scrape answered by any
+worker reports the whole server.
+"""
+
+import gc
+import glob
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+cores = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_WORKERS', max(1, cores // 4)))
+# Threads let concurrent requests in one worker share forward passes through the micro-batcher
+worker_class = os.getenv('WEB_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('WEB_THREADS', 8))
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+torch_threads = int(os.getenv('WEB_TORCH_THREADS', max(1, cores // workers)))
+
+# OpenMP/MKL read these when torch initialises its thread pool
+for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(variable, str(torch_threads))
+os.environ.setdefault('ONNX_NUM_THREADS', str(torch_threads))
+
+# Set before the app is imported, so the master and every worker use the same directory
+_own_metrics_dir = 'METRICS_DIR' not in os.environ
+if _own_metrics_dir:
+    os.environ['METRICS_DIR'] = os.path.join(tempfile.gettempdir(), f'embedding-api-metrics-{os.getpid()}')
+
+# onnxruntime sessions keep worker threads that do not survive fork, so the
+# ONNX backends load the model in each worker instead.
+_backend = os.getenv('EMBEDDING_BACKEND', 'torch').lower()
+preload_app = os.getenv('WEB_PRELOAD', 'True' if _backend == 'torch' else 'False').lower() == 'true'
+
+# A preloading master must finish loading before it forks (a loader thread would
+# not survive the fork), so workers start ready. Without preload each worker
+# loads in the background and answers /health/live meanwhile.
+if preload_app:
+    os.environ.setdefault('MODEL_WARMUP', 'eager')
+    # Embedding job workers and the metrics writer are threads too; post_fork starts them in each worker
+    os.environ.setdefault('JOBS_AUTOSTART', 'False')
+    os.environ.setdefault('METRICS_AUTOSTART', 'False')
+
+
+def on_starting(server):
+    # Counters start from zero with the server, not from a previous run's snapshots
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.remove(path)
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
+
+
+def when_ready(server):
+    # Runs in the master after the preload and before the first fork. Freezing
+    # the heap keeps the garbage collector from writing to (and so copying)
+    # objects inherited by the workers.
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        f"Serving with {workers} workers x {threads} threads, {torch_threads} intra-op threads per worker"
+        f" (preload: {preload_app})"
+    )
+
+
+def post_fork(server, worker):
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    # With preload the app module was imported in the master; start its job workers here
+    app_module = sys.modules.get('app')
+    if app_module is not None and hasattr(app_module, 'job_workers'):
+        app_module.job_workers.start()
+    if app_module is not None and hasattr(app_module, 'metrics'):
+        app_module.metrics.start()
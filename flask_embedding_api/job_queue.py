@@ -0,0 +1,337 @@
+"""
+Persistent queue for asynchronous embedding jobs.
+
+A job is a list of texts to encode. It is stored in a SQLite database
+(jobs.db under the jobs directory) together with its progress, so queued and
+half-finished jobs survive a restart. Worker threads claim jobs, encode them
+batch by batch and write the vectors into <jobs dir>/<id>/embeddings.npy, a
+float32 .npy file that can be memory-mapped and read in row ranges while
+the job is still running.
+
+- progress ("done" rows) is committed after every batch, once the rows are
+  flushed, so a job picked up again continues where it stopped
+- a claimed job carries its owner (pid and a per-process token) and a
+  heartbeat. Another worker takes it over when the owner process is gone,
+  was restarted, or has not reported for LEASE_SECONDS
+- several processes (e.g. gunicorn workers) can share one jobs directory;
+  claims run in an IMMEDIATE transaction so a job has exactly one owner
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# A running job whose owner has not reported for this long is taken over
+LEASE_SECONDS = 300
+# A job that was taken over this many times (e.g. its process keeps dying) fails
+MAX_ATTEMPTS = 3
+RESULT_FILE = 'embeddings.npy'
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS jobs ('
+    'id TEXT PRIMARY KEY, state TEXT NOT NULL, model TEXT NOT NULL, normalize INTEGER NOT NULL, '
+    'batch_size INTEGER NOT NULL, num_texts INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0, '
+    'dimension INTEGER, owner TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, '
+    'created_at REAL NOT NULL, started_at REAL, heartbeat REAL, finished_at REAL)',
+    'CREATE TABLE IF NOT EXISTS job_texts (id TEXT PRIMARY KEY, texts TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (state, created_at)'
+)
+_FIELDS = (
+    'id', 'state', 'model', 'normalize', 'batch_size', 'num_texts', 'done', 'dimension',
+    'attempts', 'error', 'created_at', 'started_at', 'heartbeat', 'finished_at'
+)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobQueue:
+    """SQLite-backed job records plus one result directory per job. Thread-safe."""
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, 'jobs.db')
+        # Identifies this process in job owners, so a restarted process that
+        # happens to get the same pid still recognises its predecessor's jobs
+        self.token = uuid.uuid4().hex[:12]
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        os.makedirs(root, exist_ok=True)
+        with self._lock:
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+
+    @property
+    def _db(self):
+        """The connection for this process (a connection must not be used across fork). Caller holds the lock."""
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @property
+    def owner(self):
+        return f'{os.getpid()}:{self.token}'
+
+    def result_path(self, job_id):
+        return os.path.join(self.root, job_id, RESULT_FILE)
+
+    def submit(self, texts, model, normalize=True, batch_size=256):
+        """Queue a job and return its record."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                db.execute(
+                    'INSERT INTO jobs (id, state, model, normalize, batch_size, num_texts, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, 'queued', model, int(bool(normalize)), batch_size, len(texts), now)
+                )
+                db.execute('INSERT INTO job_texts (id, texts) VALUES (?, ?)', (job_id, json.dumps(texts)))
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        return self.get(job_id)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute(f'SELECT {", ".join(_FIELDS)} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(_FIELDS, row))
+        job['normalize'] = bool(job['normalize'])
+        return job
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall()
+        return dict(rows)
+
+    def _orphaned(self, owner, heartbeat, now):
+        if heartbeat is None or now - heartbeat > LEASE_SECONDS:
+            return True
+        pid, _, token = (owner or '').partition(':')
+        if not pid.isdigit():
+            return True
+        if int(pid) == os.getpid():
+            return token != self.token
+        return not _process_alive(int(pid))
+
+    def claim(self):
+        """
+        Take the oldest queued (or orphaned running) job for this process.
+        Returns (job, texts) or None.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                claimed = None
+                for job_id, owner, heartbeat, attempts in db.execute(
+                    "SELECT id, owner, heartbeat, attempts FROM jobs WHERE state = 'running' ORDER BY created_at"
+                ).fetchall():
+                    if not self._orphaned(owner, heartbeat, now):
+                        continue
+                    if attempts >= MAX_ATTEMPTS:
+                        db.execute(
+                            "UPDATE jobs SET state = 'failed', error = ?, finished_at = ?, owner = NULL WHERE id = ?",
+                            (f'Worker stopped {attempts} times while running this job', now, job_id)
+                        )
+                        db.execute('DELETE FROM job_texts WHERE id = ?', (job_id,))
+                        logger.error(f"Embedding job {job_id} failed after {attempts} attempts")
+                        continue
+                    logger.info(f"Resuming embedding job {job_id} left behind by {owner}")
+                    claimed = job_id
+                    break
+                if claimed is None:
+                    row = db.execute(
+                        "SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at LIMIT 1"
+                    ).fetchone()
+                    claimed = row[0] if row else None
+                if claimed is None:
+                    db.execute('COMMIT')
+                    return None
+                db.execute(
+                    "UPDATE jobs SET state = 'running', owner = ?, heartbeat = ?, attempts = attempts + 1, "
+                    'started_at = COALESCE(started_at, ?) WHERE id = ?',
+                    (self.owner, now, now, claimed)
+                )
+                texts = json.loads(db.execute('SELECT texts FROM job_texts WHERE id = ?', (claimed,)).fetchone()[0])
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+        return self.get(claimed), texts
+
+    def progress(self, job_id, done, dimension):
+        """Record done rows. Returns False when the job was cancelled or is no longer ours."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET done = ?, dimension = ?, heartbeat = ? WHERE id = ? AND state = 'running' AND owner = ?",
+                (done, dimension, time.time(), job_id, self.owner)
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id, state, error=None):
+        """Mark a job completed or failed and drop its input texts."""
+        with self._lock:
+            db = self._db
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = db.execute(
+                    "UPDATE jobs SET state = ?, error = ?, finished_at = ?, owner = NULL "
+                    "WHERE id = ? AND state = 'running' AND owner = ?",
+                    (state, error, time.time(), job_id, self.owner)
+                )
+                if cursor.rowcount:
+                    db.execute('DELETE FROM job_texts WHERE id = ?', (job_id,))
+                db.execute('COMMIT')
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+
+    def release(self, job_id):
+        """Hand a running job back to the queue (e.g. on shutdown); its progress is kept."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = 'queued', owner = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND state = 'running' AND owner = ?",
+                (job_id, self.owner)
+            )
+
+    def delete(self, job_id):
+        """Cancel a job and remove it with its results. Returns False if it did not exist."""
+        with self._lock:
+            cursor = self._db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+            self._db.execute('DELETE FROM job_texts WHERE id = ?', (job_id,))
+        shutil.rmtree(os.path.join(self.root, job_id), ignore_errors=True)
+        return cursor.rowcount == 1
+
+    def read_rows(self, job_id, start, end):
+        """Rows [start, end) of a job's result, clipped to the rows written so far (None if none exist)."""
+        job = self.get(job_id)
+        if job is None or not job['dimension'] or not os.path.exists(self.result_path(job_id)):
+            return None
+        end = min(end, job['done'])
+        vectors = np.load(self.result_path(job_id), mmap_mode='r')
+        return np.array(vectors[start:max(start, end)])
+
+
+class JobWorkerPool:
+    """
+    Threads that claim jobs from a JobQueue and run them.
+
+    encode(texts, model, normalize) returns float32 embeddings. start() is
+    safe to call repeatedly and in forked children: threads do not survive a
+    fork, so a child starts its own.
+    """
+
+    def __init__(self, queue, encode, num_workers=1, poll_seconds=2.0):
+        self.queue = queue
+        self.encode = encode
+        self.num_workers = num_workers
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid() or self.num_workers < 1:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._loop, name=f'embed-job-{i}', daemon=True)
+                for i in range(self.num_workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=None):
+        """Stop after the current batch; running jobs go back to the queue."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._pid = None
+
+    def notify(self):
+        """A job was submitted: wake an idle worker instead of waiting for the next poll."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.queue.claim()
+            except Exception as e:
+                logger.error(f"Could not claim an embedding job: {str(e)}")
+                claimed = None
+            if claimed is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            self._run(*claimed)
+
+    def _run(self, job, texts):
+        job_id = job['id']
+        path = self.queue.result_path(job_id)
+        done = job['done']
+        vectors = None
+        try:
+            if done and job['dimension'] and os.path.exists(path):
+                vectors = np.load(path, mmap_mode='r+')
+            else:
+                done = 0
+            while done < len(texts):
+                if self._stop.is_set():
+                    self.queue.release(job_id)
+                    return
+                batch = texts[done:done + job['batch_size']]
+                embeddings = np.asarray(self.encode(batch, job['model'], job['normalize']), dtype=np.float32)
+                if vectors is None:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    vectors = np.lib.format.open_memmap(
+                        path, mode='w+', dtype=np.float32, shape=(len(texts), embeddings.shape[1])
+                    )
+                vectors[done:done + len(batch)] = embeddings
+                vectors.flush()
+                done += len(batch)
+                if not self.queue.progress(job_id, done, int(vectors.shape[1])):
+                    logger.info(f"Embedding job {job_id} was cancelled at {done}/{len(texts)}")
+                    if self.queue.get(job_id) is None:
+                        # Deleted while this batch ran: don't leave a result file behind
+                        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+                    return
+            self.queue.finish(job_id, 'completed')
+            logger.info(f"Embedding job {job_id} completed ({len(texts)} texts)")
+        except Exception as e:
+            logger.error(f"Embedding job {job_id} failed: {str(e)}")
+            self.queue.finish(job_id, 'failed', error=str(e))
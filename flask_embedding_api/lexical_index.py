@@ -0,0 +1,276 @@
+"""
+BM25 lexical search over the texts of a vector collection.
+
+An inverted index maps each term to the documents containing it and the
+term's frequency there. It is kept as a few sorted postings segments of
+(term id, document number, term frequency) in uint32/uint16 arrays:
+
+- adds (and updates) tokenize only the new texts into a new small segment;
+  a segment is merged into the one before it once it grows to a comparable
+  size, so there are O(log n) segments and each posting is merged O(log n)
+  times
+- deletes only mark document numbers dead; dead postings are dropped when
+  their segment is merged, and everything is compacted once more than half
+  the document numbers are dead
+- documents are addressed by collection row and follow the collection's
+  swap-with-last deletes (move), like ann_index.IVFIndex
+- save/load write and read the index compacted into one segment, so a
+  process can open it without tokenizing every text again
+
+A query scores only the postings of its terms (Okapi BM25, k1 = 1.2,
+b = 0.75, Lucene's non-negative idf), so lexical search is an index lookup
+rather than a scan of every text.
+
+reciprocal_rank_fusion merges ranked lists (e.g. BM25 and vector results).
+"""
+
+import math
+import re
+
+import numpy as np
+
+_TOKEN = re.compile(r'\w+')
+
+K1 = 1.2
+B = 0.75
+# Reciprocal-rank fusion constant (Cormack et al.): damps the weight of the top ranks
+RRF_K = 60
+# A new segment is merged into the previous one once it is at least this fraction of its size
+MERGE_RATIO = 0.5
+MAX_TF = np.iinfo(np.uint16).max
+
+
+def tokenize(text):
+    """Lower-cased word tokens."""
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _grow(array, size, fill):
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array), 64), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class BM25Index:
+    """Incremental BM25 index over collection rows."""
+
+    def __init__(self, k1=K1, b=B):
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+        self.live = 0
+        self.total_length = 0
+        self._segments = []
+        self._docs = 0
+        self._doc_rows = np.empty(0, dtype=np.int64)
+        self._doc_lengths = np.empty(0, dtype=np.float32)
+        self._row_docs = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, texts):
+        index = cls()
+        index.add(np.arange(len(texts)), texts)
+        return index
+
+    def add(self, rows, texts):
+        """Index texts (None counts as empty) at rows, replacing whatever those rows held."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self.remove(rows)
+
+        first = self._docs
+        count = len(rows)
+        tokens = []
+        token_counts = np.zeros(count, dtype=np.int64)
+        for position, text in enumerate(texts):
+            text_tokens = tokenize(text)
+            token_counts[position] = len(text_tokens)
+            tokens.extend(text_tokens)
+        for token in set(tokens).difference(self.vocabulary):
+            self.vocabulary[token] = len(self.vocabulary)
+        lengths = token_counts.astype(np.float32)
+
+        if tokens:
+            term_ids = np.fromiter(map(self.vocabulary.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+            # One (term, document) key per token; unique() sorts them and counts the frequencies
+            keys = term_ids * count + np.repeat(np.arange(count), token_counts)
+            keys, tfs = np.unique(keys, return_counts=True)
+            self._segments.append((
+                (keys // count).astype(np.uint32),
+                (first + keys % count).astype(np.uint32),
+                np.minimum(tfs, MAX_TF).astype(np.uint16)
+            ))
+
+        self._docs += count
+        self._doc_rows = _grow(self._doc_rows, self._docs, -1)
+        self._doc_lengths = _grow(self._doc_lengths, self._docs, 0.0)
+        self._doc_rows[first:self._docs] = rows
+        self._doc_lengths[first:self._docs] = lengths
+        self._row_docs = _grow(self._row_docs, int(rows.max()) + 1, -1)
+        self._row_docs[rows] = np.arange(first, self._docs)
+        self.live += count
+        self.total_length += int(lengths.sum())
+        self._merge()
+
+    def remove(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[rows < len(self._row_docs)]
+        docs = self._row_docs[rows]
+        docs = docs[docs >= 0]
+        if len(docs) == 0:
+            return
+        self._doc_rows[docs] = -1
+        self._row_docs[rows] = -1
+        self.live -= len(docs)
+        self.total_length -= int(self._doc_lengths[docs].sum())
+
+    def move(self, source, target):
+        """Mirror a row move in the collection (used by swap-with-last deletes)."""
+        self._row_docs = _grow(self._row_docs, max(source, target) + 1, -1)
+        doc = self._row_docs[source]
+        self._row_docs[target] = doc
+        self._row_docs[source] = -1
+        if doc >= 0:
+            self._doc_rows[doc] = target
+
+    def search(self, query, top_k, mask=None):
+        """
+        Best top_k rows for query text by BM25. mask (optional) is a boolean
+        array of rows allowed in the results. Returns (rows, scores), best first.
+        """
+        term_ids = sorted({self.vocabulary[token] for token in tokenize(query) if token in self.vocabulary})
+        if not term_ids or self.live == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        average_length = self.total_length / self.live or 1.0
+        scores = np.zeros(self._docs, dtype=np.float32)
+        for term_id in term_ids:
+            docs, tfs = self._postings(term_id)
+            alive = self._doc_rows[docs] >= 0
+            docs, tfs = docs[alive], tfs[alive].astype(np.float32)
+            if len(docs) == 0:
+                continue
+            idf = math.log(1.0 + (self.live - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths[docs] / average_length)
+            # A document has one posting per term, so plain fancy-index addition is safe
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        candidates = np.flatnonzero(scores > 0)
+        rows = self._doc_rows[candidates]
+        if mask is not None:
+            allowed = mask[rows]
+            candidates, rows = candidates[allowed], rows[allowed]
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        k = min(top_k, len(candidates))
+        candidate_scores = scores[candidates]
+        best = np.argpartition(-candidate_scores, k - 1)[:k]
+        best = best[np.argsort(-candidate_scores[best], kind='stable')]
+        return rows[best], candidate_scores[best]
+
+    def save(self, path):
+        """Write the index as one compacted segment (the vocabulary as newline-joined terms)."""
+        self._compact()
+        terms, docs, tfs = self._segments[0] if self._segments else (
+            np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint16)
+        )
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.__getitem__)
+        np.savez(
+            path, terms=terms, docs=docs, tfs=tfs,
+            doc_rows=self._doc_rows[:self._docs], doc_lengths=self._doc_lengths[:self._docs],
+            vocabulary=np.frombuffer('\n'.join(vocabulary).encode('utf-8'), dtype=np.uint8),
+            params=np.array([self.k1, self.b])
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            k1, b = data['params'].tolist()
+            index = cls(k1=k1, b=b)
+            vocabulary = data['vocabulary'].tobytes().decode('utf-8')
+            index.vocabulary = {term: term_id for term_id, term in enumerate(vocabulary.split('\n'))} if vocabulary else {}
+            if len(data['terms']):
+                index._segments = [(data['terms'], data['docs'], data['tfs'])]
+            index._doc_rows = data['doc_rows'].astype(np.int64)
+            index._doc_lengths = data['doc_lengths'].astype(np.float32)
+        index._docs = len(index._doc_rows)
+        alive = np.flatnonzero(index._doc_rows >= 0)
+        index._row_docs = np.full(int(index._doc_rows.max()) + 1 if len(alive) else 0, -1, dtype=np.int64)
+        index._row_docs[index._doc_rows[alive]] = alive
+        index.live = len(alive)
+        index.total_length = int(index._doc_lengths[alive].sum())
+        return index
+
+    def info(self):
+        postings = sum(len(terms) for terms, _, _ in self._segments)
+        return {
+            'type': 'bm25',
+            'documents': self.live,
+            'terms': len(self.vocabulary),
+            'postings': postings,
+            'segments': len(self._segments),
+            'average_length': round(self.total_length / self.live, 1) if self.live else 0.0,
+            'bytes': postings * 10 + self._docs * 12 + len(self._row_docs) * 8
+        }
+
+    def _postings(self, term_id):
+        docs, tfs = [], []
+        # A uint32 needle keeps searchsorted from converting the whole terms array
+        term_id = np.uint32(term_id)
+        for terms, segment_docs, segment_tfs in self._segments:
+            start = np.searchsorted(terms, term_id, side='left')
+            end = np.searchsorted(terms, term_id, side='right')
+            if end > start:
+                docs.append(segment_docs[start:end])
+                tfs.append(segment_tfs[start:end])
+        if not docs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.uint16)
+        return np.concatenate(docs).astype(np.int64), np.concatenate(tfs)
+
+    def _merge(self):
+        if self._docs > 64 and self.live < self._docs // 2:
+            self._compact()
+            return
+        while len(self._segments) > 1 and len(self._segments[-1][0]) >= MERGE_RATIO * len(self._segments[-2][0]):
+            newer = self._segments.pop()
+            older = self._segments.pop()
+            self._segments.append(self._combine([older, newer]))
+
+    def _combine(self, segments, renumber=None):
+        """One sorted segment from several, without the postings of dead documents."""
+        terms = np.concatenate([segment[0] for segment in segments])
+        docs = np.concatenate([segment[1] for segment in segments])
+        tfs = np.concatenate([segment[2] for segment in segments])
+        alive = self._doc_rows[docs] >= 0
+        terms, docs, tfs = terms[alive], docs[alive], tfs[alive]
+        if renumber is not None:
+            docs = renumber[docs].astype(np.uint32)
+        order = np.lexsort((docs, terms))
+        return terms[order], docs[order], tfs[order]
+
+    def _compact(self):
+        """Merge every segment and renumber the live documents densely."""
+        alive = np.flatnonzero(self._doc_rows[:self._docs] >= 0)
+        renumber = np.full(self._docs, -1, dtype=np.int64)
+        renumber[alive] = np.arange(len(alive))
+        self._segments = [self._combine(self._segments, renumber)] if self._segments else []
+        self._doc_rows = self._doc_rows[alive].copy()
+        self._doc_lengths = self._doc_lengths[alive].copy()
+        self._docs = len(alive)
+        valid = self._row_docs >= 0
+        self._row_docs[valid] = renumber[self._row_docs[valid]]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Fuse ranked lists of keys: score(key) = sum of 1 / (k + rank) over the
+    lists it appears in (rank from 1). Returns [(key, score)], best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:top_k]
@@ -0,0 +1,106 @@
+"""
+Cold-start measurement for the embedding API.
+
+Starts the server command, polls /health/live and /health/ready, and reports
+how long after launch each one first answered 200, plus the server's own
+breakdown (model load and warm-up) from /health/ready. Repeats --runs times
+and prints the median.
+
+Usage:
+    python measure_startup.py
+    python measure_startup.py --runs 5 -- gunicorn -c gunicorn.conf.py -b 127.0.0.1:5055 app:app
+    python measure_startup.py --port 5055 -- uvicorn asgi_app:app --port 5055
+    python measure_startup.py --output startup.json
+"""
+
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def poll(url, timeout=1.0):
+    """Return (status, json body) or (None, None) if the server is not answering yet."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, ConnectionError, OSError):
+        return None, None
+
+
+def measure_once(command, base_url, deadline, interval):
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+    )
+    result = {'live_seconds': None, 'ready_seconds': None, 'server': None}
+    try:
+        while time.perf_counter() - started < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f'Server exited with code {process.returncode} before it was ready')
+            if result['live_seconds'] is None:
+                status, _ = poll(base_url + '/health/live')
+                if status == 200:
+                    result['live_seconds'] = time.perf_counter() - started
+            if result['live_seconds'] is not None:
+                status, body = poll(base_url + '/health/ready')
+                if status == 200:
+                    result['ready_seconds'] = time.perf_counter() - started
+                    result['server'] = body
+                    return result
+            time.sleep(interval)
+        raise RuntimeError(f'Server was not ready after {deadline}s')
+    finally:
+        # The server may have forked workers; stop the whole process group
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=30)
+        except (ProcessLookupError, subprocess.TimeoutExpired):
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--port', type=int, default=5055, help='port the server command listens on')
+    parser.add_argument('--deadline', type=float, default=300.0, help='seconds to wait for readiness')
+    parser.add_argument('--interval', type=float, default=0.05, help='seconds between polls')
+    parser.add_argument('--output', help='write the runs as JSON to this file')
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='server command (default: python app.py)')
+    args = parser.parse_args()
+
+    command = [part for part in args.command if part != '--'] or [sys.executable, 'app.py']
+    if command == [sys.executable, 'app.py']:
+        os.environ['PORT'] = str(args.port)
+    base_url = f'http://127.0.0.1:{args.port}'
+
+    runs = []
+    for run in range(args.runs):
+        result = measure_once(command, base_url, args.deadline, args.interval)
+        server = result['server'] or {}
+        print(
+            f"run {run + 1}: live after {result['live_seconds']:.2f}s, ready after {result['ready_seconds']:.2f}s "
+            f"(model load {server.get('load_seconds')}s, warm-up {server.get('warmup_seconds')}s)"
+        )
+        runs.append(result)
+
+    print(
+        f"\nmedian over {len(runs)} runs: live {statistics.median(r['live_seconds'] for r in runs):.2f}s, "
+        f"ready {statistics.median(r['ready_seconds'] for r in runs):.2f}s"
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'command': command, 'runs': runs}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+"""
+Minimal Prometheus metrics in the text exposition format (0.0.4).
+
+Counters, gauges and histograms with labels. An update is one dict lookup
+and a few float adds under a per-metric lock, cheap enough to leave on for
+every request and every forward batch. Numbers that are already tracked
+elsewhere (cache and scheduler stats) are read through callbacks at scrape
+time instead of being counted twice.
+
+Several worker processes (gunicorn) can share one directory: each writes a
+snapshot of its numbers to <directory>/<pid>.json every FLUSH_INTERVAL
+seconds (and at exit), and a scrape merges the snapshots. Counters and
+histograms are summed over every worker that ever wrote one, so they stay
+monotonic when a worker is replaced; gauges are reported per live worker
+with a pid label.
+"""
+
+import atexit
+import bisect
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Seconds between snapshots of a worker's metrics (a scrape can lag other workers by this much)
+FLUSH_INTERVAL = 1.0
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if math.isnan(value):
+            return 'NaN'
+        return repr(value)
+    return str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _callback_samples(self):
+        """callback() returns a number, or {label_values_tuple: number}."""
+        value = self.callback()
+        if isinstance(value, dict):
+            return sorted((tuple(str(v) for v in key), number) for key, number in value.items())
+        return [((), value)]
+
+    def _samples(self):
+        if self.callback is not None:
+            return self._callback_samples()
+        with self._lock:
+            return sorted(self._values.items())
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def snapshot(self):
+        """[(label values, value)] for the local process."""
+        return self._samples()
+
+    def render(self, samples=None, labelnames=None):
+        labelnames = self.labelnames if labelnames is None else labelnames
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in self._samples() if samples is None else samples:
+            lines.append(f'{self.name}{_format_labels(labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._bounds = np.asarray(self.buckets, dtype=np.float64)
+
+    def _state(self, key):
+        state = self._values.get(key)
+        if state is None:
+            # per-bucket (non-cumulative) counts, the last one for +Inf, then sum
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        return state
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._state(key)
+            state[0][slot] += 1
+            state[1] += value
+
+    def observe_many(self, values, **labels):
+        """Observe an array of values with one vectorized bucket count."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if values.size == 0:
+            return
+        key = self._key(labels)
+        counts = np.bincount(np.searchsorted(self._bounds, values, side='left'), minlength=len(self.buckets) + 1)
+        total = float(values.sum())
+        with self._lock:
+            state = self._state(key)
+            for slot, count in enumerate(counts.tolist()):
+                state[0][slot] += count
+            state[1] += total
+
+    def snapshot(self):
+        with self._lock:
+            return sorted((key, (list(state[0]), state[1])) for key, state in self._values.items())
+
+    def render(self, samples=None, labelnames=None):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in self.snapshot() if samples is None else samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """
+    A set of metrics rendered together by /metrics. With a directory, the
+    metrics of every process sharing it are merged (call start() in each).
+    """
+
+    def __init__(self, directory=None, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = []
+        self._created_pid = os.getpid()
+        self._started_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Counter(name, documentation, labelnames, callback))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def start(self):
+        """Write this process's snapshot every flush_interval seconds and at exit (once per process)."""
+        if not self.directory or self._started_pid == os.getpid():
+            return
+        if os.getpid() != self._created_pid:
+            # A worker forked from a preloading master: what the master counted is not this worker's
+            for metric in self._metrics:
+                metric.reset()
+        self._started_pid = os.getpid()
+        atexit.register(self.flush)
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def flush(self):
+        """Write this process's snapshot to <directory>/<pid>.json."""
+        snapshot = {metric.name: metric.snapshot() for metric in self._metrics}
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        # Write-then-rename so a scrape never reads half a snapshot
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f)
+        os.replace(path + '.tmp', path)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # A failed snapshot only delays this worker's numbers until the next one
+                pass
+
+    def render(self):
+        if not self.directory:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+            return '\n'.join(lines) + '\n'
+
+        # Our own numbers are current; the other workers' are at most flush_interval old
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshots.append((int(os.path.basename(path)[:-len('.json')]), json.load(f)))
+            except (OSError, ValueError):
+                continue
+        live = {pid for pid, _ in snapshots if _alive(pid)}
+
+        lines = []
+        for metric in self._metrics:
+            if metric.kind == 'gauge':
+                samples = sorted(
+                    (tuple(key) + (str(pid),), value)
+                    for pid, snapshot in snapshots if pid in live
+                    for key, value in snapshot.get(metric.name, [])
+                )
+                lines.extend(metric.render(samples, metric.labelnames + ('pid',)))
+                continue
+            merged = {}
+            for _, snapshot in snapshots:
+                for key, value in snapshot.get(metric.name, []):
+                    key = tuple(key)
+                    if metric.kind == 'histogram':
+                        counts, total = merged.get(key, ([0] * len(value[0]), 0.0))
+                        merged[key] = ([a + b for a, b in zip(counts, value[0])], total + value[1])
+                    else:
+                        merged[key] = merged.get(key, 0) + value
+            lines.extend(metric.render(sorted(merged.items())))
+        return '\n'.join(lines) + '\n'
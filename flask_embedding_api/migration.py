@@ -0,0 +1,425 @@
+"""
+Background re-embedding of a stored collection with another model.
+
+A MigrationJob re-encodes the chunk texts of a collection into a shadow
+collection (<name>__<model>) and, once every chunk is there, switches the
+name to the shadow collection with one atomic alias write. The old
+collection stays on disk, reachable as <name>__previous.
+
+- progress is checkpointed (migration.json in the shadow collection) after
+  every batch; starting the same migration again resumes from there
+- texts are migrated shortest first, so the token-length batches carry
+  little padding, and identical texts are encoded once
+- the job keeps to cpu_share of the time (after each forward dispatch it
+  sleeps in proportion to the time it took) and waits while live requests
+  are queued
+- writes that reach the source collection during the migration are copied
+  over before and after the switch, and an IVF index on the source is
+  rebuilt on the new vectors before it
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from vector_store import CollectionError, VectorCollection
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = 'migration.json'
+ORDER_FILE = 'migration_order.json'
+LOCK_FILE = 'migration.lock'
+# Longest a dispatch waits for queued live requests before going ahead anyway
+MAX_YIELD_SECONDS = 1.0
+
+
+class MigrationError(CollectionError):
+    """The collection cannot be migrated (missing texts, same model, ...)."""
+
+
+class MigrationRunningError(MigrationError):
+    """Another job (in this or another process) is already running the migration."""
+
+
+def shadow_name(name, model):
+    """Collection that holds name re-encoded with model, e.g. curriculum__all-mpnet-base-v2."""
+    slug = re.sub(r'[^A-Za-z0-9_-]', '-', model.rstrip('/').split('/')[-1])[:30]
+    return f'{name[:32]}__{slug}'
+
+
+def previous_name(name):
+    return f'{name[:54]}__previous'
+
+
+def _text_key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _write_json(path, value):
+    # Write-then-rename so a crash never leaves a half-written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_status(store, name, model=None):
+    """
+    Checkpoint of the newest migration of name (or the one to model), or None.
+    A job that stopped without finishing is reported as "interrupted".
+    """
+    if model is not None:
+        candidates = [shadow_name(name, model)]
+    else:
+        prefix = f'{name[:32]}__'
+        candidates = [
+            entry for entry in os.listdir(store.root)
+            if entry.startswith(prefix) and os.path.exists(os.path.join(store.root, entry, CHECKPOINT_FILE))
+        ]
+    statuses = []
+    for target in candidates:
+        path = os.path.join(store.root, target, CHECKPOINT_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                status = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        if status['state'] == 'running':
+            lock_path = os.path.join(store.root, target, LOCK_FILE)
+            try:
+                with open(lock_path, 'r') as f:
+                    alive = _process_alive(int(f.read().strip() or 0))
+            except (FileNotFoundError, ValueError):
+                alive = False
+            if not alive:
+                status['state'] = 'interrupted'
+        statuses.append(status)
+    return max(statuses, key=lambda status: status['started_at']) if statuses else None
+
+
+class MigrationJob:
+    """
+    Re-encode collection name with model into its shadow collection.
+
+    encode(texts) returns normalized float32 embeddings from model. Call
+    start() to run on a background thread, or run() to run in the caller.
+    is_busy(), if given, reports whether live requests are waiting.
+    """
+
+    def __init__(self, store, name, model, encode, batch_size=256, dispatch_size=64, cpu_share=0.5, is_busy=None):
+        if not 0.0 < cpu_share <= 1.0:
+            raise MigrationError('cpu_share must be in (0, 1]')
+        if batch_size < 1 or dispatch_size < 1:
+            raise MigrationError('batch_size and dispatch_size must be positive')
+        source = store.get(name)
+        if source is None:
+            raise MigrationError(f"Index '{name}' not found")
+        if source.model == model:
+            raise MigrationError(f"Index '{name}' already uses model '{model}'")
+
+        self.store = store
+        self.name = name
+        self.model = model
+        self.encode = encode
+        self.batch_size = batch_size
+        self.dispatch_size = dispatch_size
+        self.cpu_share = cpu_share
+        self.is_busy = is_busy
+        self.source_name = source.name
+        self.target_name = shadow_name(name, model)
+        if self.target_name == self.source_name:
+            raise MigrationError(f"Index '{name}' is already the migration target for '{model}'")
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = {}
+        self._keys = {}
+        self.status = None
+
+    # -- collections ---------------------------------------------------------
+
+    def _source(self):
+        return self.store.get(self.source_name, follow_aliases=False)
+
+    def _target(self):
+        return self.store.get(self.target_name, create=True, follow_aliases=False)
+
+    def _path(self, filename):
+        return os.path.join(self.store.root, self.target_name, filename)
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self):
+        """Claim the migration and run it on a daemon thread; returns the initial status."""
+        self._acquire()
+        try:
+            self._prepare()
+        except Exception:
+            self._release()
+            raise
+        self._thread = threading.Thread(target=self._run_claimed, name=f'migrate-{self.name}', daemon=True)
+        self._thread.start()
+        return dict(self.status)
+
+    def run(self):
+        self._acquire()
+        try:
+            self._prepare()
+        except Exception:
+            self._release()
+            raise
+        self._run_claimed()
+        return dict(self.status)
+
+    def stop(self):
+        """Stop after the current dispatch; the checkpoint stays and the job can be resumed."""
+        self._stop.set()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _acquire(self):
+        """Only one process may run a given migration: an exclusive lock file with its pid."""
+        self._target()
+        path = self._path(LOCK_FILE)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    with open(path, 'r') as f:
+                        holder = int(f.read().strip() or 0)
+                except (FileNotFoundError, ValueError):
+                    holder = 0
+                if holder and _process_alive(holder):
+                    raise MigrationRunningError(f"A migration of '{self.name}' to '{self.model}' is already running")
+                # Left behind by a process that died: take it over
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(str(os.getpid()))
+            return
+        raise MigrationError(f"Could not lock the migration of '{self.name}'")
+
+    def _release(self):
+        try:
+            os.remove(self._path(LOCK_FILE))
+        except FileNotFoundError:
+            pass
+
+    def _prepare(self):
+        """Load the checkpoint to resume, or snapshot the source ids (shortest text first)."""
+        try:
+            with open(self._path(CHECKPOINT_FILE), 'r', encoding='utf-8') as f:
+                status = json.load(f)
+            with open(self._path(ORDER_FILE), 'r', encoding='utf-8') as f:
+                order = json.load(f)
+        except (FileNotFoundError, ValueError):
+            status, order = None, None
+
+        if status is None or status['state'] == 'completed' or status['source'] != self.source_name:
+            source = self._source()
+            with source.lock:
+                missing = sum(1 for document in source.documents if document is None)
+                order = [item_id for _, item_id in sorted(
+                    (len(document or ''), item_id) for item_id, document in zip(source.ids, source.documents)
+                )]
+                source_model = source.model
+            if missing:
+                raise MigrationError(
+                    f"Index '{self.name}' has {missing} vectors without stored text; they cannot be re-encoded"
+                )
+            target = self._target()
+            if target.count:
+                target.delete(ids=list(target.ids))
+            status = {
+                'index': self.name,
+                'source': self.source_name,
+                'target': self.target_name,
+                'source_model': source_model,
+                'model': self.model,
+                'total': len(order),
+                'cursor': 0,
+                'encoded': 0,
+                'reused': 0,
+                'started_at': time.time(),
+                'finished_at': None,
+                'busy_seconds': 0.0,
+                'error': None
+            }
+            _write_json(self._path(ORDER_FILE), order)
+
+        status.update({
+            'state': 'running',
+            'batch_size': self.batch_size,
+            'cpu_share': self.cpu_share,
+            'updated_at': time.time()
+        })
+        self._order = order
+        self.status = status
+        self._checkpoint()
+
+        # Texts already migrated (on resume) can be reused by id
+        target = self._target()
+        with target.lock:
+            self._keys = {item_id: _text_key(document) for item_id, document in zip(target.ids, target.documents)}
+        self._seen = {}
+        for item_id, key in self._keys.items():
+            self._seen.setdefault(key, item_id)
+
+    def _checkpoint(self, **changes):
+        self.status.update(changes, updated_at=time.time())
+        _write_json(self._path(CHECKPOINT_FILE), self.status)
+
+    def _run_claimed(self):
+        try:
+            while self.status['cursor'] < len(self._order):
+                if self._stop.is_set():
+                    self._checkpoint(state='stopped')
+                    logger.info(f"Migration of '{self.name}' stopped at {self.status['cursor']}/{self.status['total']}")
+                    return
+                ids = self._order[self.status['cursor']:self.status['cursor'] + self.batch_size]
+                self._migrate(self._source().records(ids))
+                self._checkpoint(cursor=self.status['cursor'] + len(ids))
+
+            self._switch()
+            self._checkpoint(state='completed', finished_at=time.time())
+            logger.info(
+                f"Migrated '{self.name}' to '{self.model}': {self.status['encoded']} encoded, "
+                f"{self.status['reused']} reused, now served from '{self.target_name}'"
+            )
+        except Exception as e:
+            logger.error(f"Migration of '{self.name}' failed: {str(e)}")
+            self._checkpoint(state='failed', error=str(e))
+        finally:
+            self._release()
+
+    # -- work ----------------------------------------------------------------
+
+    def _migrate(self, records):
+        """Encode records (id, text, metadata) into the target, reusing vectors of texts seen before."""
+        if not records:
+            return
+        if any(document is None for _, document, _ in records):
+            raise MigrationError('Chunks without stored text cannot be re-encoded')
+        target = self._target()
+        keys = [_text_key(document) for _, document, _ in records]
+
+        reused = [i for i, key in enumerate(keys) if key in self._seen]
+        reused_vectors = target.get_vectors([self._seen[keys[i]] for i in reused]) if reused else None
+        if reused_vectors is None:
+            reused = []
+
+        # One encode per distinct new text
+        firsts = {}
+        for i, key in enumerate(keys):
+            if key not in self._seen or not reused:
+                firsts.setdefault(key, i)
+        new_vectors = self._encode([records[i][1] for i in firsts.values()]) if firsts else None
+
+        rows = {}
+        for position, i in enumerate(reused):
+            rows[keys[i]] = reused_vectors[position]
+        for position, key in enumerate(firsts):
+            rows[key] = new_vectors[position]
+        vectors = np.vstack([rows[key] for key in keys])
+
+        target.upsert(
+            [item_id for item_id, _, _ in records],
+            vectors,
+            documents=[document for _, document, _ in records],
+            metadatas=[metadata for _, _, metadata in records],
+            model=self.model
+        )
+        for (item_id, _, _), key in zip(records, keys):
+            # A synced row may have replaced the text another one was reusing
+            old_key = self._keys.get(item_id)
+            if old_key is not None and old_key != key and self._seen.get(old_key) == item_id:
+                del self._seen[old_key]
+            self._keys[item_id] = key
+            self._seen.setdefault(key, item_id)
+        self.status['encoded'] += len(firsts)
+        self.status['reused'] += len(records) - len(firsts)
+
+    def _encode(self, texts):
+        """Encode in dispatch_size slices, keeping to cpu_share and letting queued live requests go first."""
+        output = []
+        for start in range(0, len(texts), self.dispatch_size):
+            if self.is_busy is not None:
+                deadline = time.monotonic() + MAX_YIELD_SECONDS
+                while self.is_busy() and time.monotonic() < deadline:
+                    time.sleep(0.005)
+            began = time.perf_counter()
+            output.append(np.asarray(self.encode(texts[start:start + self.dispatch_size]), dtype=np.float32))
+            busy = time.perf_counter() - began
+            self.status['busy_seconds'] += busy
+            if self.cpu_share < 1.0:
+                self._stop.wait(busy * (1.0 - self.cpu_share) / self.cpu_share)
+        return np.vstack(output)
+
+    def _sync(self, source):
+        """Copy changes made to the source since its rows were migrated. Returns how many rows differed."""
+        target = self._target()
+        with source.lock:
+            wanted = {item_id: (document, metadata) for item_id, document, metadata in zip(source.ids, source.documents, source.metadatas)}
+        with target.lock:
+            current = {item_id: (document, metadata) for item_id, document, metadata in zip(target.ids, target.documents, target.metadatas)}
+
+        changed = [item_id for item_id, value in wanted.items() if current.get(item_id) != value]
+        removed = [item_id for item_id in current if item_id not in wanted]
+        if removed:
+            target.delete(ids=removed)
+            for item_id in removed:
+                key = self._keys.pop(item_id, None)
+                if key is not None and self._seen.get(key) == item_id:
+                    del self._seen[key]
+        for start in range(0, len(changed), self.batch_size):
+            self._migrate(source.records(changed[start:start + self.batch_size]))
+        return len(changed) + len(removed)
+
+    def _switch(self):
+        source = self._source()
+        # Catch up without blocking writers, then once more while holding the source lock
+        for _ in range(3):
+            if self._sync(source) <= self.batch_size:
+                break
+        # The new vectors need their own IVF lists; train them before queries arrive
+        target = self._target()
+        if source.ann is not None and target.count:
+            target.build_ann(nlist=source.ann.nlist, nprobe=source.ann.nprobe)
+        with source.lock:
+            self._sync(source)
+            self.store.set_aliases({
+                self.name: self.target_name,
+                previous_name(self.name): self.source_name
+            })
+
+        # Other worker processes may have written the old collection before they saw the alias
+        stragglers = self._sync(VectorCollection(source.path, source.name))
+        if stragglers:
+            logger.info(f"Copied {stragglers} late writes to '{self.target_name}'")
+
+        # Document fingerprints (dedup) carry over: ids and chunking are unchanged
+        fingerprints = os.path.join(source.path, 'fingerprints.json')
+        if os.path.exists(fingerprints):
+            shutil.copyfile(fingerprints, self._path('fingerprints.json'))
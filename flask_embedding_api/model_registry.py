@@ -0,0 +1,170 @@
+"""
+Registry of embedding models loaded lazily by name.
+
+Models are loaded on first use and kept in LRU order. When the estimated
+weight memory of the loaded models exceeds the budget, the least recently
+used ones are unloaded, skipping the default model and any model that a
+request is still using. The default model can be swapped at runtime: the new
+model is loaded before the switch, and requests already holding the old one
+finish with it.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotAllowedError(ValueError):
+    """Raised when a request names a model outside the allowed set."""
+
+
+def estimate_model_bytes(model):
+    """Approximate resident weight size of a loaded model."""
+    if hasattr(model, 'parameters'):
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        if hasattr(model, 'buffers'):
+            total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return int(total)
+    path = getattr(model, 'model_path', None)
+    if path and os.path.exists(path):
+        return os.path.getsize(path)
+    return 0
+
+
+class ModelRegistry:
+    """
+    Lazily loaded models keyed by name.
+
+    loader(name) returns a model object. allowed_models limits which names
+    requests may ask for (None allows any). memory_budget_mb bounds the
+    estimated weight memory of loaded models (None disables eviction).
+    """
+
+    def __init__(self, loader, default_model, allowed_models=None, memory_budget_mb=None):
+        self._loader = loader
+        self._default = default_model
+        self.allowed_models = set(allowed_models) | {default_model} if allowed_models else None
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else None
+
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._in_use = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    @property
+    def default_model(self):
+        return self._default
+
+    def resolve(self, name=None):
+        """Return the model name a request should use, or raise ModelNotAllowedError."""
+        if name is None:
+            return self._default
+        if not isinstance(name, str) or not name:
+            raise ModelNotAllowedError('model must be a non-empty string')
+        if self.allowed_models is not None and name not in self.allowed_models:
+            raise ModelNotAllowedError(
+                f"Model '{name}' is not available. Use one of: {', '.join(sorted(self.allowed_models))}"
+            )
+        return name
+
+    def is_loaded(self, name=None):
+        with self._lock:
+            return (name or self._default) in self._models
+
+    def loaded_models(self):
+        with self._lock:
+            return list(self._models)
+
+    def get(self, name=None):
+        """Return the loaded model, loading it on first use."""
+        name = self.resolve(name)
+        with self._lock:
+            model = self._models.get(name)
+            if model is not None:
+                self._models.move_to_end(name)
+                return model
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Load outside the registry lock so other models keep serving meanwhile
+        with load_lock:
+            with self._lock:
+                model = self._models.get(name)
+            if model is None:
+                started = time.perf_counter()
+                model = self._loader(name)
+                elapsed = time.perf_counter() - started
+                size = estimate_model_bytes(model)
+                with self._lock:
+                    self._models[name] = model
+                    self._sizes[name] = size
+                    self.loads += 1
+                    self.load_seconds += elapsed
+                logger.info(f"Loaded model {name} in {elapsed:.1f}s (~{size / 1024 / 1024:.0f} MB)")
+                self._evict(keep=name)
+        return model
+
+    @contextmanager
+    def use(self, name=None):
+        """Hold a model for the duration of a forward pass so it cannot be evicted."""
+        name = self.resolve(name)
+        with self._lock:
+            self._in_use[name] = self._in_use.get(name, 0) + 1
+        try:
+            yield self.get(name)
+        finally:
+            with self._lock:
+                self._in_use[name] -= 1
+                if self._in_use[name] == 0:
+                    del self._in_use[name]
+            self._evict()
+
+    def set_default(self, name):
+        """Make name the default model, loading it before the switch."""
+        name = self.resolve(name)
+        self.get(name)
+        with self._lock:
+            previous, self._default = self._default, name
+        logger.info(f"Default model switched from {previous} to {name}")
+        self._evict()
+        return previous
+
+    def _evict(self, keep=None):
+        if self.memory_budget_bytes is None:
+            return
+        with self._lock:
+            total = sum(self._sizes.values())
+            for name in list(self._models):
+                if total <= self.memory_budget_bytes:
+                    break
+                if name in (self._default, keep) or self._in_use.get(name):
+                    continue
+                del self._models[name]
+                total -= self._sizes.pop(name)
+                self.evictions += 1
+                logger.info(f"Evicted model {name} to stay within the model memory budget")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'default_model': self._default,
+                'loaded_models': [
+                    {'name': name, 'bytes': self._sizes.get(name, 0), 'in_use': self._in_use.get(name, 0)}
+                    for name in self._models
+                ],
+                'allowed_models': sorted(self.allowed_models) if self.allowed_models is not None else None,
+                'memory_bytes': sum(self._sizes.values()),
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'load_seconds': self.load_seconds
+            }
@@ -0,0 +1,199 @@
+"""
+ONNX Runtime backend for SentenceTransformer models on CPU.
+
+The transformer is exported to ONNX once (optionally with int8 dynamic
+quantization of the weights) and cached on disk together with its tokenizer
+and pooling settings. Later starts load the .onnx file directly, without torch.
+Pooling and normalization match the SentenceTransformer pipeline
+(Transformer -> Pooling -> optional Normalize).
+
+Requires: pip install onnx onnxruntime
+"""
+
+import inspect
+import json
+import logging
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_MODULES = ('Transformer', 'Pooling', 'Normalize')
+
+
+def _require_onnxruntime():
+    try:
+        import onnxruntime
+        return onnxruntime
+    except ImportError:
+        raise RuntimeError('onnxruntime is required for the ONNX backend. Install with: pip install onnx onnxruntime')
+
+
+def export_model(model_name, export_dir, quantize=False):
+    """
+    Export a SentenceTransformer model to export_dir.
+
+    Writes model.onnx (and model.int8.onnx when quantize is set), the
+    tokenizer files and an encoder.json with pooling/normalization settings.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(export_dir, exist_ok=True)
+    fp32_path = os.path.join(export_dir, 'model.onnx')
+    st_model = SentenceTransformer(model_name, device='cpu')
+
+    module_types = [type(module).__name__ for module in st_model]
+    unsupported = [name for name in module_types if name not in SUPPORTED_MODULES]
+    if unsupported:
+        raise ValueError(f"ONNX backend does not support modules {unsupported} in '{model_name}'")
+
+    pooling = 'mean'
+    for module in st_model:
+        if type(module).__name__ == 'Pooling':
+            if getattr(module, 'pooling_mode_cls_token', False):
+                pooling = 'cls'
+            elif getattr(module, 'pooling_mode_max_tokens', False):
+                pooling = 'max'
+
+    transformer = st_model[0]
+    tokenizer = transformer.tokenizer
+    auto_model = transformer.auto_model.eval()
+
+    if not os.path.exists(fp32_path):
+        sample = tokenizer(['export sample sentence'], padding=True, return_tensors='pt')
+        input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+
+        class _HiddenStates(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *inputs):
+                return self.inner(**dict(zip(input_names, inputs)), return_dict=True).last_hidden_state
+
+        dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+        dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+        export_kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # Newer torch defaults to the dynamo exporter, which needs onnxscript
+            export_kwargs['dynamo'] = False
+        logger.info(f"Exporting {model_name} to ONNX at {fp32_path}")
+        with torch.no_grad():
+            torch.onnx.export(
+                _HiddenStates(auto_model),
+                tuple(sample[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=['last_hidden_state'],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                do_constant_folding=True,
+                **export_kwargs
+            )
+
+    if quantize:
+        int8_path = os.path.join(export_dir, 'model.int8.onnx')
+        if not os.path.exists(int8_path):
+            _require_onnxruntime()
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            logger.info(f"Quantizing {fp32_path} to int8")
+            quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(export_dir)
+    with open(os.path.join(export_dir, 'encoder.json'), 'w') as f:
+        json.dump({
+            'model_name': model_name,
+            'max_seq_length': st_model.max_seq_length,
+            'dimension': st_model.get_sentence_embedding_dimension(),
+            'pooling': pooling,
+            'normalize': 'Normalize' in module_types
+        }, f, indent=2)
+
+
+class OnnxSentenceEncoder:
+    """
+    Drop-in replacement for the parts of SentenceTransformer the API uses:
+    encode(), tokenize(), tokenizer, max_seq_length and
+    get_sentence_embedding_dimension(). encode_features() runs already
+    tokenized batches (see batch_planner).
+    """
+
+    def __init__(self, model_name, quantize=False, cache_dir=None, num_threads=None):
+        onnxruntime = _require_onnxruntime()
+        from transformers import AutoTokenizer
+
+        cache_dir = cache_dir or os.getenv('ONNX_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx_models'))
+        export_dir = os.path.join(cache_dir, model_name.replace('/', '__'))
+        model_file = 'model.int8.onnx' if quantize else 'model.onnx'
+        if not os.path.exists(os.path.join(export_dir, model_file)) or not os.path.exists(os.path.join(export_dir, 'encoder.json')):
+            export_model(model_name, export_dir, quantize=quantize)
+
+        with open(os.path.join(export_dir, 'encoder.json')) as f:
+            settings = json.load(f)
+
+        self.model_name = model_name
+        self.quantized = quantize
+        self.max_seq_length = settings['max_seq_length']
+        self.pooling = settings['pooling']
+        self.normalize = settings['normalize']
+        self._dimension = settings['dimension']
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.model_path = os.path.join(export_dir, model_file)
+        self.session = onnxruntime.InferenceSession(
+            self.model_path,
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self._input_names = [node.name for node in self.session.get_inputs()]
+
+    def get_sentence_embedding_dimension(self):
+        return self._dimension
+
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, show_progress_bar=False,
+               convert_to_numpy=True, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.empty((0, self._dimension), dtype=np.float32)
+
+        embeddings = np.vstack([
+            self.encode_features(self.tokenize(texts[start:start + batch_size]), normalize_embeddings)
+            for start in range(0, len(texts), batch_size)
+        ])
+        return embeddings[0] if single else embeddings
+
+    def tokenize(self, texts):
+        """Padded numpy features for texts, truncated to max_seq_length."""
+        return self.tokenizer(
+            list(texts),
+            padding=True,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors='np'
+        )
+
+    def encode_features(self, features, normalize_embeddings=False):
+        """Pooled (and optionally normalized) float32 embeddings for tokenized features."""
+        inputs = {name: np.asarray(features[name], dtype=np.int64) for name in self._input_names}
+        hidden = self.session.run(None, inputs)[0]
+        embeddings = self._pool(hidden, np.asarray(features['attention_mask'])).astype(np.float32, copy=False)
+        if self.normalize or normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.maximum(norms, 1e-12)
+        return embeddings
+
+    def _pool(self, hidden, attention_mask):
+        if self.pooling == 'cls':
+            return hidden[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if self.pooling == 'max':
+            return np.where(mask > 0, hidden, -1e9).max(axis=1)
+        summed = (hidden * mask).sum(axis=1)
+        return summed / np.maximum(mask.sum(axis=1), 1e-9)
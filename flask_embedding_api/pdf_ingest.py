@@ -0,0 +1,253 @@
+"""
+Page-by-page PDF ingestion: text extraction, cleaning and incremental chunking.
+
+Pages are extracted on a producer thread and chunked as soon as they arrive,
+with the same rules as src/utils/textChunker.js (cleanText, then chunkText
+with a 1000-character window and 200 characters of overlap). Chunks reach
+the consumer through a bounded queue, so the first chunks can be encoded
+while the rest of the document is still being extracted.
+
+Requires: pip install pypdf
+"""
+
+import bisect
+import hashlib
+import io
+import queue
+import re
+import threading
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+# Characters of cleaned text kept as a preview (what uploadFile.js stores)
+PREVIEW_CHARS = 5000
+
+_WHITESPACE = re.compile(r'\s+')
+_DISALLOWED = re.compile(r'[^\w\s.,!?;:\-()]', re.ASCII)
+
+_END = object()
+
+
+class PdfIngestError(ValueError):
+    """The upload is not a PDF that text can be extracted from."""
+
+
+def clean_text(text):
+    """Python port of cleanText in src/utils/textChunker.js."""
+    return _DISALLOWED.sub('', _WHITESPACE.sub(' ', text)).strip()
+
+
+def open_pdf(data):
+    """Parse the PDF structure (bytes) up front, so unreadable files fail before any streaming."""
+    from pypdf import PdfReader
+    from pypdf.errors import PdfReadError
+
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        if reader.is_encrypted:
+            reader.decrypt('')
+        len(reader.pages)
+    except (PdfReadError, ValueError, KeyError) as e:
+        raise PdfIngestError(f'Could not read PDF: {str(e)}')
+    return reader
+
+
+def extract_pages(reader):
+    """Yield the text of each page, one page at a time."""
+    from pypdf.errors import PdfReadError
+
+    for number, page in enumerate(reader.pages):
+        try:
+            yield page.extract_text() or ''
+        except (PdfReadError, ValueError, KeyError) as e:
+            raise PdfIngestError(f'Could not extract text from page {number + 1}: {str(e)}')
+
+
+class IncrementalChunker:
+    """
+    chunkText over text that arrives in pieces. feed() returns the chunks
+    whose boundaries can no longer change; finish() returns the rest.
+
+    A chunk's end only depends on the chunk_size + 1 characters after its
+    start, so chunks are emitted as soon as that much text is buffered and
+    match what chunkText produces for the concatenated text.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+        if chunk_size < 1 or overlap < 0 or overlap >= chunk_size:
+            raise ValueError('chunk_size must be positive and overlap smaller than chunk_size')
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self._text = ''
+        self._offset = 0
+        self.length = 0
+
+    def feed(self, text):
+        """Append a piece of cleaned text; returns [(offset, chunk), ...]."""
+        if text:
+            if self.length:
+                text = ' ' + text
+            self._text += text
+            self.length += len(text)
+        return self._drain(final=False)
+
+    def finish(self):
+        return self._drain(final=True)
+
+    def _drain(self, final):
+        chunks = []
+        text = self._text
+        start = 0
+        while start < len(text):
+            end = start + self.chunk_size
+            if end < len(text):
+                # Prefer a sentence end, then a word boundary, past half the window
+                boundary = max(text.rfind('.', 0, end + 1), text.rfind('?', 0, end + 1), text.rfind('!', 0, end + 1))
+                if boundary > start + self.chunk_size * 0.5:
+                    end = boundary + 1
+                else:
+                    word_boundary = text.rfind(' ', 0, end + 1)
+                    if word_boundary > start + self.chunk_size * 0.5:
+                        end = word_boundary
+            elif not final:
+                # The last window is not full yet; more text may still move its end
+                break
+
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append((self._offset + start, chunk))
+            # Like chunkText, keep stepping after the last full window: while
+            # end - overlap is inside the text, the tail is emitted again
+            next_start = end - self.overlap
+            start = next_start if self._offset + next_start > 0 else end
+
+        start = min(start, len(text))
+        self._text = text[start:]
+        self._offset += start
+        return chunks
+
+
+class ChunkStream:
+    """
+    Iterate over (chunk_index, page_number, text) for a PDF while a producer
+    thread extracts and chunks the pages ahead of the consumer.
+
+    Up to max_pending chunks (about 1 KB each) are buffered, so extraction
+    normally runs to the end of the document well ahead of the encoder. A
+    tighter bound stretches the pure-Python extraction over the whole encode,
+    where it competes with the forward pass for the GIL. Closing the stream
+    (or abandoning the iterator) stops the producer. Statistics (pages,
+    characters, preview) are complete once iteration has finished.
+    fingerprint (SHA-256 of the cleaned text, as the chunker sees it) is set
+    as soon as the last page is extracted, usually well before the consumer
+    reaches the last chunk.
+
+    chunker replaces the character chunker with any object that has the
+    same feed()/finish()/length interface (e.g.
+    token_chunker.IncrementalTokenChunker).
+    """
+
+    def __init__(self, pages, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, max_pending=4096, chunker=None):
+        self.chunker = chunker or IncrementalChunker(chunk_size, overlap)
+        self.pages = 0
+        self.preview = ''
+        self.fingerprint = None
+        self._page_starts = []
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._produce, args=(pages,), name='pdf-ingest', daemon=True)
+        self._thread.start()
+
+    @property
+    def characters(self):
+        return self.chunker.length
+
+    def _page_of(self, offset):
+        return bisect.bisect_right(self._page_starts, offset)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, pages):
+        index = 0
+        digest = hashlib.sha256()
+        try:
+            for raw in pages:
+                if self._stop.is_set():
+                    return
+                text = clean_text(raw)
+                self.pages += 1
+                if text:
+                    digest.update(((' ' if self.chunker.length else '') + text).encode('utf-8'))
+                # Where this page's text starts: after the joining space, if any.
+                # An empty page shares its start with the next page, which wins the lookup.
+                self._page_starts.append(self.chunker.length + (1 if self.chunker.length else 0))
+                chunks = self.chunker.feed(text)
+                if len(self.preview) < PREVIEW_CHARS and text:
+                    self.preview = (self.preview + ' ' + text).strip()[:PREVIEW_CHARS]
+                for offset, chunk in chunks:
+                    if not self._put((index, self._page_of(offset), chunk)):
+                        return
+                    index += 1
+            self.fingerprint = digest.hexdigest()
+            for offset, chunk in self.chunker.finish():
+                if not self._put((index, self._page_of(offset), chunk)):
+                    return
+                index += 1
+            self._put(_END)
+        except Exception as e:
+            self._put(e)
+
+    def _take(self, block):
+        """Next chunk, None if none is ready (block=False), or _END."""
+        try:
+            item = self._queue.get(block=block)
+        except queue.Empty:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._take(block=True)
+                if item is _END:
+                    return
+                yield item
+        finally:
+            self.close()
+
+    def batches(self, max_size):
+        """
+        Yield lists of up to max_size chunks. Waits for one chunk, then takes
+        whatever else is already extracted instead of waiting for a full
+        batch, so the encoder never idles while chunks are ready and batches
+        grow on their own when extraction runs ahead.
+        """
+        try:
+            while True:
+                item = self._take(block=True)
+                if item is _END:
+                    return
+                batch = [item]
+                while len(batch) < max_size:
+                    item = self._take(block=False)
+                    if item is None:
+                        break
+                    if item is _END:
+                        yield batch
+                        return
+                    batch.append(item)
+                yield batch
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
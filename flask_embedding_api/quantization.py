@@ -0,0 +1,171 @@
+"""
+Scalar int8 and 1-bit binary quantization of embeddings.
+
+- int8: each row is scaled by its max absolute value into [-127, 127] and
+  keeps one float32 scale (~4x smaller than float32)
+- binary: each dimension keeps only its sign, packed 8 per byte (~32x
+  smaller); search uses Hamming distance via popcount
+
+Either search can be followed by a rescoring pass that re-ranks the best
+candidates with their float vectors to recover accuracy.
+"""
+
+import numpy as np
+
+from topk import MAX_BLOCK_ELEMENTS, top_k_search
+
+QUANTIZATION_TYPES = ('int8', 'binary')
+
+# Number of set bits in every possible byte value (fallback for numpy < 2.0)
+POPCOUNT_TABLE = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+# Candidates kept per requested result before float rescoring
+DEFAULT_RESCORE_FACTOR = {'int8': 4, 'binary': 10}
+
+
+def quantize_int8(vectors):
+    """Return (codes, scales) with codes int8 (n, d) and scales float32 (n,)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_int8(codes, scales):
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+def quantize_binary(vectors):
+    """Pack the sign of every dimension: (n, d) float -> (n, ceil(d / 8)) uint8."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+
+def dequantize_binary(packed, dimension):
+    """Unit-length +-1/sqrt(d) vectors from packed sign bits."""
+    bits = np.unpackbits(np.atleast_2d(packed), axis=1, count=dimension)
+    return (bits.astype(np.float32) * 2.0 - 1.0) / np.sqrt(dimension)
+
+
+def _as_words(packed):
+    """View packed codes as uint64 words when the row width allows it."""
+    packed = np.ascontiguousarray(np.atleast_2d(packed))
+    if packed.shape[1] % 8 == 0:
+        return packed.view(np.uint64)
+    return packed
+
+
+def hamming_distances(packed_queries, packed_documents):
+    """Pairwise Hamming distances (q, n) between packed bit codes via popcount."""
+    queries = _as_words(packed_queries)
+    documents = _as_words(packed_documents)
+    distances = np.empty((len(queries), len(documents)), dtype=np.int32)
+    for row, query in enumerate(queries):
+        xor = np.bitwise_xor(documents, query)
+        if hasattr(np, 'bitwise_count'):
+            distances[row] = np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+        else:
+            distances[row] = POPCOUNT_TABLE[xor.view(np.uint8)].sum(axis=1, dtype=np.int32)
+    return distances
+
+
+def memory_report(count, dimension):
+    """Bytes needed to hold count vectors in each representation."""
+    float_bytes = count * dimension * 4
+    int8_bytes = count * dimension + count * 4
+    binary_bytes = count * ((dimension + 7) // 8)
+    return {
+        'float32_bytes': float_bytes,
+        'int8_bytes': int8_bytes,
+        'binary_bytes': binary_bytes,
+        'int8_ratio': float_bytes / int8_bytes if int8_bytes else 0.0,
+        'binary_ratio': float_bytes / binary_bytes if binary_bytes else 0.0
+    }
+
+
+class QuantizedVectors:
+    """Quantized codes for a float matrix, with optional float rescoring."""
+
+    def __init__(self, kind, dimension, codes, scales=None):
+        if kind not in QUANTIZATION_TYPES:
+            raise ValueError(f"Unknown quantization '{kind}'. Use one of: {', '.join(QUANTIZATION_TYPES)}")
+        self.kind = kind
+        self.dimension = dimension
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def from_vectors(cls, vectors, kind):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dimension = vectors.shape[1]
+        if kind == 'int8':
+            codes, scales = quantize_int8(vectors)
+            return cls(kind, dimension, codes, scales)
+        return cls(kind, dimension, quantize_binary(vectors))
+
+    @property
+    def nbytes(self):
+        return int(self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+    def search(self, queries, top_k, float_vectors=None, rescore_factor=None, min_score=None, mask=None):
+        """
+        Approximate top-k against the codes.
+
+        When float_vectors is given, the best top_k * rescore_factor candidates
+        are re-ranked with exact float scores (only those rows are read, so a
+        memory-mapped float matrix stays mostly on disk).
+        Returns one (indices, scores) pair per query.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTOR[self.kind]
+        candidates = top_k * rescore_factor if float_vectors is not None else top_k
+        matches = self._search_codes(queries, candidates, mask)
+
+        if float_vectors is None:
+            if min_score is not None:
+                matches = [(rows[scores >= min_score], scores[scores >= min_score]) for rows, scores in matches]
+            return matches
+
+        rescored = []
+        for query, (rows, _) in zip(queries, matches):
+            if len(rows) == 0:
+                rescored.append((rows, np.empty(0, dtype=np.float32)))
+                continue
+            rows = np.sort(rows)
+            indices, scores = top_k_search(query, float_vectors[rows], top_k, min_score=min_score)[0]
+            rescored.append((rows[indices], scores))
+        return rescored
+
+    def _search_codes(self, queries, top_k, mask):
+        if self.kind == 'int8':
+            # Dequantize in row blocks so the float copy stays bounded
+            results = [([], []) for _ in queries]
+            block_rows = max(1, MAX_BLOCK_ELEMENTS // max(self.dimension, 1))
+            for start in range(0, len(self.codes), block_rows):
+                block = dequantize_int8(self.codes[start:start + block_rows], self.scales[start:start + block_rows])
+                block_mask = None if mask is None else mask[start:start + block_rows]
+                for slot, (rows, scores) in enumerate(top_k_search(queries, block, top_k, mask=block_mask)):
+                    results[slot][0].append(rows + start)
+                    results[slot][1].append(scores)
+            merged = []
+            for rows, scores in results:
+                rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+                scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+                order = np.argsort(-scores, kind='stable')[:top_k]
+                merged.append((rows[order], scores[order]))
+            return merged
+
+        # binary: smaller Hamming distance = more similar; map to a cosine-like score
+        distances = hamming_distances(quantize_binary(queries), self.codes)
+        scores = 1.0 - 2.0 * distances.astype(np.float32) / self.dimension
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        k = min(top_k, scores.shape[1])
+        matches = []
+        for row_scores in scores:
+            best = np.argpartition(-row_scores, k - 1)[:k] if k < len(row_scores) else np.arange(len(row_scores))
+            best = best[np.argsort(-row_scores[best], kind='stable')]
+            keep = np.isfinite(row_scores[best])
+            matches.append((best[keep], row_scores[best][keep]))
+        return matches
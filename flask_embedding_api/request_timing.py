@@ -0,0 +1,90 @@
+"""
+Per-request phase timing and opt-in profiling.
+
+Every request gets a RequestTimings object (flask.g.timings). Code on the
+request path wraps its phases in phase('name'). Work done for the request on
+the scheduler thread (queue wait, tokenization, forward pass) is merged in
+when the batch returns. The phases are sent back as a Server-Timing header:
+
+    Server-Timing: parse;dur=0.41, validate;dur=0.02, cache;dur=0.10, queue;dur=0.05,
+                   tokenize;dur=1.20, forward;dur=14.8, serialize;dur=0.90, total;dur=17.6
+
+Profiling a single request with cProfile is opt-in (see start_profile).
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from flask import g, has_request_context
+
+PROFILE_ID_LENGTH = 16
+
+
+class RequestTimings:
+    """Accumulated seconds per named phase, in first-seen order."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def merge(self, phases):
+        for name, seconds in phases.items():
+            self.add(name, seconds)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def header(self):
+        parts = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.phases.items()]
+        parts.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.2f}')
+        return ', '.join(parts)
+
+
+def current():
+    """The RequestTimings of the current request, or None outside a request."""
+    if has_request_context():
+        return g.get('timings')
+    return None
+
+
+def phase(name):
+    """Time a block as a phase of the current request (no-op outside a request)."""
+    timings = current()
+    return timings.phase(name) if timings is not None else nullcontext()
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def save_profile(profiler, directory, label, limit=60):
+    """
+    Stop the profiler and write <id>.prof (for snakeviz/pstats) and a text
+    report <id>.txt sorted by cumulative time. Returns the profile id.
+    """
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    profile_id = uuid.uuid4().hex[:PROFILE_ID_LENGTH]
+    profiler.dump_stats(os.path.join(directory, f'{profile_id}.prof'))
+
+    report = io.StringIO()
+    report.write(f'{label}\n\n')
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(limit)
+    with open(os.path.join(directory, f'{profile_id}.txt'), 'w', encoding='utf-8') as f:
+        f.write(report.getvalue())
+    return profile_id
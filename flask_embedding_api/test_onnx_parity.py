@@ -0,0 +1,93 @@
+"""
+Parity check for the ONNX backends against the PyTorch SentenceTransformer.
+
+Encodes a fixed corpus with both and fails (exit code 1) if any row's cosine
+similarity to the torch embedding drops below the threshold for its backend.
+
+Usage:
+    python test_onnx_parity.py
+    EMBEDDING_MODEL=all-mpnet-base-v2 python test_onnx_parity.py
+"""
+
+import os
+import sys
+import logging
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2')
+
+# Minimum per-row cosine similarity to the torch output
+THRESHOLDS = {
+    'onnx': 0.999,
+    'onnx-int8': 0.98
+}
+
+CORPUS = [
+    "Photosynthesis converts light energy into chemical energy stored in glucose.",
+    "The mitochondria is the powerhouse of the cell.",
+    "Newton's second law states that force equals mass times acceleration.",
+    "A quadratic equation has at most two real roots.",
+    "The French Revolution began in 1789 with the storming of the Bastille.",
+    "Supply and demand determine the market price of goods.",
+    "Water boils at 100 degrees Celsius at sea level.",
+    "Shakespeare wrote Hamlet, Macbeth and King Lear.",
+    "The derivative of sin(x) is cos(x).",
+    "Plate tectonics explains the movement of the Earth's lithosphere.",
+    "Learning objectives: students will be able to describe the water cycle.",
+    "Short",
+    "",
+    "Chapter 3 " + "covers the structure of DNA and protein synthesis in detail. " * 40,
+]
+
+
+def cosine_rows(a, b):
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return (a * b).sum(axis=1)
+
+
+def test_onnx_parity():
+    from sentence_transformers import SentenceTransformer
+    from onnx_backend import OnnxSentenceEncoder
+
+    reference_model = SentenceTransformer(MODEL_NAME, device='cpu')
+    failures = []
+
+    for normalize in (True, False):
+        reference = reference_model.encode(CORPUS, batch_size=4, normalize_embeddings=normalize, convert_to_numpy=True)
+
+        for backend, threshold in THRESHOLDS.items():
+            encoder = OnnxSentenceEncoder(MODEL_NAME, quantize=backend == 'onnx-int8')
+            embeddings = encoder.encode(CORPUS, batch_size=4, normalize_embeddings=normalize)
+            if embeddings.shape != reference.shape:
+                failures.append(f"{backend}: shape {embeddings.shape} != {reference.shape}")
+                continue
+
+            similarity = cosine_rows(reference, embeddings)
+            worst = int(np.argmin(similarity))
+            logger.info(
+                f"{backend} (normalize={normalize}): min cosine {similarity.min():.5f}, "
+                f"mean {similarity.mean():.5f}, threshold {threshold}"
+            )
+            if similarity.min() < threshold:
+                failures.append(f"{backend}: cosine {similarity[worst]:.5f} < {threshold} for row {worst}")
+            if normalize:
+                norms = np.linalg.norm(embeddings, axis=1)
+                if not np.allclose(norms, 1.0, atol=1e-3):
+                    failures.append(f"{backend}: normalized embeddings are not unit length")
+
+    assert not failures, '; '.join(failures)
+
+
+if __name__ == '__main__':
+    try:
+        test_onnx_parity()
+        logger.info("Test PASSED: ONNX backends match the torch model.")
+    except Exception as e:
+        logger.error(f"Test FAILED: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,191 @@
+"""
+Tokenizer-aware chunking that fits the model's max_seq_length.
+
+Character-based chunks (textChunker.js: 1000 characters) are often longer
+than the model's token limit, and the model silently drops everything past
+it. This chunker counts with the model's own tokenizer instead:
+
+- the text is tokenized once (with character offsets) and split into
+  sentences
+- whole sentences are packed greedily into each chunk up to the token
+  budget (max_seq_length minus the special tokens); a sentence longer than
+  the budget is split at word boundaries
+- consecutive chunks overlap by up to overlap_tokens, starting at a sentence
+  (or word) boundary inside that window
+- every chunk is re-tokenized on its own and shortened if it does not fit,
+  so no chunk is ever truncated by the model
+
+Greedy packing gives the fewest chunks that cover the text under these
+rules. Chunks carry character offsets into the source text.
+"""
+
+import re
+import threading
+
+import numpy as np
+
+# A sentence ends at . ! or ? (optionally followed by closing quotes or brackets)
+# and whitespace, or at a line break
+_SENTENCE_END = re.compile(r'[.!?]["\')\]]*\s+|\n+')
+
+# Chunks an incremental chunker may hold back waiting for a sentence end
+MAX_PENDING_CHUNKS = 8
+
+
+def sentence_starts(text):
+    """Character offsets where sentences start (the first one is 0)."""
+    starts = [0]
+    for match in _SENTENCE_END.finditer(text):
+        if match.end() < len(text):
+            starts.append(match.end())
+    return starts
+
+
+class TokenChunker:
+    """
+    Split text into chunks of at most max_tokens tokens (special tokens
+    included), overlapping by up to overlap_tokens.
+
+    tokenizer is a Hugging Face fast tokenizer (it must return offset
+    mappings). A fast tokenizer cannot be used from two threads at once, so
+    pass one that is not shared with the encoder; lock, if given, is held
+    around every tokenizer call so several chunkers can share one copy.
+    """
+
+    def __init__(self, tokenizer, max_tokens, overlap_tokens=0, lock=None):
+        self.tokenizer = tokenizer
+        self.lock = lock or threading.Lock()
+        self.max_tokens = int(max_tokens)
+        self.special_tokens = len(self._tokenize('')['input_ids'])
+        self.budget = self.max_tokens - self.special_tokens
+        if self.budget < 1:
+            raise ValueError(f'max_tokens must be larger than the {self.special_tokens} special tokens')
+        if overlap_tokens < 0 or overlap_tokens >= self.budget:
+            raise ValueError(
+                f'overlap_tokens must be between 0 and {self.budget - 1} '
+                f'(max_tokens minus {self.special_tokens} special tokens, minus 1)'
+            )
+        self.overlap_tokens = int(overlap_tokens)
+
+    def _tokenize(self, text, **kwargs):
+        with self.lock:
+            return self.tokenizer(text, **kwargs)
+
+    def count(self, text):
+        """Tokens the model sees for text, special tokens included."""
+        return len(self._tokenize(text)['input_ids'])
+
+    def chunk(self, text):
+        """Return [{"text", "start", "end", "num_tokens"}, ...] with character offsets (end exclusive)."""
+        encoded = self._tokenize(text, add_special_tokens=False, return_offsets_mapping=True)
+        spans = [(start, end) for start, end in encoded['offset_mapping'] if end > start]
+        if not spans:
+            return []
+        starts = np.array([start for start, _ in spans], dtype=np.int64)
+        ends = np.array([end for _, end in spans], dtype=np.int64)
+        total = len(spans)
+
+        # Token indices that start a sentence or a word (a gap before the token)
+        sentence_tokens = np.unique(np.searchsorted(starts, sentence_starts(text), side='left'))
+        sentence_tokens = sentence_tokens[sentence_tokens < total]
+        word_tokens = np.flatnonzero(np.r_[True, starts[1:] > ends[:-1]])
+
+        chunks = []
+        first = 0
+        while first < total:
+            last = self._pack(first, total, sentence_tokens, word_tokens)
+            last, num_tokens = self._fit(text, starts, ends, first, last, word_tokens)
+            char_start, char_end = int(starts[first]), int(ends[last - 1])
+            chunks.append({
+                'text': text[char_start:char_end],
+                'start': char_start,
+                'end': char_end,
+                'num_tokens': num_tokens
+            })
+            if last >= total:
+                break
+            first = self._next_start(first, last, sentence_tokens, word_tokens)
+        return chunks
+
+    def _pack(self, first, total, sentence_tokens, word_tokens):
+        """End (exclusive token index) of the chunk starting at first."""
+        limit = first + self.budget
+        if limit >= total:
+            return total
+        for boundaries in (sentence_tokens, word_tokens):
+            # The last boundary in (first, limit] ends the chunk before it
+            position = np.searchsorted(boundaries, limit, side='right') - 1
+            if position >= 0 and boundaries[position] > first:
+                return int(boundaries[position])
+        return limit
+
+    def _fit(self, text, starts, ends, first, last, word_tokens):
+        """Shorten [first, last) until the slice re-tokenizes within max_tokens."""
+        while True:
+            num_tokens = self.count(text[starts[first]:ends[last - 1]])
+            excess = num_tokens - self.max_tokens
+            if excess <= 0 or last - first <= 1:
+                return last, num_tokens
+            target = max(first + 1, last - excess)
+            position = np.searchsorted(word_tokens, target, side='right') - 1
+            boundary = int(word_tokens[position]) if position >= 0 else first
+            last = boundary if boundary > first else target
+
+    def _next_start(self, first, last, sentence_tokens, word_tokens):
+        """Start of the next chunk: the earliest boundary within overlap_tokens of last."""
+        if self.overlap_tokens == 0 or last - first <= self.overlap_tokens:
+            return last
+        window = last - self.overlap_tokens
+        for boundaries in (sentence_tokens, word_tokens):
+            position = np.searchsorted(boundaries, window, side='left')
+            if position < len(boundaries) and boundaries[position] < last:
+                return int(boundaries[position])
+        return window
+
+
+class IncrementalTokenChunker:
+    """
+    TokenChunker over text that arrives in pieces (e.g. PDF pages), with the
+    feed()/finish() interface of pdf_ingest.IncrementalChunker.
+
+    Chunks are emitted once they end before the last sentence of the buffered
+    text (which may still continue on the next page); the rest is chunked
+    again with the next piece.
+    """
+
+    def __init__(self, chunker):
+        self.chunker = chunker
+        self._text = ''
+        self._offset = 0
+        self.length = 0
+
+    def feed(self, text):
+        if text:
+            if self.length:
+                text = ' ' + text
+            self._text += text
+            self.length += len(text)
+        return self._drain(final=False)
+
+    def finish(self):
+        return self._drain(final=True)
+
+    def _drain(self, final):
+        if not self._text.strip():
+            return []
+        chunks = self.chunker.chunk(self._text)
+        if final:
+            ready, keep_from = chunks, len(self._text)
+        else:
+            # The buffer's last sentence may be incomplete, and the chunk that reaches it may still grow
+            open_sentence = sentence_starts(self._text)[-1]
+            ready = [chunk for chunk in chunks[:-1] if chunk['end'] < open_sentence]
+            if not ready and len(chunks) > MAX_PENDING_CHUNKS:
+                # Text without sentence ends: don't let the buffer grow without bound
+                ready = chunks[:-2]
+            keep_from = chunks[len(ready)]['start'] if ready else 0
+
+        emitted = [(self._offset + chunk['start'], chunk['text']) for chunk in ready]
+        self._text = self._text[keep_from:]
+        self._offset += keep_from
+        return emitted
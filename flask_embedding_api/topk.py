@@ -0,0 +1,64 @@
+"""
+Vectorized multi-query top-k search.
+
+All queries are scored against all documents with one matrix product per
+row block (so the score matrix never exceeds MAX_BLOCK_ELEMENTS), candidates
+are selected with argpartition instead of a full sort, and the score
+threshold is applied as a vectorized mask.
+"""
+
+import numpy as np
+
+# Upper bound on the queries x documents score block (64 MB of float32)
+MAX_BLOCK_ELEMENTS = 16 * 1024 * 1024
+
+
+def normalize_rows(vectors):
+    """L2-normalize rows (a 1-D vector is treated as one row)."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def top_k_search(queries, documents, top_k, min_score=None, mask=None):
+    """
+    Top-k documents by dot product for each query.
+
+    queries is (q, d), documents is (n, d); both should already be normalized
+    for cosine similarity. mask is an optional boolean array of allowed
+    documents. Results scoring below min_score are dropped.
+
+    Returns a list with one (indices, scores) pair of arrays per query,
+    best first.
+    """
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    documents = np.asarray(documents, dtype=np.float32)
+    num_docs = len(documents)
+    if num_docs == 0 or top_k < 1:
+        return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+    k = min(top_k, num_docs)
+    block_rows = max(1, MAX_BLOCK_ELEMENTS // num_docs)
+    results = []
+
+    for start in range(0, len(queries), block_rows):
+        scores = queries[start:start + block_rows] @ documents.T
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+        if min_score is not None:
+            scores[scores < min_score] = -np.inf
+
+        if k < num_docs:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(num_docs), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1, kind='stable')
+        best = np.take_along_axis(candidates, order, axis=1)
+        best_scores = np.take_along_axis(candidate_scores, order, axis=1)
+
+        for indices, row_scores in zip(best, best_scores):
+            keep = np.isfinite(row_scores)
+            results.append((indices[keep], row_scores[keep]))
+
+    return results
@@ -0,0 +1,787 @@
+"""
+Persistent named vector collections.
+
+Each collection lives in its own directory:
+
+- vectors.npy: a contiguous float32 matrix opened as a memory map
+  (capacity grows by doubling, only the first `count` rows are live)
+- meta.json: a snapshot of the ids, documents and metadata in row order,
+  plus the model name and dimension the vectors were built with
+- meta.log: the upserts and deletes since that snapshot, one JSON line per
+  change; it is folded into a new snapshot once it outgrows the old one, so
+  a write costs the size of the change rather than of the collection
+- ann.npz (optional): IVF centroids and per-row list assignments, saved
+  with each snapshot and kept current by replaying the log
+- int8.npy + int8_scales.npy, binary.npy (optional): quantized codes, one
+  row per vectors.npy row, memory-mapped like the vectors. Each file is
+  created by the first query that asks for its quantization; after that
+  upserts quantize only the rows they write and deletes move code rows
+  with the vector rows
+- lexical-<token>.npz: the BM25 inverted index over the documents
+  (lexical_index.BM25Index) as of the snapshot, which names the file. Each
+  process loads it when it opens the collection (collections saved without
+  one are indexed then) and keeps it current through upserts, deletes and
+  log replay
+- collection.lock: flock()ed shared to read and exclusive to write, so
+  several worker processes can share a collection. Each process replays
+  the log entries it has not seen before it reads, and remaps vectors.npy
+  after another process grew (replaced) it.
+
+A corpus is encoded once at upsert time; queries only need one query encode
+and a matrix-vector product against the memory-mapped rows.
+
+aliases.json in the root maps names to collection directories, so a name
+can be switched to another collection (e.g. after a model migration) in
+one atomic write.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No flock() (Windows): collections are then only safe within one process
+    fcntl = None
+
+from ann_index import IVFIndex
+from lexical_index import BM25Index
+from quantization import QUANTIZATION_TYPES, QuantizedVectors, memory_report, quantize_binary, quantize_int8
+from topk import MAX_BLOCK_ELEMENTS, top_k_search
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# meta.log is compacted into meta.json once it is larger than this and the snapshot
+MIN_COMPACT_BYTES = 1 << 20
+
+
+class CollectionError(ValueError):
+    """Raised for invalid collection operations (bad name, dimension mismatch, ...)."""
+
+
+def _matches(metadata, where):
+    return all(metadata.get(key) == value for key, value in where.items())
+
+
+class VectorCollection:
+    """A named float32 matrix with id/document/metadata arrays, persisted to disk."""
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self.lock = threading.RLock()
+        self._lock_file = None
+        self._lock_pid = None
+        self._lock_depth = 0
+        self._lock_exclusive = False
+        with self._locked(exclusive=False):
+            self._load()
+
+    @property
+    def vectors(self):
+        """Live rows of the embedding matrix (a memmap view)."""
+        if self._vectors is None:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        return self._vectors[:self.count]
+
+    def refresh(self):
+        """Catch up with changes other processes have logged since the last look."""
+        with self._locked(exclusive=False):
+            self._replay()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Catch up, then keep every process from writing while the caller reads several fields."""
+        with self._locked(exclusive=False):
+            self._replay()
+            yield self
+
+    def upsert(self, ids, vectors, documents=None, metadatas=None, model=None):
+        """Insert new ids and overwrite existing ones. Returns (inserted, updated)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[0] != len(ids):
+            raise CollectionError('embeddings must be a 2-D array with one row per id')
+        if len(set(ids)) != len(ids):
+            raise CollectionError('ids must be unique within a request')
+        documents = list(documents) if documents is not None else [None] * len(ids)
+        metadatas = [metadata or {} for metadata in metadatas] if metadatas is not None else [{} for _ in ids]
+        if len(documents) != len(ids) or len(metadatas) != len(ids):
+            raise CollectionError('documents and metadatas must have one entry per id')
+
+        with self._locked(exclusive=True):
+            self._replay()
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                self.model = model
+            elif vectors.shape[1] != self.dimension:
+                raise CollectionError(
+                    f"Collection '{self.name}' stores {self.dimension}-d vectors, got {vectors.shape[1]}-d"
+                )
+            elif model is not None and self.model is not None and model != self.model:
+                raise CollectionError(
+                    f"Collection '{self.name}' was built with model '{self.model}', not '{model}'"
+                )
+
+            new_ids = [item_id for item_id in ids if item_id not in self._positions]
+            self._ensure_capacity(self.count + len(new_ids))
+            rows = self._apply_upsert(ids, documents, metadatas)
+            self._vectors[rows] = vectors
+            self._write_codes(rows, vectors)
+            if self.ann is not None:
+                self.ann.add(rows, vectors)
+            self._commit({
+                'op': 'upsert',
+                'model': self.model,
+                'dimension': self.dimension,
+                'ids': list(ids),
+                'documents': documents,
+                'metadatas': metadatas
+            })
+            return len(new_ids), len(ids) - len(new_ids)
+
+    def delete(self, ids=None, where=None):
+        """Delete rows by id and/or metadata filter. Returns the number of rows removed."""
+        with self._locked(exclusive=True):
+            self._replay()
+            targets = list(dict.fromkeys(item_id for item_id in (ids or []) if item_id in self._positions))
+            if where:
+                listed = set(targets)
+                targets.extend(
+                    item_id for item_id, metadata in zip(self.ids, self.metadatas)
+                    if item_id not in listed and _matches(metadata, where)
+                )
+            if not targets:
+                return 0
+
+            self._apply_delete(targets, move_vectors=True)
+            self._commit({'op': 'delete', 'ids': targets})
+            return len(targets)
+
+    def query(self, query_vectors, top_k=5, where=None, mode='auto', nprobe=None, min_score=None,
+              quantization=None, rescore=True, rescore_factor=None):
+        """
+        Cosine search for one or more normalized query vectors.
+
+        mode is 'exact', 'ann' (requires build_ann) or 'auto' (ann when built).
+        With quantization ('int8' or 'binary') the search runs over quantized
+        codes instead, optionally rescoring the best top_k * rescore_factor
+        candidates with their float vectors. Results scoring below min_score
+        are dropped.
+        Returns one list of (row, score) pairs per query.
+        """
+        query_vectors = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        if quantization and quantization not in self._codes:
+            self._ensure_codes(quantization)
+        with self._locked(exclusive=False):
+            self._replay()
+            if self.count == 0:
+                return [[] for _ in query_vectors]
+            if query_vectors.shape[1] != self.dimension:
+                raise CollectionError(
+                    f"Collection '{self.name}' stores {self.dimension}-d vectors, got {query_vectors.shape[1]}-d query"
+                )
+            if mode == 'ann' and self.ann is None:
+                raise CollectionError(f"Collection '{self.name}' has no ANN index. Build one with /index/{self.name}/ann")
+
+            mask = self.mask(where)
+
+            if quantization:
+                matches = self.quantized(quantization).search(
+                    query_vectors, top_k,
+                    float_vectors=self.vectors if rescore else None,
+                    rescore_factor=rescore_factor,
+                    min_score=min_score,
+                    mask=mask
+                )
+            elif mode != 'exact' and self.ann is not None:
+                matches = self.ann.search(self.vectors, query_vectors, top_k, nprobe=nprobe, mask=mask)
+                if min_score is not None:
+                    matches = [(rows[scores >= min_score], scores[scores >= min_score]) for rows, scores in matches]
+            else:
+                matches = top_k_search(query_vectors, self.vectors, top_k, min_score=min_score, mask=mask)
+
+            return [list(zip(rows.tolist(), scores.tolist())) for rows, scores in matches]
+
+    def lexical_query(self, query_texts, top_k=5, where=None):
+        """
+        BM25 keyword search over the documents for one or more query texts.
+        Returns one list of (row, score) pairs per query.
+        """
+        with self._locked(exclusive=False):
+            self._replay()
+            if self.count == 0:
+                return [[] for _ in query_texts]
+            index = self.lexical()
+            mask = self.mask(where)
+            matches = [index.search(text, top_k, mask=mask) for text in query_texts]
+            return [list(zip(rows.tolist(), scores.tolist())) for rows, scores in matches]
+
+    def lexical(self):
+        """The BM25 index over the documents."""
+        return self._lexical
+
+    def get_vectors(self, ids):
+        """Copy of the rows for ids, in order, or None if any id is missing."""
+        with self._locked(exclusive=False):
+            self._replay()
+            rows = [self._positions.get(item_id) for item_id in ids]
+            if any(row is None for row in rows):
+                return None
+            return np.array(self._vectors[rows])
+
+    def records(self, ids):
+        """[(id, document, metadata)] for the ids that exist, in the order given."""
+        with self._locked(exclusive=False):
+            self._replay()
+            return [
+                (item_id, self.documents[row], self.metadatas[row])
+                for item_id, row in ((item_id, self._positions.get(item_id)) for item_id in ids)
+                if row is not None
+            ]
+
+    def mask(self, where):
+        """Boolean array of live rows whose metadata matches where (None when where is empty)."""
+        if not where:
+            return None
+        with self.lock:
+            return np.array([_matches(metadata, where) for metadata in self.metadatas], dtype=bool)
+
+    def quantized(self, kind):
+        """Quantized codes for the live rows (memmap views), created on first use."""
+        if kind not in self._codes:
+            self._ensure_codes(kind)
+        with self.lock:
+            codes, scales = self._codes[kind]
+            return QuantizedVectors(
+                kind, self.dimension, codes[:self.count],
+                None if scales is None else scales[:self.count]
+            )
+
+    def build_ann(self, nlist=None, nprobe=8):
+        """Train an IVF index over the current vectors and persist it."""
+        with self._locked(exclusive=True):
+            self._replay()
+            if self.count == 0:
+                raise CollectionError(f"Collection '{self.name}' is empty")
+            self.ann = IVFIndex.build(self.vectors, nlist=nlist, nprobe=nprobe)
+            # A new snapshot carries the lists; other processes reload from it
+            self._sequence += 1
+            self._compact()
+            return self.ann.info()
+
+    def drop_ann(self):
+        with self._locked(exclusive=True):
+            self._replay()
+            self.ann = None
+            self._sequence += 1
+            self._compact()
+
+    def record(self, row):
+        return {
+            'id': self.ids[row],
+            'document': self.documents[row],
+            'metadata': self.metadatas[row]
+        }
+
+    def info(self):
+        with self._locked(exclusive=False):
+            self._replay()
+            return {
+                'name': self.name,
+                'count': self.count,
+                'dimension': self.dimension,
+                'model': self.model,
+                'capacity': 0 if self._vectors is None else int(self._vectors.shape[0]),
+                'ann': None if self.ann is None else self.ann.info(),
+                'lexical': self._lexical.info(),
+                'memory': memory_report(self.count, self.dimension or 0),
+                'quantized': {kind: self.quantized(kind).nbytes for kind in self._codes}
+            }
+
+    def _vectors_file(self):
+        return os.path.join(self.path, 'vectors.npy')
+
+    def _meta_file(self):
+        return os.path.join(self.path, 'meta.json')
+
+    def _log_file(self):
+        return os.path.join(self.path, 'meta.log')
+
+    def _ann_file(self):
+        return os.path.join(self.path, 'ann.npz')
+
+    def _codes_files(self, kind):
+        """(codes, scales) file names of a quantization; binary codes have no scales."""
+        return f'{kind}.npy', f'{kind}_scales.npy' if kind == 'int8' else None
+
+    def _lock_path(self):
+        return os.path.join(self.path, 'collection.lock')
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive):
+        """
+        Hold the in-process lock and the collection's file lock: shared to
+        read, exclusive to write, so other worker processes never see a change
+        half applied. Nested calls reuse the outer file lock (upgrading it to
+        exclusive when needed).
+        """
+        with self.lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_pid != os.getpid():
+                # A forked worker must not share the parent's open lock file
+                self._lock_file = open(self._lock_path(), 'a+b')
+                self._lock_pid = os.getpid()
+                self._lock_depth = 0
+            if self._lock_depth == 0 or (exclusive and not self._lock_exclusive):
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_exclusive = exclusive or self._lock_exclusive
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_exclusive = False
+
+    def _load(self):
+        """Read the meta.json snapshot, then replay meta.log on top of it (file lock held)."""
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self.model = None
+        self.dimension = None
+        self.count = 0
+        self._vectors = None
+        self._vectors_inode = None
+        self._positions = {}
+        self.ann = None
+        self._lexical = None
+        self._codes = {}
+        self._codes_inodes = {}
+        self._sequence = 0
+        self._log_header = None
+        self._log_offset = 0
+        self._snapshot_bytes = 0
+
+        if os.path.exists(self._meta_file()):
+            with open(self._meta_file(), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.ids = meta['ids']
+            self.documents = meta['documents']
+            self.metadatas = meta['metadatas']
+            self.model = meta.get('model')
+            self.dimension = meta.get('dimension')
+            self._sequence = meta.get('sequence', 0)
+            self.count = len(self.ids)
+            self._positions = {item_id: row for row, item_id in enumerate(self.ids)}
+            self._snapshot_bytes = os.path.getsize(self._meta_file())
+            if os.path.exists(self._ann_file()):
+                self.ann = IVFIndex.load(self._ann_file())
+                if len(self.ann.assignments) != self.count:
+                    logger.warning(f"Dropping ANN index of '{self.name}': it does not match the snapshot")
+                    self.ann = None
+            lexical_name = meta.get('lexical')
+            if lexical_name and os.path.exists(os.path.join(self.path, lexical_name)):
+                self._lexical = BM25Index.load(os.path.join(self.path, lexical_name))
+                if self._lexical.live != self.count:
+                    logger.warning(f"Rebuilding BM25 index of '{self.name}': it does not match the snapshot")
+                    self._lexical = None
+        if self._lexical is None:
+            self._lexical = BM25Index.build(self.documents)
+            if self.count:
+                logger.info(f"Built BM25 index for '{self.name}' ({self.count} documents)")
+        self._replay()
+
+    def _open_vectors(self):
+        """(Re)open the vectors memmap if the file was replaced (grown) since it was mapped."""
+        try:
+            inode = os.stat(self._vectors_file()).st_ino
+        except FileNotFoundError:
+            self._vectors = None
+            self._vectors_inode = None
+            return
+        if self._vectors is None or inode != self._vectors_inode:
+            self._vectors = np.load(self._vectors_file(), mmap_mode='r+')
+            self._vectors_inode = inode
+
+    def _open_codes(self):
+        """Map the code files that exist, remapping any another process created or grew."""
+        for kind in QUANTIZATION_TYPES:
+            codes_name, scales_name = self._codes_files(kind)
+            try:
+                inode = os.stat(os.path.join(self.path, codes_name)).st_ino
+            except FileNotFoundError:
+                self._codes.pop(kind, None)
+                self._codes_inodes.pop(kind, None)
+                continue
+            if self._codes_inodes.get(kind) != inode:
+                self._codes.pop(kind, None)
+                self._codes_inodes[kind] = inode
+                codes = np.load(os.path.join(self.path, codes_name), mmap_mode='r+')
+                scales = None if scales_name is None else np.load(os.path.join(self.path, scales_name), mmap_mode='r+')
+                if self._vectors is None or len(codes) != len(self._vectors):
+                    # Left behind by a crash while growing: the next quantized query rebuilds it
+                    continue
+                self._codes[kind] = (codes, scales)
+
+    def _ensure_codes(self, kind):
+        """Quantize every stored row into the code files of kind, unless another call already did."""
+        if kind not in QUANTIZATION_TYPES:
+            raise CollectionError(f"Unknown quantization '{kind}'. Use one of: {', '.join(QUANTIZATION_TYPES)}")
+        with self._locked(exclusive=True):
+            self._replay()
+            if kind in self._codes or self._vectors is None:
+                return
+            codes_name, scales_name = self._codes_files(kind)
+            capacity = self._vectors.shape[0]
+            block_rows = max(1, MAX_BLOCK_ELEMENTS // self.dimension)
+            width = self.dimension if kind == 'int8' else (self.dimension + 7) // 8
+            codes = np.lib.format.open_memmap(
+                os.path.join(self.path, 'codes.tmp.npy'), mode='w+',
+                dtype=np.int8 if kind == 'int8' else np.uint8, shape=(capacity, width)
+            )
+            scales = None
+            if scales_name is not None:
+                scales = np.lib.format.open_memmap(
+                    os.path.join(self.path, 'scales.tmp.npy'), mode='w+', dtype=np.float32, shape=(capacity,)
+                )
+            for start in range(0, self.count, block_rows):
+                block = self._vectors[start:min(start + block_rows, self.count)]
+                if scales is None:
+                    codes[start:start + len(block)] = quantize_binary(block)
+                else:
+                    codes[start:start + len(block)], scales[start:start + len(block)] = quantize_int8(block)
+            codes.flush()
+            del codes
+            if scales is not None:
+                scales.flush()
+                del scales
+                # The codes file appears last: other processes look for it
+                os.replace(os.path.join(self.path, 'scales.tmp.npy'), os.path.join(self.path, scales_name))
+            os.replace(os.path.join(self.path, 'codes.tmp.npy'), os.path.join(self.path, codes_name))
+            self._open_codes()
+            logger.info(f"Quantized '{self.name}' to {kind} ({self.count} rows)")
+
+    def _write_codes(self, rows, vectors):
+        """Quantize just the rows an upsert wrote into every code file (exclusive file lock held)."""
+        for kind, (codes, scales) in self._codes.items():
+            if scales is None:
+                codes[rows] = quantize_binary(vectors)
+            else:
+                codes[rows], scales[rows] = quantize_int8(vectors)
+
+    def _replay(self):
+        """Apply the log entries other processes appended since this one last read the log (file lock held)."""
+        self._open_vectors()
+        self._open_codes()
+        try:
+            f = open(self._log_file(), 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            header = f.readline()
+            if header != self._log_header:
+                # The log was compacted into a new snapshot
+                if json.loads(header)['base'] > self._sequence:
+                    # It folded in entries this process never read
+                    self._load()
+                    return
+                self._log_header = header
+                self._log_offset = len(header)
+            if os.fstat(f.fileno()).st_size <= self._log_offset:
+                return
+            f.seek(self._log_offset)
+            data = f.read()
+        # A line without its newline is a write cut short by a crash
+        end = data.rfind(b'\n') + 1
+        # Rows whose IVF list must be assigned from their final vector
+        dirty = set()
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            if entry.get('seq', 0) <= self._sequence:
+                continue
+            if entry['op'] == 'upsert':
+                if self.dimension is None:
+                    self.dimension = entry['dimension']
+                    self.model = entry['model']
+                rows = self._apply_upsert(entry['ids'], entry['documents'], entry['metadatas'])
+                if self.ann is not None:
+                    # A later entry may have overwritten these rows in the file; they are reassigned below
+                    self.ann.add(rows, self._vectors[rows])
+                dirty.update(rows)
+            elif entry['op'] == 'delete':
+                for source, target in self._apply_delete(entry['ids'], move_vectors=False):
+                    if source in dirty:
+                        dirty.discard(source)
+                        dirty.add(target)
+            self._sequence = entry['seq']
+        self._log_offset += end
+
+        if self.ann is not None and dirty:
+            rows = sorted(row for row in dirty if row < self.count)
+            self.ann.add(rows, self._vectors[rows])
+
+    def _apply_upsert(self, ids, documents, metadatas):
+        """Update the in-memory arrays for an upsert. Returns the rows written."""
+        rows = []
+        for item_id, document, metadata in zip(ids, documents, metadatas):
+            row = self._positions.get(item_id)
+            if row is None:
+                row = self.count
+                self._positions[item_id] = row
+                self.ids.append(item_id)
+                self.documents.append(document)
+                self.metadatas.append(metadata)
+                self.count += 1
+            else:
+                self.documents[row] = document
+                self.metadatas[row] = metadata
+            rows.append(row)
+        self._lexical.add(rows, documents)
+        return rows
+
+    def _apply_delete(self, ids, move_vectors):
+        """
+        Remove ids, moving the last live row into each hole to keep the
+        matrix contiguous. The vectors file is only changed with move_vectors
+        (a replayed delete finds it already done). Returns the (from, to) moves.
+        """
+        moves = []
+        for item_id in ids:
+            row = self._positions.pop(item_id, None)
+            if row is None:
+                continue
+            last = self.count - 1
+            self._lexical.remove([row])
+            if row != last:
+                moved_id = self.ids[last]
+                if move_vectors:
+                    self._vectors[row] = self._vectors[last]
+                    for codes, scales in self._codes.values():
+                        codes[row] = codes[last]
+                        if scales is not None:
+                            scales[row] = scales[last]
+                self.ids[row] = moved_id
+                self.documents[row] = self.documents[last]
+                self.metadatas[row] = self.metadatas[last]
+                self._positions[moved_id] = row
+                if self.ann is not None:
+                    self.ann.move(last, row)
+                self._lexical.move(last, row)
+                moves.append((last, row))
+            self.ids.pop()
+            self.documents.pop()
+            self.metadatas.pop()
+            self.count -= 1
+        if self.ann is not None:
+            self.ann.truncate(self.count)
+        return moves
+
+    def _commit(self, entry):
+        """Flush the vectors and append one change to the log (exclusive file lock held)."""
+        if self._vectors is not None:
+            self._vectors.flush()
+        for codes, scales in self._codes.values():
+            codes.flush()
+            if scales is not None:
+                scales.flush()
+        self._sequence += 1
+        if self._log_header is None:
+            # First write (or a collection saved before the log existed): start from a snapshot
+            self._compact()
+            return
+        entry['seq'] = self._sequence
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        with open(self._log_file(), 'r+b') as f:
+            # Drop the tail of a write cut short by a crash
+            f.seek(self._log_offset)
+            f.truncate()
+            f.write(line)
+        self._log_offset += len(line)
+        if self._log_offset > max(MIN_COMPACT_BYTES, self._snapshot_bytes):
+            self._compact()
+
+    def _compact(self):
+        """Write a snapshot of the current state and start an empty log (exclusive file lock held)."""
+        if self._vectors is not None:
+            self._vectors.flush()
+        if self.ann is not None:
+            tmp_ann = os.path.join(self.path, 'ann.tmp.npz')
+            self.ann.save(tmp_ann)
+            os.replace(tmp_ann, self._ann_file())
+        elif os.path.exists(self._ann_file()):
+            os.remove(self._ann_file())
+        # A fresh name per snapshot: meta.json only ever points at a complete index file
+        lexical_name = f'lexical-{uuid.uuid4().hex}.npz'
+        self._lexical.save(os.path.join(self.path, lexical_name))
+        meta = {
+            'name': self.name,
+            'model': self.model,
+            'dimension': self.dimension,
+            'sequence': self._sequence,
+            'ids': self.ids,
+            'documents': self.documents,
+            'metadatas': self.metadatas,
+            'lexical': lexical_name
+        }
+        # Write-then-rename so a crash never leaves a half-written file
+        tmp_path = self._meta_file() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_file())
+        self._snapshot_bytes = os.path.getsize(self._meta_file())
+        for entry in os.listdir(self.path):
+            if entry.startswith('lexical-') and entry != lexical_name:
+                os.remove(os.path.join(self.path, entry))
+
+        # The token tells logs apart even when they start at the same sequence
+        header = (json.dumps({'base': self._sequence, 'token': uuid.uuid4().hex}) + '\n').encode('utf-8')
+        tmp_log = self._log_file() + '.tmp'
+        with open(tmp_log, 'wb') as f:
+            f.write(header)
+        os.replace(tmp_log, self._log_file())
+        self._log_header = header
+        self._log_offset = len(header)
+
+    def _ensure_capacity(self, rows):
+        capacity = 0 if self._vectors is None else self._vectors.shape[0]
+        if rows <= capacity:
+            return
+
+        new_capacity = max(rows, capacity * 2, 1024)
+        arrays = [('vectors.npy', self._vectors, (self.dimension,), np.float32)]
+        for kind, (codes, scales) in self._codes.items():
+            codes_name, scales_name = self._codes_files(kind)
+            if scales is not None:
+                arrays.append((scales_name, scales, (), np.float32))
+            # Codes go after their scales: a codes file is only picked up with both in place
+            arrays.append((codes_name, codes, codes.shape[1:], codes.dtype))
+
+        replacements = []
+        for name, array, row_shape, dtype in arrays:
+            tmp_path = os.path.join(self.path, name[:-len('.npy')] + '.tmp.npy')
+            grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(new_capacity,) + row_shape)
+            if self.count:
+                grown[:self.count] = array[:self.count]
+            grown.flush()
+            del grown
+            replacements.append((tmp_path, os.path.join(self.path, name)))
+        # Release every map before renaming (required on Windows)
+        del arrays
+        self._vectors = None
+        self._codes = {}
+        self._codes_inodes = {}
+        # Other processes notice the new inodes on their next refresh and remap
+        for tmp_path, path in replacements:
+            os.replace(tmp_path, path)
+        self._open_vectors()
+        self._open_codes()
+
+
+class VectorStore:
+    """Directory of named collections, loaded lazily and cached in memory."""
+
+    def __init__(self, root):
+        self.root = root
+        self._collections = {}
+        self._aliases = {}
+        self._aliases_version = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _aliases_file(self):
+        return os.path.join(self.root, 'aliases.json')
+
+    def _load_aliases(self):
+        """Current alias table, re-read when another process has changed it (call with _lock held)."""
+        try:
+            stat = os.stat(self._aliases_file())
+            version = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        except FileNotFoundError:
+            version = None
+        if version != self._aliases_version:
+            self._aliases = {}
+            if version is not None:
+                with open(self._aliases_file(), 'r', encoding='utf-8') as f:
+                    self._aliases = json.load(f)
+            self._aliases_version = version
+        return self._aliases
+
+    def resolve(self, name):
+        """Collection directory a name refers to (the name itself unless it is an alias)."""
+        with self._lock:
+            return self._load_aliases().get(name, name)
+
+    def aliases(self):
+        with self._lock:
+            return dict(self._load_aliases())
+
+    def set_aliases(self, updates):
+        """
+        Apply {alias: collection} updates in one atomic write. An alias set to
+        None (or to its own name) is removed. Aliases point at directories
+        and are not followed further.
+        """
+        for alias, target in updates.items():
+            for name in (alias, target or alias):
+                if not COLLECTION_NAME_PATTERN.match(name):
+                    raise CollectionError('Collection names may only contain letters, digits, "_" and "-" (max 64)')
+        with self._lock:
+            aliases = dict(self._load_aliases())
+            for alias, target in updates.items():
+                if target is None or target == alias:
+                    aliases.pop(alias, None)
+                else:
+                    aliases[alias] = target
+            # Write-then-rename so readers see either the old or the new table
+            tmp_path = self._aliases_file() + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(aliases, f)
+            os.replace(tmp_path, self._aliases_file())
+            self._aliases_version = None
+            self._load_aliases()
+
+    def get(self, name, create=False, follow_aliases=True):
+        if not COLLECTION_NAME_PATTERN.match(name or ''):
+            raise CollectionError('Collection names may only contain letters, digits, "_" and "-" (max 64)')
+        with self._lock:
+            if follow_aliases:
+                name = self._load_aliases().get(name, name)
+            collection = self._collections.get(name)
+            if collection is not None:
+                # Other worker processes may have written the collection since it was loaded
+                collection.refresh()
+                return collection
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path):
+                if not create:
+                    return None
+                os.makedirs(path, exist_ok=True)
+            collection = VectorCollection(path, name)
+            self._collections[name] = collection
+            return collection
+
+    def list(self):
+        names = sorted(
+            entry for entry in os.listdir(self.root)
+            if COLLECTION_NAME_PATTERN.match(entry) and os.path.isdir(os.path.join(self.root, entry))
+        )
+        aliases = self.aliases()
+        collections = []
+        for name in names:
+            info = self.get(name, follow_aliases=False).info()
+            info['aliases'] = sorted(alias for alias, target in aliases.items() if target == name)
+            collections.append(info)
+        return collections
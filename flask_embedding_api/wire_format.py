@@ -0,0 +1,277 @@
+"""
+Wire formats for embedding matrices.
+
+Embeddings can travel as plain JSON lists (the default) or as packed
+little-endian float32/float16 buffers:
+
+- raw bytes (Content-Type / Accept: application/octet-stream), with the shape
+  and dtype in the X-Embedding-Shape and X-Embedding-Dtype headers
+- base64 inside JSON: {"data": "...", "dtype": "float32", "shape": [n, d]}
+- msgpack (application/msgpack), the same object with "data" as raw bytes
+
+Besides float32/float16, vectors can travel quantized:
+
+- "int8": int8 codes plus one float32 scale per row ("scales" field; in a raw
+  body the scales follow the codes)
+- "binary": sign bits packed 8 per byte (decoded to +-1/sqrt(d) vectors)
+
+Packed output is built straight from the numpy buffer, never through Python lists.
+"""
+
+import base64
+import json
+
+import numpy as np
+from flask import Response, jsonify, request
+
+import request_timing
+from quantization import dequantize_binary, dequantize_int8, quantize_binary, quantize_int8
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional
+    msgpack = None
+
+OCTET_STREAM = 'application/octet-stream'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2')
+}
+
+QUANTIZED_DTYPES = ('int8', 'binary')
+
+
+class WireFormatError(ValueError):
+    """Raised when a request body or packed array cannot be decoded."""
+
+
+def _parse_shape(value):
+    try:
+        return tuple(int(part) for part in str(value).split(',') if part.strip())
+    except ValueError:
+        raise WireFormatError(f'Invalid shape: {value}')
+
+
+def _check_dtype(name):
+    if name not in DTYPES and name not in QUANTIZED_DTYPES:
+        raise WireFormatError(
+            f"Unsupported dtype '{name}'. Use one of: {', '.join(list(DTYPES) + list(QUANTIZED_DTYPES))}"
+        )
+    return name
+
+
+def _b64decode(raw):
+    if isinstance(raw, str):
+        try:
+            return base64.b64decode(raw, validate=True)
+        except ValueError:
+            raise WireFormatError('Packed array data is not valid base64')
+    return raw
+
+
+def _args_as_data():
+    """Query-string parameters, with JSON-looking values (numbers, booleans) decoded."""
+    data = {}
+    for key, value in request.args.items():
+        try:
+            data[key] = json.loads(value)
+        except ValueError:
+            data[key] = value
+    return data
+
+
+def read_request_data():
+    """
+    Parse the request body as JSON, msgpack or a raw packed matrix.
+
+    Raw bodies are returned as {"embeddings": array, **query_args}.
+    Returns None when the body is empty or not in a supported format.
+    """
+    with request_timing.phase('parse'):
+        return _read_request_data()
+
+
+def _read_request_data():
+    content_type = (request.mimetype or '').lower()
+
+    if content_type == OCTET_STREAM:
+        shape = _parse_shape(request.headers.get('X-Embedding-Shape', ''))
+        dtype = _check_dtype(request.headers.get('X-Embedding-Dtype', 'float32'))
+        body = request.get_data()
+        packed = {'data': body, 'dtype': dtype, 'shape': shape}
+        if dtype == 'int8':
+            # Raw int8 bodies carry the per-row float32 scales after the codes
+            if len(shape) < 1:
+                raise WireFormatError('X-Embedding-Shape is required for int8 bodies')
+            rows = shape[0] if len(shape) == 2 else 1
+            packed['data'] = body[:len(body) - 4 * rows]
+            packed['scales'] = body[len(body) - 4 * rows:]
+        data = _args_as_data()
+        data['embeddings'] = decode_array(packed)
+        return data
+
+    if content_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise WireFormatError('msgpack is not installed on the server. Install with: pip install msgpack')
+        try:
+            return msgpack.unpackb(request.get_data(), raw=False)
+        except Exception as e:
+            raise WireFormatError(f'Invalid msgpack body: {str(e)}')
+
+    return request.get_json(silent=True)
+
+
+def decode_array(value, ndim=None):
+    """
+    Turn a JSON list or a packed {"data", "dtype", "shape"} object into a float32 array.
+    """
+    if isinstance(value, np.ndarray):
+        array = value
+    elif isinstance(value, dict):
+        if 'data' not in value:
+            raise WireFormatError('Packed arrays need a "data" field')
+        dtype_name = _check_dtype(value.get('dtype', 'float32'))
+        raw = _b64decode(value['data'])
+        shape = tuple(int(dim) for dim in value.get('shape') or ())
+        if dtype_name in QUANTIZED_DTYPES:
+            array = _decode_quantized(dtype_name, raw, shape, value.get('scales'))
+            return _finish(array, ndim)
+        dtype = DTYPES[dtype_name]
+        if len(raw) % dtype.itemsize != 0:
+            raise WireFormatError('Packed array size is not a multiple of the dtype size')
+        array = np.frombuffer(raw, dtype=dtype)
+        if shape:
+            if int(np.prod(shape)) != array.size:
+                raise WireFormatError(f'Packed array of {array.size} values does not match shape {list(shape)}')
+            array = array.reshape(shape)
+    else:
+        try:
+            array = np.asarray(value, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise WireFormatError('Embeddings must be numeric lists or packed arrays')
+
+    return _finish(array, ndim)
+
+
+def _finish(array, ndim):
+    array = array.astype(np.float32, copy=False)
+    if ndim is not None and array.ndim != ndim:
+        raise WireFormatError(f'Expected a {ndim}-D array, got shape {list(array.shape)}')
+    return array
+
+
+def _decode_quantized(dtype, raw, shape, scales):
+    if not shape:
+        raise WireFormatError(f'{dtype} arrays need a "shape"')
+    rows = shape[0] if len(shape) == 2 else 1
+    dimension = shape[-1]
+
+    if dtype == 'binary':
+        row_bytes = (dimension + 7) // 8
+        if len(raw) != rows * row_bytes:
+            raise WireFormatError(f'Binary array of {len(raw)} bytes does not match shape {list(shape)}')
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(rows, row_bytes)
+        return dequantize_binary(packed, dimension).reshape(shape)
+
+    if scales is None:
+        raise WireFormatError('int8 arrays need "scales"')
+    scales = np.frombuffer(_b64decode(scales), dtype='<f4')
+    if len(raw) != rows * dimension or len(scales) != rows:
+        raise WireFormatError(f'int8 array does not match shape {list(shape)}')
+    codes = np.frombuffer(raw, dtype=np.int8).reshape(rows, dimension)
+    return dequantize_int8(codes, scales).reshape(shape)
+
+
+def negotiate(data):
+    """
+    Pick the response format and dtype from the Accept header and body fields.
+
+    Returns (format, dtype_name) with format one of 'json', 'base64',
+    'binary' or 'msgpack'.
+    """
+    data = data or {}
+    dtype = data.get('dtype') or request.headers.get('X-Embedding-Dtype') or 'float32'
+    _check_dtype(dtype)
+
+    accept = request.accept_mimetypes
+    encoding = data.get('encoding')
+    if encoding == 'binary' or (encoding is None and accept.best == OCTET_STREAM):
+        return 'binary', dtype
+    if encoding == 'msgpack' or (encoding is None and accept.best in MSGPACK_TYPES):
+        if msgpack is None:
+            raise WireFormatError('msgpack is not installed on the server. Install with: pip install msgpack')
+        return 'msgpack', dtype
+    if encoding == 'base64':
+        return 'base64', dtype
+    if encoding not in (None, 'json'):
+        raise WireFormatError(f"Unsupported encoding '{encoding}'. Use json, base64, binary or msgpack")
+    if dtype != 'float32':
+        # float16 and quantized codes only make sense packed; default to base64 with JSON
+        return 'base64', dtype
+    return 'json', dtype
+
+
+def _encode_bytes(raw, as_bytes):
+    return raw if as_bytes else base64.b64encode(raw).decode('ascii')
+
+
+def pack_array(array, dtype='float32', as_bytes=False):
+    """Pack a numpy array into a {"data", "dtype", "shape"} object."""
+    array = np.asarray(array)
+    if dtype == 'int8':
+        codes, scales = quantize_int8(array.reshape(-1, array.shape[-1]))
+        return {
+            'data': _encode_bytes(codes.tobytes(), as_bytes),
+            'scales': _encode_bytes(scales.astype('<f4').tobytes(), as_bytes),
+            'dtype': dtype,
+            'shape': list(array.shape)
+        }
+    if dtype == 'binary':
+        return {
+            'data': _encode_bytes(quantize_binary(array.reshape(-1, array.shape[-1])).tobytes(), as_bytes),
+            'dtype': dtype,
+            'shape': list(array.shape)
+        }
+
+    packed = np.ascontiguousarray(array, dtype=DTYPES[dtype])
+    return {
+        'data': _encode_bytes(packed.tobytes(), as_bytes),
+        'dtype': dtype,
+        'shape': list(packed.shape)
+    }
+
+
+def embeddings_response(field, embeddings, metadata, fmt='json', dtype='float32'):
+    """
+    Build the response for an embedding-producing endpoint.
+
+    field is the JSON key for the array ("embeddings" or "embedding") and
+    metadata holds the remaining response fields.
+    """
+    with request_timing.phase('serialize'):
+        return _embeddings_response(field, embeddings, metadata, fmt, dtype)
+
+
+def _embeddings_response(field, embeddings, metadata, fmt, dtype):
+    if fmt == 'binary':
+        packed = pack_array(embeddings, dtype, as_bytes=True)
+        body = packed['data'] + packed.get('scales', b'')
+        response = Response(body, mimetype=OCTET_STREAM)
+        response.headers['X-Embedding-Shape'] = ','.join(str(dim) for dim in packed['shape'])
+        response.headers['X-Embedding-Dtype'] = dtype
+        response.headers['X-Embedding-Meta'] = json.dumps(metadata)
+        return response
+
+    if fmt == 'msgpack':
+        body = dict(metadata)
+        body[field] = pack_array(embeddings, dtype, as_bytes=True)
+        return Response(msgpack.packb(body, use_bin_type=True), mimetype=MSGPACK_TYPES[0])
+
+    body = dict(metadata)
+    if fmt == 'base64':
+        body[field] = pack_array(embeddings, dtype)
+    else:
+        body[field] = embeddings.tolist()
+    return jsonify(body)
@@ -43,7 +43,30 @@ const handler = async (req, res) => {
         searchMethod = "mongodb";
       }
 
-      // Fallback to MongoDB text search if ChromaDB unavailable
+      // Fallback to the embedding API's BM25 + vector index if ChromaDB is unavailable
+      if (!chromaResults || chromaResults.results.length === 0) {
+        try {
+          const chromaManager = new ChromaDBManager();
+          const hybridResults = await chromaManager.lexicalSearch(query, searchLimit, 'hybrid');
+          if (hybridResults.length > 0) {
+            searchMethod = "hybrid";
+            chromaResults = {
+              query: query,
+              results: hybridResults.map(result => ({
+                text: result.document,
+                metadata: result.metadata,
+                distance: null, // Fused rank score, not a distance
+                score: result.score,
+                id: result.id
+              }))
+            };
+          }
+        } catch (lexicalError) {
+          console.error("Embedding API lexical search failed:", lexicalError.message);
+        }
+      }
+
+      // Last resort: MongoDB text search
       if (!chromaResults || chromaResults.results.length === 0) {
         console.log("Using MongoDB fallback search...");
         searchMethod = "mongodb";
@@ -1,5 +1,28 @@
 import { ChromaClient } from 'chromadb';
 
+/**
+ * Decode a packed {data, dtype, shape} float32 matrix from the Flask API
+ * into an array of number arrays. Plain JSON lists are returned unchanged.
+ * @param {Object|Array} packed - Packed matrix or nested number lists
+ * @returns {Array<Array<number>>} One embedding per row
+ */
+function unpackEmbeddings(packed) {
+  if (Array.isArray(packed)) return packed;
+  if (packed.dtype !== 'float32') {
+    throw new Error(`Unsupported embedding dtype: ${packed.dtype}`);
+  }
+
+  const bytes = Buffer.from(packed.data, 'base64');
+  // Copy into an aligned buffer; Buffer slices may not be 4-byte aligned
+  const values = new Float32Array(bytes.buffer.slice(bytes.byteOffset, bytes.byteOffset + bytes.byteLength));
+  const [rows, dim] = packed.shape;
+  const embeddings = [];
+  for (let i = 0; i < rows; i++) {
+    embeddings.push(Array.from(values.subarray(i * dim, (i + 1) * dim)));
+  }
+  return embeddings;
+}
+
 // Custom embedding function that uses our Flask API
 class FlaskEmbeddingFunction {
   constructor(apiUrl) {
@@ -13,7 +36,8 @@ class FlaskEmbeddingFunction {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ texts: texts }),
+        // Ask for packed float32 vectors instead of nested JSON number lists
+        body: JSON.stringify({ texts: texts, encoding: 'base64' }),
       });
 
       if (!response.ok) {
@@ -21,12 +45,80 @@ class FlaskEmbeddingFunction {
       }
 
       const data = await response.json();
-      return data.embeddings;
+      return unpackEmbeddings(data.embeddings);
     } catch (error) {
       console.error('Error generating embeddings:', error);
       throw error;
     }
   }
+
+  /**
+   * Stream embeddings from /embed/batch, one batch at a time (NDJSON).
+   * Repeated and near-duplicate chunks (headers, boilerplate) are encoded
+   * once by the API and come back with the embedding of the chunk they repeat.
+   * With an index, the API also stores each batch in its collection of that
+   * name (for lexical and hybrid search) before sending it.
+   * @param {Array<string>} texts - Texts to embed
+   * @param {number} batchSize - Texts per streamed batch
+   * @param {Object} index - Optional {name, ids, metadatas, documentId} to store the texts under;
+   *   with documentId, texts matching a document stored there earlier copy its vectors
+   * @yields {{start: number, end: number, embeddings: Array<Array<number>>}} Encoded batch
+   */
+  async *streamBatches(texts, batchSize = 32, index = null) {
+    const response = await fetch(`${this.apiUrl}/embed/batch`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        texts: texts,
+        batch_size: batchSize,
+        stream: true,
+        encoding: 'base64',
+        dedup: true,
+        ...(index ? {
+          index: index.name,
+          ids: index.ids,
+          metadatas: index.metadatas,
+          document_id: index.documentId,
+        } : {}),
+      }),
+    });
+
+    if (!response.ok) {
+      throw new Error(`Embedding API error: ${response.statusText}`);
+    }
+
+    const decoder = new TextDecoder();
+    let buffered = '';
+    for await (const chunk of response.body) {
+      buffered += decoder.decode(chunk, { stream: true });
+
+      let newline;
+      while ((newline = buffered.indexOf('\n')) >= 0) {
+        const line = buffered.slice(0, newline);
+        buffered = buffered.slice(newline + 1);
+        if (!line.trim()) continue;
+
+        const message = JSON.parse(line);
+        if (message.error) {
+          throw new Error(`Embedding API error: ${message.error}`);
+        }
+        if (message.done) {
+          if (message.dedup) {
+            console.log(`Embedding dedup: ${message.dedup.encodes_skipped} of ${message.num_texts} chunks not re-encoded`);
+          }
+          return;
+        }
+
+        yield {
+          start: message.start,
+          end: message.end,
+          embeddings: unpackEmbeddings(message.embeddings),
+        };
+      }
+    }
+  }
 }
 
 /**
@@ -43,7 +135,11 @@ class ChromaDBManager {
     
     // Use Flask API for embeddings
     const flaskApiUrl = process.env.FLASK_EMBEDDING_API_URL || "http://localhost:5000";
+    this.flaskApiUrl = flaskApiUrl;
     this.embeddingFunction = new FlaskEmbeddingFunction(flaskApiUrl);
+
+    // Let the Flask API encode and write chunks into Chroma itself (/chroma/add)
+    this.directWrite = process.env.CHROMA_DIRECT_WRITE === 'true';
     
     this.isConnected = null; // null = unknown, true = connected, false = not connected
   }
@@ -93,19 +189,26 @@ class ChromaDBManager {
   }
 
   /**
-   * Add documents to ChromaDB (ChromaDB will generate embeddings automatically)
+   * Add documents to ChromaDB, streaming embeddings from the Flask API batch by batch
    * @param {Array<string>} chunks - Text chunks
    * @param {Object} metadata - Document metadata
    * @returns {Promise<boolean>} Success status
    */
   async addDocuments(chunks, metadata) {
+    if (this.directWrite) {
+      return this.addDocumentsDirect(chunks, metadata);
+    }
+
+    let collection = null;
+    let written = 0;
+    // One timestamp for the whole document, so a retry rewrites the same ids
+    const timestamp = Date.now();
+    const ids = chunks.map((_, index) =>
+      `${metadata.documentId}_chunk_${index}_${timestamp}`
+    );
+
     try {
-      const collection = await this.getCollection();
-      
-      // Generate unique IDs for each chunk
-      const ids = chunks.map((_, index) => 
-        `${metadata.documentId}_chunk_${index}_${Date.now()}`
-      );
+      collection = await this.getCollection();
 
       // Prepare metadatas for each chunk
       const metadatas = chunks.map((chunk, index) => ({
@@ -117,15 +220,69 @@ class ChromaDBManager {
         totalChunks: chunks.length
       }));
 
-      // Add documents - ChromaDB will generate embeddings automatically
-      await collection.add({
-        ids: ids,
-        documents: chunks,
-        metadatas: metadatas
-      });
+      // Stream embeddings batch by batch and write each batch as soon as it
+      // is encoded, instead of waiting for the whole document. upsert keeps
+      // a retry of the same ids from failing on duplicates. The API keeps its
+      // copy of the collection (lexical search) current as it encodes.
+      const index = { name: this.collectionName, ids: ids, metadatas: metadatas, documentId: metadata.documentId };
+      for await (const batch of this.embeddingFunction.streamBatches(chunks, 32, index)) {
+        await collection.upsert({
+          ids: ids.slice(batch.start, batch.end),
+          documents: chunks.slice(batch.start, batch.end),
+          metadatas: metadatas.slice(batch.start, batch.end),
+          embeddings: batch.embeddings
+        });
+        written += batch.end - batch.start;
+      }
 
       console.log(`Successfully added ${chunks.length} chunks to ChromaDB`);
       return true;
+    } catch (error) {
+      console.error('Error adding documents to ChromaDB:', error);
+      // Don't leave the document partly indexed: remove the chunks already written
+      await this.deleteFromIndex({ ids: ids });
+      if (collection && written > 0) {
+        try {
+          await collection.delete({ ids: ids });
+        } catch (cleanupError) {
+          console.error('Error removing partly added document from ChromaDB:', cleanupError);
+        }
+      }
+      throw error;
+    }
+  }
+
+  /**
+   * Add documents through the Flask API, which encodes the chunks and writes
+   * them into the collection with the same ids and metadata as addDocuments.
+   * One request, and the vectors never pass through Node.
+   * @param {Array<string>} chunks - Text chunks
+   * @param {Object} metadata - Document metadata
+   * @returns {Promise<boolean>} Success status
+   */
+  async addDocumentsDirect(chunks, metadata) {
+    try {
+      const response = await fetch(`${this.flaskApiUrl}/chroma/add`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          chunks: chunks,
+          documentId: metadata.documentId,
+          fileName: metadata.fileName,
+          uploadedAt: metadata.uploadedAt,
+          collection: this.collectionName,
+        }),
+      });
+
+      const data = await response.json();
+      if (!response.ok) {
+        throw new Error(`Embedding API error: ${data.error || response.statusText}`);
+      }
+
+      console.log(`Successfully added ${data.num_chunks} chunks to ChromaDB (written by the embedding API)`);
+      return true;
     } catch (error) {
       console.error('Error adding documents to ChromaDB:', error);
       throw error;
@@ -161,12 +318,64 @@ class ChromaDBManager {
     }
   }
 
+  /**
+   * Search the Flask API's copy of the collection (kept by every add)
+   * by keywords (BM25) or by keywords and meaning fused ("hybrid").
+   * Needs no ChromaDB, so it also serves as the search fallback.
+   * @param {string} queryText - Query text to search for
+   * @param {number} nResults - Number of results to return
+   * @param {string} mode - "lexical" or "hybrid"
+   * @param {Object} where - Optional filter object (e.g., { documentId: "123" })
+   * @returns {Promise<Array>} [{id, document, metadata, score}, ...]
+   */
+  async lexicalSearch(queryText, nResults = 5, mode = 'hybrid', where = null) {
+    const response = await fetch(`${this.flaskApiUrl}/index/${this.collectionName}/query`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        query: queryText,
+        top_k: nResults,
+        search: mode,
+        ...(where ? { where } : {}),
+      }),
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(`Embedding API error: ${data.error || response.statusText}`);
+    }
+    return data.results[0];
+  }
+
+  /**
+   * Best effort: drop chunks from the Flask API's copy of the collection
+   * used for lexical search
+   * @param {Object} selector - {ids: [...]} or {where: {...}}
+   */
+  async deleteFromIndex(selector) {
+    try {
+      await fetch(`${this.flaskApiUrl}/index/${this.collectionName}/delete`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify(selector),
+      });
+    } catch (error) {
+      console.warn('Could not delete document from the embedding API index:', error.message);
+    }
+  }
+
   /**
    * Delete document embeddings
    * @param {string} documentId - Document ID to delete
    * @returns {Promise<boolean>} Success status
    */
   async deleteDocument(documentId) {
+    await this.deleteFromIndex({ where: { documentId: documentId } });
+
     try {
       const collection = await this.getCollection();
       